@@ -0,0 +1,9 @@
+# backend/bench
+# Benchmark/teste de carga offline: sobe o backend.main:app no próprio processo
+# (ASGI, sem rede) com um LLM falso e determinístico no lugar da OpenAI e um
+# PostgREST em memória no lugar do Supabase, roda cenários com concorrência
+# fixa e grava p50/p95/p99, vazão e pico de RSS em JSON.
+#
+#   python -m backend.bench run --out antes.json
+#   python -m backend.bench run --out depois.json
+#   python -m backend.bench compare antes.json depois.json
@@ -0,0 +1,267 @@
+# backend/bench/__main__.py
+# Uso (a partir da raiz do repositório):
+#   python -m backend.bench run [--scenarios analyze_burst,project_listing,status_polling] [--out arquivo.json]
+#   python -m backend.bench run --scenarios analyze_batch --requests 5 --batch-size 20 (fora do padrão)
+#   python -m backend.bench compare base.json novo.json [--threshold 0.10]
+#   python -m backend.bench startup [--budget 1.5]
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+_DEFAULT_OUT_DIR = Path(__file__).resolve().parent.parent / "data" / "bench"
+_ALL_SCENARIOS = "analyze_burst,project_listing,status_polling"
+_REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+# Só podem ser importados no primeiro uso de uma tarefa de IA, nunca no startup da API
+_LAZY_MODULES = ("crewai", "langchain_openai", "langchain_core", "litellm", "openai", "tiktoken", "supabase")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _prepare_environment(args):
+    """Precisa rodar antes de importar o app: vários serviços leem o ambiente no import."""
+    # Nunca fala com a OpenAI ou o Supabase reais, mesmo que o .env tenha as chaves
+    os.environ["OPENAI_API_KEY"] = "bench-fake-key"
+    os.environ["SUPABASE_URL"] = "http://supabase.bench"
+    os.environ["SUPABASE_SERVICE_KEY"] = "bench-fake-key"
+    # Fanout: as chamadas por nicho rodam em paralelo no gateway (o modo crew também passa por ele, em série)
+    os.environ["NICHE_ANALYSIS_MODE"] = "fanout"
+    os.environ["NICHE_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-niche-cache-")
+    # Rate limit do gateway desligado por padrão, para medir o app e não o limitador
+    os.environ.setdefault("LLM_RPM_LIMIT", "0")
+    os.environ.setdefault("LLM_TPM_LIMIT", "0")
+    os.environ.setdefault("TASK_EXECUTOR_KIND", "thread")
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+async def _run(args) -> Dict[str, Any]:
+    import httpx
+    from backend.bench.fake_llm import FakeLLM
+    from backend.bench.fake_supabase import InMemoryPostgrest
+    from backend.bench.runner import BenchContext, RssSampler
+    from backend.bench.scenarios import SCENARIOS
+    from backend.lib.repository import supabase_repository
+    from backend.services import llm_gateway
+    from backend.main import app
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(unknown)}. Available: {', '.join(SCENARIOS)}")
+
+    llm = FakeLLM(first_token_latency=args.llm_latency, tokens_per_second=args.llm_tokens_per_second,
+                  response_tokens=args.llm_response_tokens, error_rate=args.llm_error_rate, seed=args.seed)
+    db = InMemoryPostgrest(latency=args.db_latency)
+    llm_gateway.set_http_transports(*llm.transports())
+    supabase_repository.transport = db.transport()
+
+    results: Dict[str, Any] = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            context = BenchContext(client=client, db=db, llm=llm, requests=args.requests,
+                                   concurrency=args.concurrency, seed=args.seed, options={
+                                       "duplicate_ratio": args.duplicate_ratio,
+                                       "task_timeout": args.task_timeout,
+                                       "tenants": args.tenants,
+                                       "users": args.users,
+                                       "projects_per_user": args.projects_per_user,
+                                       "page_size": args.page_size,
+                                       "tasks": args.tasks,
+                                       "batch_size": args.batch_size,
+                                   })
+            for name in names:
+                logging.warning(f"Running scenario {name} ({args.requests} requests, concurrency {args.concurrency})...")
+                with RssSampler() as rss:
+                    metrics = await SCENARIOS[name](context)
+                results[name] = {**metrics, "memory": rss.stats()}
+    return results
+
+
+def _command_run(args) -> int:
+    _prepare_environment(args)
+    started = time.time()
+    scenarios = asyncio.run(_run(args))
+    commit = _git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(started)),
+            "duration_seconds": round(time.time() - started, 2),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("func", "out", "log_level")},
+            "env": {key: os.environ[key] for key in sorted(os.environ)
+                    if key.startswith(("TASK_", "LLM_", "NICHE_", "DB_", "CREWAI_LLM_", "PROJECT_LIST_"))
+                    and key != "NICHE_CACHE_DIR"},
+        },
+        "scenarios": scenarios,
+    }
+    out = Path(args.out) if args.out else _DEFAULT_OUT_DIR / f"bench-{commit or 'nogit'}-{int(started)}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    for name, metrics in scenarios.items():
+        for section, summary in metrics.items():
+            if isinstance(summary, dict) and "latency_ms" in summary:
+                lat = summary["latency_ms"]
+                print(f"{name}.{section}: n={summary['count']} p50={lat['p50']}ms p95={lat['p95']}ms "
+                      f"p99={lat['p99']}ms {summary['throughput_rps']} req/s codes={summary['status_codes']}")
+        print(f"{name}.memory: peak RSS {metrics['memory']['peak_rss_mb']} MB")
+    print(f"Results written to {out}")
+    return 0
+
+
+# --- Comparação entre execuções ---
+# (caminho da métrica, True se maior é pior)
+def _comparable_metrics(scenario: Dict[str, Any]) -> List[tuple]:
+    metrics = []
+    for section, summary in scenario.items():
+        if isinstance(summary, dict) and "latency_ms" in summary:
+            metrics += [((section, "latency_ms", p), True) for p in ("p50", "p95", "p99")]
+            metrics.append(((section, "throughput_rps"), False))
+    metrics.append((("memory", "peak_rss_mb"), True))
+    return metrics
+
+def _lookup(data: Dict[str, Any], path: tuple) -> Optional[float]:
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data if isinstance(data, (int, float)) else None
+
+
+def _command_compare(args) -> int:
+    base = json.loads(Path(args.base).read_text())
+    new = json.loads(Path(args.new).read_text())
+    print(f"base: {base['meta'].get('commit')}  new: {new['meta'].get('commit')}  threshold: {args.threshold:.0%}")
+    regressions = 0
+    for name, scenario in new["scenarios"].items():
+        if name not in base["scenarios"]:
+            continue
+        for path, higher_is_worse in _comparable_metrics(scenario):
+            old_value, new_value = _lookup(base["scenarios"][name], path), _lookup(scenario, path)
+            if old_value is None or new_value is None or old_value == 0:
+                continue
+            change = (new_value - old_value) / old_value
+            regressed = (change if higher_is_worse else -change) > args.threshold
+            regressions += regressed
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{name}.{'.'.join(path)}: {old_value} -> {new_value} ({change:+.1%}){flag}")
+    return 1 if regressions else 0
+
+
+# --- Orçamento de startup ---
+_IMPORT_PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import backend.main
+print(json.dumps({"seconds": time.perf_counter() - started, "modules": sorted(sys.modules)}))
+"""
+
+def _measure_startup() -> Dict[str, Any]:
+    """Importa backend.main num interpretador novo (com -X importtime) e mede o tempo."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", _IMPORT_PROBE], cwd=_REPO_ROOT,
+                               capture_output=True, text=True, timeout=300)
+    if completed.returncode != 0:
+        raise SystemExit(f"Importing backend.main failed:\n{completed.stderr[-2000:]}")
+    probe = json.loads(completed.stdout.strip().splitlines()[-1])
+    # Linhas do -X importtime: "import time: self [us] | cumulative | pacote"; soma o self por pacote raiz
+    by_package: Dict[str, int] = {}
+    for line in completed.stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        self_us = int(parts[0].split(":")[1])
+        package = parts[2].strip().split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    slowest = sorted(((us, package) for package, us in by_package.items()), reverse=True)
+    lazy_loaded = sorted({m.split(".")[0] for m in probe["modules"]} & set(_LAZY_MODULES))
+    return {"seconds": probe["seconds"], "slowest_packages": slowest[:10], "lazy_modules_loaded": lazy_loaded}
+
+
+def _command_startup(args) -> int:
+    if args.budget is None:
+        from backend.lib.settings import settings # Aqui, e não no topo: o benchmark configura o ambiente antes
+        args.budget = settings.startup_import_budget_seconds
+    runs = [_measure_startup() for _ in range(args.repeat + 1)][1:] # A 1ª rodada compila bytecode: descartada
+    seconds = statistics.median(run["seconds"] for run in runs)
+    last = runs[-1]
+    print(f"import backend.main: median {seconds:.3f}s over {args.repeat} run(s) (budget {args.budget:.3f}s)")
+    for self_us, package in last["slowest_packages"]:
+        print(f"  {self_us / 1e6:7.3f}s  {package}")
+    failures = []
+    if seconds > args.budget:
+        failures.append(f"startup import took {seconds:.3f}s, over the {args.budget:.3f}s budget")
+    if last["lazy_modules_loaded"]:
+        failures.append(f"modules that must load lazily were imported at startup: {', '.join(last['lazy_modules_loaded'])}")
+    if args.out:
+        Path(args.out).write_text(json.dumps({"commit": _git_commit(), "median_seconds": round(seconds, 4),
+                                              "budget_seconds": args.budget, **last}, indent=2))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.bench",
+                                     description="Benchmark offline do backend (LLM e Supabase falsos).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Executa os cenários e grava o resultado em JSON.")
+    run.add_argument("--scenarios", default=_ALL_SCENARIOS)
+    run.add_argument("--requests", type=int, default=200, help="Requisições por cenário.")
+    run.add_argument("--concurrency", type=int, default=20, help="Requisições simultâneas (fixo).")
+    run.add_argument("--seed", type=int, default=42)
+    run.add_argument("--llm-latency", type=float, default=0.2, help="Segundos até o primeiro token.")
+    run.add_argument("--llm-tokens-per-second", type=float, default=200.0)
+    run.add_argument("--llm-response-tokens", type=int, default=150)
+    run.add_argument("--llm-error-rate", type=float, default=0.0, help="Fração de chamadas respondidas com 429.")
+    run.add_argument("--db-latency", type=float, default=0.002, help="Ida e volta simulada ao Supabase (s).")
+    run.add_argument("--duplicate-ratio", type=float, default=0.0, help="analyze_burst: fração de pedidos repetidos.")
+    run.add_argument("--task-timeout", type=float, default=300.0, help="analyze_burst: espera máxima pelas tarefas.")
+    run.add_argument("--tenants", type=int, default=1,
+                     help="analyze_burst: usuários que dividem a rajada (1 = um único usuário, sujeito às cotas).")
+    run.add_argument("--users", type=int, default=20, help="project_listing: usuários.")
+    run.add_argument("--projects-per-user", type=int, default=200, help="project_listing: projetos por usuário.")
+    run.add_argument("--page-size", type=int, default=20, help="project_listing: itens por página.")
+    run.add_argument("--tasks", type=int, default=200, help="status_polling: tarefas consultadas.")
+    run.add_argument("--batch-size", type=int, default=20, help="analyze_batch: projetos por lote.")
+    run.add_argument("--out", help=f"Arquivo de saída (padrão: {_DEFAULT_OUT_DIR}/bench-<commit>-<ts>.json).")
+    run.add_argument("--log-level", default="WARNING")
+    run.set_defaults(func=_command_run)
+
+    compare = commands.add_parser("compare", help="Compara dois resultados; sai com 1 se houver regressão.")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.10, help="Piora relativa tolerada (0.10 = 10%%).")
+    compare.set_defaults(func=_command_compare)
+
+    startup = commands.add_parser("startup", help="Verifica o tempo de import do backend.main; sai com 1 se estourar.")
+    startup.add_argument("--budget", type=float, default=None,
+                         help="Tempo máximo (s) para importar backend.main (padrão: STARTUP_IMPORT_BUDGET_SECONDS).")
+    startup.add_argument("--repeat", type=int, default=3)
+    startup.add_argument("--out", help="Grava o resultado em JSON.")
+    startup.set_defaults(func=_command_startup)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
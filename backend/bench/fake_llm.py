@@ -0,0 +1,187 @@
+# backend/bench/fake_llm.py
+# LLM falso e determinístico que fala o protocolo de chat completions da OpenAI,
+# servido como transporte httpx para o llm_gateway (sem rede, sem API key real).
+# A mesma entrada sempre gera a mesma resposta; a latência segue um modelo
+# simples: tempo até o primeiro token + tokens gerados / tokens por segundo.
+import re
+import ast
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+_TEMAS = ["Finanças pessoais", "Marketing digital", "Produtividade", "Culinária saudável", "Fotografia",
+          "Programação", "Inglês", "Jardinagem", "Maternidade", "Yoga", "Carreira", "Design gráfico"]
+_PUBLICOS = ["iniciantes", "autônomos", "mães empreendedoras", "estudantes", "profissionais 40+",
+             "pequenos negócios", "criadores de conteúdo", "aposentados"]
+_ENTRADAS_RE = re.compile(r"paixões (\[.*?\]) e habilidades (\[.*?\])")
+_FAIXA_RE = re.compile(r"liste de (\d+) a (\d+) nichos")
+_FILLER = ("o público busca resultados rápidos com baixo investimento e aprende melhor com "
+           "exemplos práticos passo a passo em formato de curso curto").split()
+
+
+class FakeLLM:
+    """
+    Gera respostas conforme o tipo de prompt do app: lista de nichos (enumeração
+    do modo fanout), objeto JSON de pesquisa de um nicho, ou texto livre.
+    """
+
+    def __init__(self, first_token_latency: float = 0.2, tokens_per_second: float = 200.0,
+                 response_tokens: int = 150, error_rate: float = 0.0, seed: int = 42):
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.seed = seed
+        self._errors_rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    # --- Conteúdo ---
+    def _rng(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _filler(self, rng: random.Random, tokens: int) -> str:
+        return " ".join(rng.choice(_FILLER) for _ in range(max(1, int(tokens * 0.75)))) # ~0,75 palavra/token
+
+    def respond(self, prompt: str) -> str:
+        rng = self._rng(prompt)
+        if "array JSON" in prompt:
+            # Cada nicho atribuído a uma paixão e uma habilidade citadas no prompt
+            entradas = _ENTRADAS_RE.search(prompt)
+            passions, skills = (ast.literal_eval(group) for group in entradas.groups()) if entradas else ([], [])
+            faixa = _FAIXA_RE.search(prompt)
+            low, high = (int(v) for v in faixa.groups()) if faixa else (5, 7)
+            names = sorted({f"{rng.choice(_TEMAS)} para {rng.choice(_PUBLICOS)}" for _ in range(rng.randint(low, high))})
+            niches = [{
+                "nicho": name,
+                "paixoes": [rng.choice(passions)] if passions else [],
+                "habilidades": [rng.choice(skills)] if skills else [],
+            } for name in names]
+            if '"score"' in prompt: # Validação da Crew: a lista volta pontuada
+                for niche in niches:
+                    niche.update(score=rng.randint(20, 95), justificativa=self._filler(rng, 12))
+            return json.dumps(niches, ensure_ascii=False)
+        if "objeto JSON" in prompt:
+            niche = prompt.split('"')[1] if prompt.count('"') >= 2 else "Nicho"
+            return json.dumps({
+                "nicho": niche,
+                "tendencia": rng.choice(["crescendo", "estável", "diminuindo"]),
+                "publico": rng.choice(_PUBLICOS),
+                "problemas": [self._filler(rng, 8) for _ in range(3)],
+                "concorrentes": [f"Concorrente {rng.randint(1, 99)}"],
+                "score": rng.randint(20, 95),
+                "justificativa": self._filler(rng, self.response_tokens // 3),
+            }, ensure_ascii=False)
+        return self._filler(rng, self.response_tokens)
+
+    # --- Protocolo ---
+    def _prepare(self, request: httpx.Request) -> Tuple[Dict[str, Any], str, int, int]:
+        body = json.loads(request.content)
+        prompt = "\n".join(str(m.get("content") or "") for m in body.get("messages", []))
+        text = self.respond(prompt)
+        prompt_tokens, completion_tokens = len(prompt) // 4 + 1, len(text) // 4 + 1
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+        return body, text, prompt_tokens, completion_tokens
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            failed = self.error_rate > 0 and self._errors_rng.random() < self.error_rate
+            self.errors += failed
+        return failed
+
+    def _timing(self, completion_tokens: int, chunks: int) -> Tuple[float, float]:
+        generation = completion_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        return self.first_token_latency, generation / max(1, chunks)
+
+    @staticmethod
+    def _completion(body: Dict[str, Any], text: str, prompt_tokens: int, completion_tokens: int) -> Dict[str, Any]:
+        return {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    @staticmethod
+    def _stream_events(body: Dict[str, Any], text: str, prompt_tokens: int, completion_tokens: int) -> List[bytes]:
+        def event(choices, **extra):
+            payload = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": body.get("model", "fake"), "choices": choices, **extra}
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        words = text.split(" ")
+        events = [event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])]
+        events += [event([{"index": 0, "delta": {"content": word + (" " if i < len(words) - 1 else "")},
+                           "finish_reason": None}]) for i, word in enumerate(words)]
+        events.append(event([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            events.append(event([], usage={"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                           "total_tokens": prompt_tokens + completion_tokens}))
+        events.append(b"data: [DONE]\n\n")
+        return events
+
+    @staticmethod
+    def _rate_limited() -> httpx.Response:
+        return httpx.Response(429, headers={"retry-after": "0"},
+                              json={"error": {"message": "Rate limit reached (fake)", "type": "rate_limit"}})
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if self._should_fail():
+            return self._rate_limited()
+        body, text, prompt_tokens, completion_tokens = self._prepare(request)
+        if not body.get("stream"):
+            first, rest = self._timing(completion_tokens, 1)
+            time.sleep(first + rest)
+            return httpx.Response(200, json=self._completion(body, text, prompt_tokens, completion_tokens))
+        events = self._stream_events(body, text, prompt_tokens, completion_tokens)
+        first, per_chunk = self._timing(completion_tokens, len(events))
+
+        def stream():
+            time.sleep(first)
+            for chunk in events:
+                time.sleep(per_chunk)
+                yield chunk
+
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=stream())
+
+    async def ahandle(self, request: httpx.Request) -> httpx.Response:
+        if self._should_fail():
+            return self._rate_limited()
+        body, text, prompt_tokens, completion_tokens = self._prepare(request)
+        if not body.get("stream"):
+            first, rest = self._timing(completion_tokens, 1)
+            await asyncio.sleep(first + rest)
+            return httpx.Response(200, json=self._completion(body, text, prompt_tokens, completion_tokens))
+        events = self._stream_events(body, text, prompt_tokens, completion_tokens)
+        first, per_chunk = self._timing(completion_tokens, len(events))
+
+        async def stream():
+            await asyncio.sleep(first)
+            for chunk in events:
+                await asyncio.sleep(per_chunk)
+                yield chunk
+
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=stream())
+
+    def transports(self) -> Tuple[httpx.MockTransport, httpx.MockTransport]:
+        """(síncrono, assíncrono), no formato de llm_gateway.set_http_transports()."""
+        return httpx.MockTransport(self.handle), httpx.MockTransport(self.ahandle)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"calls": self.calls, "injected_errors": self.errors,
+                    "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens}
@@ -0,0 +1,203 @@
+# backend/bench/fake_supabase.py
+# PostgREST em memória com o subconjunto que o backend/lib/repository.py usa:
+# filtros eq/lt/in/is.null, `or`/`and` aninhados (keyset de projetos, varredura
+# de leases), order, limit, select, POST com on_conflict (ignore-duplicates /
+# merge-duplicates), PATCH com return=representation e a função
+# claim_async_tasks da fila (services/task_queue.py). Servido como transporte
+# httpx assíncrono, com latência de ida e volta configurável.
+import json
+import uuid
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import httpx
+
+Row = Dict[str, Any]
+
+_RESERVED_PARAMS = {"select", "order", "limit", "on_conflict", "or"}
+# Valores `default` das colunas (ver a DDL em services/task_recovery.py)
+_COLUMN_DEFAULTS = {"async_tasks": {"attempts": 0}}
+
+
+def _unquote(value: str) -> str:
+    return json.loads(value) if value.startswith('"') else value # Mesmo escape de repository._quote
+
+
+def _split_terms(text: str) -> List[str]:
+    # Separa "a.eq.1,and(b.lt.2,c.is.null)" nas vírgulas de primeiro nível (fora de aspas/parênteses)
+    terms, depth, quoted, start, i = [], 0, False, 0, 0
+    while i < len(text):
+        char = text[i]
+        if quoted:
+            if char == "\\":
+                i += 1
+            elif char == '"':
+                quoted = False
+        elif char == '"':
+            quoted = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            terms.append(text[start:i])
+            start = i + 1
+        i += 1
+    terms.append(text[start:])
+    return terms
+
+
+def _condition(row: Row, column: str, condition: str) -> bool:
+    op, _, value = condition.partition(".")
+    current = row.get(column)
+    if op == "is":
+        if value != "null":
+            raise ValueError(f"Unsupported filter operator: {condition}")
+        return current is None
+    if op == "in":
+        return str(current) in value.strip("()").split(",")
+    if op not in ("eq", "lt"):
+        raise ValueError(f"Unsupported filter operator: {condition}")
+    if current is None:
+        return False
+    value = _unquote(value)
+    return str(current) == value if op == "eq" else str(current) < value
+
+
+def _logic(row: Row, expression: str, combine=any) -> bool:
+    # "(termo,termo,...)" de um filtro or=/and(...), cada termo "coluna.op.valor" ou um and(...)/or(...) aninhado
+    results = []
+    for term in _split_terms(expression[1:-1]):
+        if term.startswith(("and(", "or(")):
+            name, _, inner = term.partition("(")
+            results.append(_logic(row, "(" + inner, all if name == "and" else any))
+        else:
+            column, _, condition = term.partition(".")
+            results.append(_condition(row, column, condition))
+    return combine(results)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class InMemoryPostgrest:
+    """Tabelas em memória (dict por `id`), no lugar de `async_tasks` e `projects`."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, Dict[str, Row]] = {}
+        self.requests = 0
+
+    # --- Dados de teste ---
+    def seed_projects(self, user_id: str, count: int) -> List[Row]:
+        table = self.tables.setdefault("projects", {})
+        start = datetime.now(timezone.utc) - timedelta(days=30)
+        rows = []
+        for i in range(count):
+            created = (start + timedelta(minutes=i)).isoformat()
+            row = {"id": str(uuid.uuid4()), "user_id": user_id, "nome_projeto": f"Projeto {i + 1}",
+                   "estado_progresso": {"nicho_persona": None}, "created_at": created, "updated_at": created}
+            table[row["id"]] = row
+            rows.append(row)
+        return rows
+
+    def seed_tasks(self, rows: List[Row]):
+        table = self.tables.setdefault("async_tasks", {})
+        for row in rows:
+            table[row["id"]] = {"created_at": _now_iso(), "updated_at": _now_iso(), **row}
+
+    # --- Consulta ---
+    @staticmethod
+    def _matches(row: Row, params: Dict[str, str]) -> bool:
+        for column, condition in params.items():
+            if column not in _RESERVED_PARAMS and not _condition(row, column, condition):
+                return False
+        return "or" not in params or _logic(row, params["or"])
+
+    @staticmethod
+    def _select(rows: List[Row], params: Dict[str, str]) -> List[Row]:
+        for part in reversed(params.get("order", "").split(",") if params.get("order") else []):
+            column, _, direction = part.partition(".")
+            rows.sort(key=lambda r: str(r.get(column)), reverse=direction == "desc")
+        if "limit" in params:
+            rows = rows[:int(params["limit"])]
+        columns = params.get("select", "*")
+        if columns != "*":
+            rows = [{c: r.get(c) for c in columns.split(",")} for r in rows]
+        return rows
+
+    # --- Funções (rpc) ---
+    def rpc_claim_async_tasks(self, worker: str, max_tasks: int, lease_seconds: float) -> List[Row]:
+        # Mesmo efeito do `update ... for update skip locked` (aqui tudo roda no event loop, sem concorrência)
+        queued = [row for row in self.tables.setdefault("async_tasks", {}).values()
+                  if row.get("status") == "PENDING" and row.get("queued_at") and row.get("lease_owner") is None]
+        queued.sort(key=lambda row: (row.get("queue_priority") == "batch", row["queued_at"]))
+        now = datetime.now(timezone.utc)
+        for row in queued[:max_tasks]:
+            row.update(lease_owner=worker, heartbeat_at=now.isoformat(),
+                       lease_expires_at=(now + timedelta(seconds=lease_seconds)).isoformat())
+        return [dict(row) for row in queued[:max_tasks]]
+
+    # --- Transporte ---
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = dict(request.url.params)
+        if "/rpc/" in request.url.path:
+            function = getattr(self, "rpc_" + request.url.path.rsplit("/", 1)[-1], None)
+            if function is None:
+                return httpx.Response(404, json={"message": f"Function {request.url.path} not found"})
+            return httpx.Response(200, json=self._select(function(**json.loads(request.content)), params))
+        table_name = request.url.path.rsplit("/", 1)[-1]
+        table = self.tables.setdefault(table_name, {})
+        prefer = request.headers.get("prefer", "")
+        try:
+            if request.method == "GET":
+                rows = [dict(r) for r in table.values() if self._matches(r, params)]
+                return httpx.Response(200, json=self._select(rows, params))
+            if request.method == "POST":
+                body = json.loads(request.content)
+                written = []
+                for row in body if isinstance(body, list) else [body]:
+                    row = dict(row)
+                    row.setdefault("id", str(uuid.uuid4()))
+                    existing = table.get(row["id"])
+                    if existing is not None and "merge-duplicates" not in prefer:
+                        if "ignore-duplicates" in prefer:
+                            continue
+                        return httpx.Response(409, json={"message": "duplicate key value violates unique constraint"})
+                    merged = existing or {"created_at": _now_iso(), **_COLUMN_DEFAULTS.get(table_name, {})}
+                    merged.update(row)
+                    merged["updated_at"] = row.get("updated_at") or _now_iso()
+                    table[row["id"]] = merged
+                    written.append(dict(merged))
+                if "return=representation" in prefer:
+                    return httpx.Response(201, json=written)
+                return httpx.Response(201)
+            if request.method == "PATCH":
+                body = json.loads(request.content)
+                written = []
+                for row in table.values():
+                    if self._matches(row, params):
+                        row.update(body)
+                        row["updated_at"] = body.get("updated_at") or _now_iso()
+                        written.append(dict(row))
+                if "return=representation" in prefer:
+                    return httpx.Response(200, json=self._select(written, params))
+                return httpx.Response(204)
+        except ValueError as e:
+            return httpx.Response(400, json={"message": str(e)})
+        return httpx.Response(405, json={"message": f"Method {request.method} not supported"})
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, **{f"{name}_rows": len(rows) for name, rows in self.tables.items()}}
+
+
+def make_user_id(index: int) -> str:
+    return str(uuid.UUID(int=index + 1))
@@ -0,0 +1,122 @@
+# backend/bench/runner.py
+# Infra comum dos cenários: disparo com concorrência fixa, percentis de
+# latência, vazão e pico de RSS do processo durante o cenário.
+import os
+import math
+import time
+import asyncio
+import resource
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from backend.bench.fake_llm import FakeLLM
+from backend.bench.fake_supabase import InMemoryPostgrest
+
+
+@dataclass
+class BenchContext:
+    client: httpx.AsyncClient # Fala com backend.main:app via ASGI, no mesmo processo
+    db: InMemoryPostgrest
+    llm: FakeLLM
+    requests: int = 200
+    concurrency: int = 20
+    seed: int = 42
+    options: Dict[str, Any] = field(default_factory=dict)
+
+
+# --- Memória ---
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        # Sem /proc (ex.: macOS): só o pico do processo inteiro está disponível (bytes no macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class RssSampler:
+    """Amostra o RSS numa thread enquanto o cenário roda; `peak` é o maior valor visto."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.start_bytes = 0
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+
+    def __enter__(self):
+        self.start_bytes = self.peak_bytes = current_rss_bytes()
+        self._thread = threading.Thread(target=self._sample, name="bench-rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+
+    def stats(self) -> Dict[str, float]:
+        return {"start_rss_mb": round(self.start_bytes / 2**20, 1), "peak_rss_mb": round(self.peak_bytes / 2**20, 1)}
+
+
+# --- Latência ---
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank sobre `values` já ordenado."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(p * len(values)) - 1))]
+
+def summarize(latencies: List[float], statuses: List[int], elapsed: float) -> Dict[str, Any]:
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    codes: Dict[str, int] = {}
+    for code in statuses:
+        codes[str(code)] = codes.get(str(code), 0) + 1
+    return {
+        "count": len(values),
+        "status_codes": codes,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed > 0 else None,
+        "latency_ms": {
+            "mean": ms(sum(values) / len(values)) if values else None,
+            "p50": ms(percentile(values, 0.50)),
+            "p95": ms(percentile(values, 0.95)),
+            "p99": ms(percentile(values, 0.99)),
+            "max": ms(values[-1]) if values else None,
+        },
+    }
+
+
+async def drive(total: int, concurrency: int,
+                operation: Callable[[int], Awaitable[int]]) -> Tuple[List[float], List[int], float]:
+    """
+    Executa `operation(i)` para i em [0, total) com no máximo `concurrency`
+    em paralelo (workers fixos, sem rampa). `operation` devolve o status HTTP.
+    Retorna (latências em segundos, status, tempo total).
+    """
+    latencies: List[float] = []
+    statuses: List[int] = []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter: # O iterador é compartilhado: cada índice sai uma vez
+            started = time.perf_counter()
+            try:
+                code = await operation(i)
+            except Exception:
+                code = 0 # Erro de transporte/cliente, contado à parte dos status HTTP
+            latencies.append(time.perf_counter() - started)
+            statuses.append(code)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, total)))))
+    return latencies, statuses, time.perf_counter() - started
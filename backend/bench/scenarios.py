@@ -0,0 +1,233 @@
+# backend/bench/scenarios.py
+# Cenários do benchmark. Cada um recebe o BenchContext (app já no ar, com o
+# LLM e o Supabase falsos) e devolve um dict de métricas serializável.
+import time
+import uuid
+import random
+import asyncio
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from backend.bench.fake_supabase import make_user_id
+from backend.bench.runner import BenchContext, drive, summarize
+from backend.services.task_executor import add_event_listener, task_executor
+from backend.services.result_cache import niche_result_cache
+from backend.services.task_registry import task_registry, COMPLETED
+from backend.services.project_service import project_list_cache
+
+_PAIXOES = ["culinária", "viagens", "fotografia", "música", "esportes", "leitura", "games", "moda", "pets", "finanças"]
+_HABILIDADES = ["escrita", "edição de vídeo", "ensino", "vendas", "programação", "design", "oratória", "planilhas"]
+
+
+class _CompletionRecorder:
+    """Listener do task_executor que anota quando cada tarefa terminou."""
+
+    def __init__(self):
+        self.finished: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._changed = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+
+    def __call__(self, task_id: str, event: Dict[str, Any]):
+        if event["type"] not in ("completed", "failed", "cancelled"):
+            return
+        with self._lock:
+            self.finished.setdefault(task_id, (time.perf_counter(), event["type"]))
+        self._loop.call_soon_threadsafe(self._changed.set)
+
+    async def wait_for(self, task_ids: List[str], timeout: float) -> bool:
+        deadline = time.perf_counter() + timeout
+        while True:
+            with self._lock:
+                if all(task_id in self.finished for task_id in task_ids):
+                    return True
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), min(remaining, 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+
+async def analyze_burst(ctx: BenchContext) -> Dict[str, Any]:
+    """
+    Rajada de POST /analyze-niche. Mede a latência do aceite (202/429) e, para
+    as tarefas aceitas, o tempo ponta a ponta até COMPLETED/FAILED.
+    `duplicate_ratio` controla a fração de pedidos repetidos (cache/single-flight)
+    e `tenants` quantos usuários dividem a rajada (cotas e fila justa por usuário).
+    """
+    tenants = [make_user_id(i) for i in range(max(1, ctx.options.get("tenants", 1)))]
+    projects = {user_id: ctx.db.seed_projects(user_id, 1)[0]["id"] for user_id in tenants}
+    rng = random.Random(ctx.seed)
+    distinct = max(1, int(round(ctx.requests * (1 - ctx.options.get("duplicate_ratio", 0.0)))))
+    payloads = [{
+        "project_id": projects[tenants[i % len(tenants)]],
+        "user_id": tenants[i % len(tenants)],
+        "passions": rng.sample(_PAIXOES, 2),
+        "skills": rng.sample(_HABILIDADES, 2),
+        "initial_idea": f"Ideia de produto #{i}",
+    } for i in range(distinct)]
+
+    recorder = _CompletionRecorder()
+    add_event_listener(recorder)
+    submitted: Dict[str, float] = {}
+    immediate: List[float] = [] # Cache hits: já nascem concluídos
+
+    async def submit(i: int) -> int:
+        started = time.perf_counter()
+        response = await ctx.client.post("/api/v1/tasks/analyze-niche", json=payloads[i % distinct])
+        if response.status_code == 202:
+            body = response.json()
+            if body["status"] == COMPLETED:
+                immediate.append(time.perf_counter() - started)
+            else:
+                submitted[body["task_id"]] = started
+        return response.status_code
+
+    latencies, statuses, elapsed = await drive(ctx.requests, ctx.concurrency, submit)
+    drained = await recorder.wait_for(list(submitted), ctx.options.get("task_timeout", 300.0))
+    finished_at = time.perf_counter()
+
+    end_to_end = list(immediate)
+    outcomes = {"completed": len(immediate), "failed": 0, "cancelled": 0, "unfinished": 0}
+    for task_id, started in submitted.items():
+        done = recorder.finished.get(task_id)
+        if done is None:
+            outcomes["unfinished"] += 1
+            continue
+        end_to_end.append(done[0] - started)
+        outcomes[done[1]] += 1
+    total_elapsed = finished_at - min(submitted.values(), default=finished_at - elapsed)
+    return {
+        "submit": summarize(latencies, statuses, elapsed),
+        "end_to_end": summarize(end_to_end, [], total_elapsed),
+        "tasks": {**outcomes, "drained": drained, "distinct_inputs": distinct},
+        "executor": task_executor.stats(),
+        "result_cache": niche_result_cache.stats(),
+        "llm": ctx.llm.stats(),
+    }
+
+
+async def analyze_batch(ctx: BenchContext) -> Dict[str, Any]:
+    """
+    POST /analyze-niche/batch: `requests` lotes de `batch_size` projetos cada
+    (agência cadastrando clientes). Mede o aceite do lote, as idas ao banco
+    por lote e o tempo até todas as tarefas do lote finalizarem.
+    """
+    batch_size = ctx.options.get("batch_size", 20)
+    user_id = make_user_id(3000)
+    projects = ctx.db.seed_projects(user_id, batch_size)
+    rng = random.Random(ctx.seed)
+    distinct = max(1, int(round(batch_size * (1 - ctx.options.get("duplicate_ratio", 0.0)))))
+
+    recorder = _CompletionRecorder()
+    add_event_listener(recorder)
+    batches: Dict[str, tuple] = {} # batch_id -> (início, task_ids pendentes)
+    db_requests_before = ctx.db.requests
+
+    async def submit(i: int) -> int:
+        inputs = [{"passions": rng.sample(_PAIXOES, 2), "skills": rng.sample(_HABILIDADES, 2),
+                   "initial_idea": f"Lote {i}, cliente {j}"} for j in range(distinct)]
+        items = [{"project_id": project["id"], "user_id": user_id, **inputs[j % distinct]}
+                 for j, project in enumerate(projects)]
+        started = time.perf_counter()
+        response = await ctx.client.post("/api/v1/tasks/analyze-niche/batch", json={"items": items})
+        if response.status_code == 202:
+            body = response.json()
+            pending = [task["task_id"] for task in body["tasks"] if task["status"] != COMPLETED]
+            batches[body["batch_id"]] = (started, pending)
+        return response.status_code
+
+    latencies, statuses, elapsed = await drive(ctx.requests, ctx.concurrency, submit)
+    submit_db_requests = ctx.db.requests - db_requests_before
+    all_tasks = [task_id for _, pending in batches.values() for task_id in pending]
+    drained = await recorder.wait_for(all_tasks, ctx.options.get("task_timeout", 300.0))
+
+    end_to_end = []
+    for started, pending in batches.values():
+        done = [recorder.finished[task_id][0] for task_id in pending if task_id in recorder.finished]
+        if len(done) == len(pending):
+            end_to_end.append(max(done, default=started) - started)
+    return {
+        "submit": summarize(latencies, statuses, elapsed),
+        "batch_end_to_end": summarize(end_to_end, [], time.perf_counter() - min(
+            (started for started, _ in batches.values()), default=time.perf_counter())),
+        "tasks": {"batches": len(batches), "batch_size": batch_size, "distinct_inputs": distinct,
+                  "submitted": len(all_tasks), "drained": drained},
+        "db_requests_per_batch": round(submit_db_requests / max(1, len(batches)), 2),
+        "executor": task_executor.stats(),
+        "llm": ctx.llm.stats(),
+    }
+
+
+async def project_listing(ctx: BenchContext) -> Dict[str, Any]:
+    """
+    GET /projects paginado por cursor. Cada usuário percorre as próprias
+    páginas em sequência (voltando ao início ao chegar no fim).
+    """
+    users = ctx.options.get("users", 20)
+    per_user = ctx.options.get("projects_per_user", 200)
+    page_size = ctx.options.get("page_size", 20)
+    user_ids = [make_user_id(1000 + u) for u in range(users)]
+    for user_id in user_ids:
+        ctx.db.seed_projects(user_id, per_user)
+    cursors: Dict[str, Optional[str]] = {user_id: None for user_id in user_ids}
+    cache_before = project_list_cache.stats()
+
+    async def list_page(i: int) -> int:
+        user_id = user_ids[i % users]
+        params = {"limit": page_size}
+        if cursors[user_id]:
+            params["cursor"] = cursors[user_id]
+        response = await ctx.client.get("/api/v1/projects/", params=params, headers={"X-User-Id": user_id})
+        cursors[user_id] = response.headers.get("X-Next-Cursor") # None = volta para a primeira página
+        return response.status_code
+
+    latencies, statuses, elapsed = await drive(ctx.requests, ctx.concurrency, list_page)
+    cache_after = project_list_cache.stats()
+    return {
+        "list": summarize(latencies, statuses, elapsed),
+        "list_cache": {"hits": cache_after["hits"] - cache_before["hits"],
+                       "misses": cache_after["misses"] - cache_before["misses"]},
+        "dataset": {"users": users, "projects_per_user": per_user, "page_size": page_size},
+    }
+
+
+async def status_polling(ctx: BenchContext) -> Dict[str, Any]:
+    """
+    GET /tasks/{id}/status sobre tarefas concluídas: metade já está no
+    task_registry (memória) e metade só no banco (primeira leitura vai ao DB).
+    """
+    user_id = make_user_id(2000)
+    project_id = ctx.db.seed_projects(user_id, 1)[0]["id"]
+    count = ctx.options.get("tasks", 200)
+    rows = [{"id": str(uuid.UUID(int=10**6 + i)), "project_id": project_id, "user_id": user_id,
+             "task_type": "ANALYZE_NICHE", "status": COMPLETED, "result": {"analysis": f"Resultado {i}"}}
+            for i in range(count)]
+    ctx.db.seed_tasks(rows)
+    for row in rows[: count // 2]:
+        task_registry.register(row)
+    rng = random.Random(ctx.seed)
+    order = [rng.choice(rows)["id"] for _ in range(ctx.requests)]
+    db_requests_before = ctx.db.requests
+
+    async def poll(i: int) -> int:
+        response = await ctx.client.get(f"/api/v1/tasks/{order[i]}/status")
+        return response.status_code
+
+    latencies, statuses, elapsed = await drive(ctx.requests, ctx.concurrency, poll)
+    return {
+        "status": summarize(latencies, statuses, elapsed),
+        "db_requests": ctx.db.requests - db_requests_before,
+        "registry": task_registry.stats(),
+    }
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "analyze_burst": analyze_burst,
+    "analyze_batch": analyze_batch,
+    "project_listing": project_listing,
+    "status_polling": status_polling,
+}
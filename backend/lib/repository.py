@@ -0,0 +1,310 @@
+# backend/lib/repository.py
+import time
+import uuid
+import random
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import httpx
+import orjson
+
+from backend.lib import telemetry
+from backend.lib.settings import settings
+
+logger = logging.getLogger(__name__)
+
+Row = Dict[str, Any]
+
+# Status HTTP que valem uma nova tentativa (falhas transitórias do PostgREST/gateway)
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def _quote(value: str) -> str:
+    # Valores dentro de filtros `or=(...)` do PostgREST precisam de aspas se tiverem , . : ( )
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class RepositoryError(Exception):
+    """Erro ao falar com o Supabase (PostgREST) depois de esgotadas as tentativas."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SupabaseRepository:
+    """
+    Acesso assíncrono ao PostgREST do Supabase com um único httpx.AsyncClient
+    (pool de conexões compartilhado), timeout por requisição e retry com
+    backoff exponencial + jitter. Só são repetidas as leituras e as escritas
+    marcadas `idempotent` (uma escrita pode ter sido aplicada mesmo quando a
+    resposta se perde). As classes por tabela ficam abaixo.
+    """
+
+    def __init__(self, url: Optional[str] = None, service_key: Optional[str] = None, timeout: float = 10.0,
+                 max_connections: int = 20, max_retries: int = 3, backoff_base: float = 0.2,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.url = (url or "").rstrip("/")
+        self.service_key = service_key
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.transport = transport # Ex.: PostgREST em memória do benchmark (backend/bench)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def available(self) -> bool:
+        return self._client is not None
+
+    async def start(self):
+        if self._client is not None:
+            return
+        self.url = self.url or (settings.supabase_url or "").rstrip("/")
+        self.service_key = self.service_key or settings.supabase_service_key
+        if not (self.url and self.service_key):
+            logger.error("CRITICAL: SUPABASE_URL or SUPABASE_SERVICE_KEY not set. Backend DB functionality will fail.")
+            return
+        self._client = httpx.AsyncClient(
+            base_url=f"{self.url}/rest/v1",
+            headers={
+                "apikey": self.service_key,
+                "Authorization": f"Bearer {self.service_key}",
+                "Content-Type": "application/json",
+            },
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections),
+            transport=self.transport,
+        )
+        logger.info(f"Supabase repository started (pool size {self.max_connections}).")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, method: str, table: str, params: Optional[Dict[str, Any]] = None,
+                      json: Any = None, prefer: Optional[str] = None, idempotent: bool = False) -> List[Row]:
+        if self._client is None:
+            raise RepositoryError("Supabase repository is not available.")
+        started = time.perf_counter()
+        outcome = "error"
+        with telemetry.span("db.request", **{"db.system": "postgresql", "db.operation": method,
+                                             "db.sql.table": table}) as span:
+            try:
+                retry = idempotent or method in ("GET", "HEAD")
+                rows = await self._request(method, table, params, json, prefer, retry)
+                outcome = "ok"
+                telemetry.set_attributes(span, **{"db.rows": len(rows)})
+                return rows
+            finally:
+                telemetry.DB_REQUEST_SECONDS.observe(time.perf_counter() - started, table=table, method=method,
+                                                     outcome=outcome)
+
+    async def _request(self, method: str, table: str, params: Optional[Dict[str, Any]],
+                       json: Any, prefer: Optional[str], retry: bool) -> List[Row]:
+        headers = {"Prefer": prefer} if prefer else None
+        # orjson: resultados das análises viajam no corpo; serializa uma vez, fora do laço de retry
+        content = orjson.dumps(json, option=orjson.OPT_NON_STR_KEYS) if json is not None else None
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.request(method, f"/{table}", params=params, content=content, headers=headers)
+                if response.status_code not in _RETRYABLE_STATUS:
+                    break
+                failure = f"HTTP {response.status_code}: {response.text[:200]}"
+            except httpx.TransportError as e:
+                response, failure = None, f"{type(e).__name__}: {e}"
+            attempt += 1
+            if attempt > (self.max_retries if retry else 0):
+                raise RepositoryError(f"{method} {table} failed after {attempt} attempt(s): {failure}",
+                                      response.status_code if response is not None else None)
+            delay = self.backoff_base * (2 ** (attempt - 1)) * (0.5 + random.random())
+            if response is not None and response.headers.get("Retry-After", "").isdigit():
+                delay = max(delay, float(response.headers["Retry-After"]))
+            logger.warning(f"{method} {table} failed ({failure}); retry {attempt}/{self.max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        if response.status_code >= 400:
+            raise RepositoryError(f"{method} {table} failed: HTTP {response.status_code}: {response.text[:500]}",
+                                  response.status_code)
+        if not response.content:
+            return []
+        data = orjson.loads(response.content)
+        return data if isinstance(data, list) else [data]
+
+
+class TaskRepository:
+    """Operações tipadas sobre a tabela `async_tasks`."""
+    table = "async_tasks"
+
+    def __init__(self, db: SupabaseRepository):
+        self.db = db
+
+    async def insert_task(self, task_id: str, project_id: str, user_id: str, task_type: str,
+                          status: str = "PENDING", result: Any = None) -> Row:
+        row = {"id": task_id, "project_id": project_id, "user_id": user_id,
+               "task_type": task_type, "status": status, "result": result}
+        rows = await self.insert_tasks([row])
+        return rows[0] if rows else row
+
+    async def insert_tasks(self, rows: Sequence[Row]) -> List[Row]:
+        """Insere várias tarefas numa única ida ao banco. Idempotente por `id` (seguro para retry)."""
+        if not rows:
+            return []
+        return await self.db.request(
+            "POST", self.table, params={"on_conflict": "id"}, json=list(rows),
+            prefer="return=representation,resolution=ignore-duplicates", idempotent=True,
+        )
+
+    async def upsert_tasks(self, rows: Sequence[Row]) -> None:
+        """Grava o estado completo de várias tarefas de uma vez (usado pelo write-behind)."""
+        if not rows:
+            return
+        await self.db.request(
+            "POST", self.table, params={"on_conflict": "id"}, json=list(rows),
+            prefer="return=minimal,resolution=merge-duplicates", idempotent=True,
+        )
+
+    async def update_task(self, task_id: str, **fields) -> None:
+        await self.db.request("PATCH", self.table, params={"id": f"eq.{task_id}"}, json=fields,
+                              prefer="return=minimal", idempotent=True)
+
+    async def get_task(self, task_id: str, columns: Iterable[str] = ("*",)) -> Optional[Row]:
+        rows = await self.db.request("GET", self.table, params={
+            "select": ",".join(columns), "id": f"eq.{task_id}", "limit": 1,
+        })
+        return rows[0] if rows else None
+
+    async def get_tasks(self, task_ids: Sequence[str], columns: Iterable[str] = ("*",)) -> List[Row]:
+        """Várias tarefas numa única consulta (ordem não garantida)."""
+        if not task_ids:
+            return []
+        return await self.db.request("GET", self.table, params={
+            "select": ",".join(columns), "id": f"in.({','.join(task_ids)})",
+        })
+
+    # --- Leases (ver services/task_recovery.py) ---
+    @staticmethod
+    def _orphan_filter(now: str, stale_before: str, exclude_queued: bool = False) -> str:
+        # Lease vencido, ou tarefa sem lease (anterior aos leases) parada há mais que um lease.
+        # No modo fila, sem lease e com queued_at é tarefa esperando um worker, não órfã.
+        legacy = "lease_expires_at.is.null,queued_at.is.null" if exclude_queued else "lease_expires_at.is.null"
+        return f"(lease_expires_at.lt.{_quote(now)},and({legacy},updated_at.lt.{_quote(stale_before)}))"
+
+    async def find_orphaned_tasks(self, now: str, stale_before: str, limit: int = 100,
+                                  columns: Iterable[str] = ("*",), exclude_queued: bool = False) -> List[Row]:
+        """Tarefas não finalizadas cujo dono parou de renovar o lease (`exclude_queued`: fora as da fila)."""
+        return await self.db.request("GET", self.table, params={
+            "select": ",".join(columns), "status": "in.(PENDING,PROCESSING)",
+            "or": self._orphan_filter(now, stale_before, exclude_queued), "order": "updated_at.asc", "limit": limit,
+        })
+
+    async def claim_task(self, task_id: str, expected_attempts: int, now: str, stale_before: str,
+                         columns: Iterable[str] = ("*",), exclude_queued: bool = False, **fields) -> Optional[Row]:
+        """
+        Assume uma tarefa órfã (compare-and-set): só atualiza se o lease ainda
+        estiver vencido e `attempts` ainda for `expected_attempts`. None se outro
+        processo chegou antes. Sem retry: repetido depois de aplicado, o CAS
+        falharia e a tarefa ficaria com este processo sem rodar.
+        """
+        rows = await self.db.request("PATCH", self.table, params={
+            "select": ",".join(columns), "id": f"eq.{task_id}", "attempts": f"eq.{expected_attempts}",
+            "status": "in.(PENDING,PROCESSING)", "or": self._orphan_filter(now, stale_before, exclude_queued),
+        }, json=fields, prefer="return=representation")
+        return rows[0] if rows else None
+
+    async def renew_leases(self, task_ids: Sequence[str], owner: str, **fields) -> List[str]:
+        """Renova os leases de `owner` numa única escrita; retorna os IDs cujo lease ainda era dele."""
+        if not task_ids:
+            return []
+        rows = await self.db.request("PATCH", self.table, params={
+            "select": "id", "id": f"in.({','.join(task_ids)})", "lease_owner": f"eq.{owner}",
+            "status": "in.(PENDING,PROCESSING)", # Tarefa cancelada (ex.: por outro nó) não é renovada
+        }, json=fields, prefer="return=representation", idempotent=True)
+        return [row["id"] for row in rows]
+
+    # --- Fila compartilhada (ver services/task_queue.py) ---
+    async def mark_queued(self, task_ids: Sequence[str], priority: str, queued_at: str) -> None:
+        """Marca tarefas PENDING como enfileiradas (no backend "postgres", isso as libera para os workers)."""
+        if not task_ids:
+            return
+        await self.db.request("PATCH", self.table, params={
+            "id": f"in.({','.join(task_ids)})", "status": "eq.PENDING",
+        }, json={"queued_at": queued_at, "queue_priority": priority}, prefer="return=minimal", idempotent=True)
+
+    async def claim_queued(self, owner: str, limit: int, lease_seconds: float,
+                           columns: Iterable[str] = ("*",)) -> List[Row]:
+        """Assume até `limit` tarefas da fila (função claim_async_tasks: FOR UPDATE SKIP LOCKED). Sem retry."""
+        return await self.db.request("POST", "rpc/claim_async_tasks", params={"select": ",".join(columns)},
+                                     json={"worker": owner, "max_tasks": limit, "lease_seconds": lease_seconds})
+
+    async def lease_tasks(self, task_ids: Sequence[str], columns: Iterable[str] = ("*",), **fields) -> List[Row]:
+        """
+        Assume tarefas PENDING ainda sem dono (fila externa, ex.: SQLite); retorna
+        as que este processo levou. Sem retry, como o claim_task.
+        """
+        if not task_ids:
+            return []
+        return await self.db.request("PATCH", self.table, params={
+            "select": ",".join(columns), "id": f"in.({','.join(task_ids)})", "status": "eq.PENDING",
+            "lease_owner": "is.null",
+        }, json=fields, prefer="return=representation")
+
+
+class ProjectRepository:
+    """Operações tipadas sobre a tabela `projects`."""
+    table = "projects"
+
+    def __init__(self, db: SupabaseRepository):
+        self.db = db
+
+    async def create_project(self, user_id: str, nome_projeto: str,
+                             estado_progresso: Optional[Dict[str, Any]] = None) -> Row:
+        # ID gerado aqui: um retry depois de um insert aplicado regrava a mesma linha em vez de duplicar
+        rows = await self.db.request("POST", self.table, params={"on_conflict": "id"}, json={
+            "id": str(uuid.uuid4()), "user_id": user_id, "nome_projeto": nome_projeto,
+            "estado_progresso": estado_progresso or {},
+        }, prefer="return=representation,resolution=merge-duplicates", idempotent=True)
+        return rows[0]
+
+    async def get_project(self, project_id: str, columns: Iterable[str] = ("*",)) -> Optional[Row]:
+        rows = await self.db.request("GET", self.table, params={
+            "select": ",".join(columns), "id": f"eq.{project_id}", "limit": 1,
+        })
+        return rows[0] if rows else None
+
+    async def get_projects(self, project_ids: Sequence[str], columns: Iterable[str] = ("*",)) -> List[Row]:
+        """Vários projetos numa única consulta (ordem não garantida)."""
+        if not project_ids:
+            return []
+        return await self.db.request("GET", self.table, params={
+            "select": ",".join(columns), "id": f"in.({','.join(project_ids)})",
+        })
+
+    async def list_projects(self, user_id: str, columns: Iterable[str] = ("id", "nome_projeto", "updated_at"),
+                            limit: int = 50, after: Optional[Tuple[str, str]] = None) -> List[Row]:
+        """Projetos do usuário em (updated_at, id) decrescente; `after` é o último (updated_at, id) já visto."""
+        params = {
+            "select": ",".join(columns), "user_id": f"eq.{user_id}",
+            "order": "updated_at.desc,id.desc", "limit": limit,
+        }
+        if after is not None:
+            updated_at, project_id = (_quote(value) for value in after)
+            params["or"] = f"(updated_at.lt.{updated_at},and(updated_at.eq.{updated_at},id.lt.{project_id}))"
+        return await self.db.request("GET", self.table, params=params)
+
+    async def update_project(self, project_id: str, **fields) -> None:
+        await self.db.request("PATCH", self.table, params={"id": f"eq.{project_id}"}, json=fields,
+                              prefer="return=minimal", idempotent=True)
+
+
+# Instâncias compartilhadas; o cliente HTTP só é criado em `start()` (lifespan).
+supabase_repository = SupabaseRepository(
+    timeout=settings.db_timeout_seconds,
+    max_connections=settings.db_max_connections,
+    max_retries=settings.db_max_retries,
+)
+task_repository = TaskRepository(supabase_repository)
+project_repository = ProjectRepository(supabase_repository)
@@ -0,0 +1,115 @@
+# backend/lib/settings.py
+# Configuração única do backend, lida uma vez (variáveis de ambiente + .env).
+# Cada campo corresponde à variável de ambiente de mesmo nome em maiúsculas
+# (ex.: `task_workers` <- TASK_WORKERS); variáveis de ambiente têm prioridade
+# sobre o .env. Ver backend/.env.example.
+import os
+from pathlib import Path
+from typing import Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+_BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=(".env", _BACKEND_DIR / ".env"), # .env do diretório atual e backend/.env (este vence)
+        env_file_encoding="utf-8",
+        env_ignore_empty=True, # `CHAVE=` vazio no .env usa o padrão
+        extra="ignore",
+    )
+
+    # --- API ---
+    port: int = 8000
+    frontend_url: Optional[str] = None
+    log_level: str = "INFO"
+    crew_preload: bool = False # Importa o stack CrewAI em segundo plano logo após o startup
+    startup_import_budget_seconds: float = 1.5 # Teto do import do backend.main (python -m backend.bench startup)
+
+    # --- Observabilidade ---
+    metrics_enabled: bool = True # Endpoint /metrics (formato Prometheus)
+    otel_enabled: bool = False
+    otel_service_name: str = "funil-eterno-api"
+    otel_exporter_otlp_endpoint: Optional[str] = None # Ex.: http://localhost:4318/v1/traces (padrão do exportador)
+    otel_traces_sample_ratio: float = 0.05 # Fração dos traces gravados (decidida na raiz do trace)
+
+    # --- Supabase ---
+    supabase_url: Optional[str] = None
+    supabase_service_key: Optional[str] = None # Usar a chave de serviço
+    db_timeout_seconds: float = 10.0
+    db_max_connections: int = 20
+    db_max_retries: int = 3
+
+    # --- Execução das tarefas ---
+    task_workers: int = 2
+    task_queue_max: int = 20
+    task_executor_kind: str = "thread"
+    task_drain_timeout: float = 30.0
+    task_user_max_running: int = 0 # Execuções simultâneas de um mesmo usuário (0 = sem limite; 1 = cota estrita)
+    task_user_max_queued: int = 10 # Tarefas de um mesmo usuário esperando worker (0 = sem limite)
+    task_interactive_weight: float = 4.0 # Peso dos pedidos avulsos frente aos lotes (peso 1) na fila justa
+    task_recovery_enabled: bool = True # Leases + varredura periódica de órfãs (colunas em services/task_recovery.py)
+    task_worker_id: Optional[str] = None # Dono dos leases; padrão host:pid:aleatório
+    task_lease_seconds: float = 60.0 # Sem heartbeat por esse tempo, a tarefa é considerada órfã
+    task_heartbeat_seconds: float = 15.0
+    task_recovery_max_attempts: int = 3 # Interrupções toleradas antes de marcar a tarefa como FAILED
+    task_queue_backend: str = "local" # local (a API roda as Crews) | postgres | sqlite (API só enfileira, ver services/task_queue.py)
+    task_queue_sqlite_path: str = str(_BACKEND_DIR / "data" / "task_queue.sqlite3") # ":memory:" = só no mesmo processo
+    task_queue_poll_seconds: float = 1.0 # Intervalo da API para ver o fim das tarefas e dos workers para buscar na fila
+    task_remote_max_inflight: int = 200 # Tarefas deste nó da API na fila/nos workers (modo fila) antes do 429
+    task_flush_interval: float = 0.5
+    task_flush_batch: int = 100
+    task_events_history: int = 500
+    task_events_retention_seconds: float = 600.0
+    task_batch_max_items: int = 100 # Itens por POST /analyze-niche/batch
+    task_batch_max_inflight: int = 2 # Execuções simultâneas de um mesmo lote no pool
+    task_batch_history: int = 1000 # Lotes mantidos em memória para o status agregado
+
+    # --- Análise de nicho ---
+    niche_analysis_mode: str = "crew"
+    niche_fanout_concurrency: int = 4
+    niche_fanout_timeout_seconds: float = 60.0
+    niche_incremental: bool = True # Reanálise reaproveita os nichos não afetados pela mudança das entradas
+    niche_incremental_max_change: float = 0.5 # Acima desta fração de termos alterados, análise completa
+    niche_cache_max_entries: int = 256
+    niche_cache_ttl_seconds: float = 6 * 3600
+    niche_cache_dir: Optional[str] = None
+    niche_cache_compression: str = "none" # "zstd" comprime os arquivos do cache em disco
+    project_list_cache_ttl_seconds: float = 60.0
+
+    # --- Cache semântico (embeddings locais, ver services/semantic_cache.py) ---
+    semantic_cache_enabled: bool = False # Carrega sentence-transformers/torch no processo da API
+    semantic_cache_dir: Optional[str] = None # Sem diretório, o índice fica só em memória
+    semantic_cache_model: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    semantic_cache_serve_threshold: float = 0.93 # Similaridade (cosseno) para servir a análise do vizinho
+    semantic_cache_seed_threshold: float = 0.80 # ...e para usar os nichos dele como ponto de partida
+    semantic_cache_batch_size: int = 32
+    semantic_cache_lookup_timeout: float = 2.0 # Sem embedding nesse tempo (ex.: modelo carregando), segue sem cache
+    semantic_cache_max_entries: int = 50000
+
+    # --- LLM ---
+    openai_api_key: Optional[str] = None
+    crewai_llm_model: str = "gpt-3.5-turbo" # Começar com gpt-3.5 para testes
+    crewai_llm_temperature: float = 0.3
+    crewai_llm_streaming: bool = True
+    llm_rpm_limit: float = 500
+    llm_tpm_limit: float = 200000
+    llm_max_prompt_tokens: int = 8000
+    llm_max_response_tokens: int = 2000
+    llm_task_token_budget: int = 0 # 0 = sem teto por tarefa
+    llm_max_retries: int = 4
+    llm_retry_base_seconds: float = 1.0
+    llm_timeout_seconds: float = 120.0
+    llm_max_connections: int = 20
+    llm_price_input_per_1k: Optional[float] = None # Sobrescreve a tabela de preços do llm_gateway
+    llm_price_output_per_1k: Optional[float] = None
+
+
+# Instância compartilhada: o .env é lido uma única vez, no primeiro import.
+settings = Settings()
+
+# O pydantic-settings não exporta o .env: o crewai (e o LiteLLM por baixo dele)
+# procura a chave da OpenAI no ambiente, inclusive nos workers em subprocesso.
+if settings.openai_api_key:
+    os.environ.setdefault("OPENAI_API_KEY", settings.openai_api_key)
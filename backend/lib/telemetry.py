@@ -0,0 +1,319 @@
+# backend/lib/telemetry.py
+# Observabilidade do backend:
+# - métricas em memória expostas em /metrics no formato texto do Prometheus
+#   (histogramas por etapa: requisição, Supabase, fila, etapas da Crew, LLM);
+# - tracing com OpenTelemetry, com amostragem por trace (OTEL_TRACES_SAMPLE_RATIO).
+# Com OTEL_ENABLED=false os spans são no-op da API do OpenTelemetry; o SDK e o
+# exportador só são importados quando o tracing é ligado.
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from opentelemetry import context as otel_context, propagate, trace
+
+from backend.lib.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Limites (s) dos buckets: de chamadas ao banco (ms) até análises inteiras (minutos)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _labels_text(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+# --- Métricas ---
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {} # labels -> [contagem por bucket..., soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels_text(self.labels, key, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels_text(self.labels, key, inf)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labels, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels_text(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        lines += [f"{self.name}{_labels_text(self.labels, key)} {_number(value)}" for key, value in sorted(values.items())]
+        return lines
+
+
+class Gauge:
+    """Valor lido na hora do scrape (ex.: profundidade da fila do executor)."""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {e}")
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {_number(value)}"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def _add(self, metric):
+        self._metrics.setdefault(metric.name, metric)
+        return self._metrics[metric.name]
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (), **kwargs) -> Histogram:
+        return self._add(Histogram(name, documentation, labels, **kwargs))
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], float]) -> Gauge:
+        return self._add(Gauge(name, documentation, read))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "funil_http_request_duration_seconds", "Duração das requisições HTTP.", ("method", "route", "status"))
+DB_REQUEST_SECONDS = metrics.histogram(
+    "funil_db_request_duration_seconds", "Duração das chamadas ao Supabase (PostgREST), com retries.",
+    ("table", "method", "outcome"))
+TASK_QUEUE_WAIT_SECONDS = metrics.histogram(
+    "funil_task_queue_wait_seconds", "Tempo entre a submissão ao executor e o início da execução.")
+TASK_RUN_SECONDS = metrics.histogram(
+    "funil_task_run_duration_seconds", "Duração da execução da tarefa no worker.", ("outcome",))
+TASK_STEP_SECONDS = metrics.histogram(
+    "funil_task_step_duration_seconds", "Duração de cada etapa da análise (tarefas da Crew / fanout).", ("step",))
+LLM_CALL_SECONDS = metrics.histogram(
+    "funil_llm_call_duration_seconds", "Duração das chamadas ao LLM, incluindo retries e espera do rate limit.",
+    ("model", "outcome"))
+LLM_TOKENS = metrics.counter("funil_llm_tokens_total", "Tokens consumidos no LLM.", ("model", "kind"))
+
+
+def observe_llm_call(model: str, seconds: float, outcome: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+    LLM_CALL_SECONDS.observe(seconds, model=model, outcome=outcome)
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+
+
+class TaskEventMetrics:
+    """
+    Listener do task_executor: transforma os eventos das tarefas em métricas.
+    Os eventos chegam ao processo da API também no modo processo, então as
+    medições feitas nos workers aparecem no /metrics.
+    """
+
+    def __init__(self):
+        self._started: Dict[str, float] = {}
+        self._steps: Dict[Tuple[str, str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, task_id: str, event: Dict[str, Any]):
+        kind, ts = event["type"], event.get("ts", time.time())
+        if kind == "started":
+            with self._lock:
+                self._started[task_id] = ts
+            if event.get("queue_wait") is not None:
+                TASK_QUEUE_WAIT_SECONDS.observe(event["queue_wait"])
+        elif kind == "step_started":
+            with self._lock:
+                self._steps[(task_id, event.get("step"), event.get("niche") or "")] = ts
+        elif kind == "step_finished":
+            with self._lock:
+                started = self._steps.pop((task_id, event.get("step"), event.get("niche") or ""), None)
+            if started is not None:
+                TASK_STEP_SECONDS.observe(ts - started, step=event.get("step"))
+        elif kind == "llm_call":
+            observe_llm_call(event.get("model", ""), event.get("seconds", 0.0), event.get("outcome", "ok"),
+                             event.get("prompt_tokens", 0), event.get("completion_tokens", 0))
+        elif kind in ("completed", "failed", "cancelled"):
+            with self._lock:
+                started = self._started.pop(task_id, None)
+                for key in [key for key in self._steps if key[0] == task_id]:
+                    del self._steps[key] # Etapas que não terminaram (ex.: nicho que falhou)
+            if started is not None:
+                TASK_RUN_SECONDS.observe(ts - started, outcome=kind)
+
+task_event_metrics = TaskEventMetrics()
+
+
+class HttpMetricsMiddleware:
+    """Middleware ASGI que mede as requisições, rotuladas pelo template da rota (não pelo path)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"],
+                                         route=getattr(route, "path", "unmatched"), status=status_code)
+
+
+# --- Tracing ---
+# No-op até configure_tracing: o tracer proxy do OpenTelemetry seguiria qualquer
+# provider global, e o crewai registra o da telemetria dele no primeiro kickoff.
+tracer: trace.Tracer = trace.NoOpTracer()
+_tracing_configured = False
+
+def configure_tracing(app=None):
+    """
+    Liga o tracing (se OTEL_ENABLED): provider com amostragem por trace e
+    exportador OTLP/HTTP em lote. Com `app`, instrumenta também o FastAPI.
+    Chamado no startup da API e nos processos filhos do executor.
+    """
+    global _tracing_configured, tracer
+    if not settings.otel_enabled:
+        return
+    if not _tracing_configured:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBasedTraceIdRatio
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": settings.otel_service_name}),
+            sampler=ParentBasedTraceIdRatio(settings.otel_traces_sample_ratio),
+        )
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=settings.otel_exporter_otlp_endpoint)))
+        trace.set_tracer_provider(provider)
+        tracer = provider.get_tracer("funil-eterno")
+        _tracing_configured = True
+        logger.info(f"OpenTelemetry tracing enabled (sample ratio {settings.otel_traces_sample_ratio}).")
+    if app is not None:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics")
+
+def shutdown_tracing():
+    provider = trace.get_tracer_provider()
+    if _tracing_configured and hasattr(provider, "shutdown"):
+        provider.shutdown() # Exporta os spans pendentes
+
+
+@contextmanager
+def span(name: str, context: Optional[otel_context.Context] = None, start_time: Optional[int] = None,
+         **attributes) -> Iterator[trace.Span]:
+    """Span filho do contexto atual (ou de `context`). Atributos None são omitidos."""
+    with tracer.start_as_current_span(name, context=context, start_time=start_time) as current:
+        if current.is_recording():
+            current.set_attributes({key: value for key, value in attributes.items() if value is not None})
+        yield current
+
+def start_span(name: str, **attributes) -> Tuple[trace.Span, object]:
+    """Abre um span e o torna o atual até `end_span` (etapas delimitadas por callbacks, não por um bloco)."""
+    current = tracer.start_span(name)
+    set_attributes(current, **attributes)
+    return current, otel_context.attach(trace.set_span_in_context(current))
+
+def end_span(handle: Tuple[trace.Span, object]):
+    current, token = handle
+    otel_context.detach(token)
+    current.end()
+
+def set_attributes(current: trace.Span, **attributes):
+    if current.is_recording():
+        current.set_attributes({key: value for key, value in attributes.items() if value is not None})
+
+
+# Propagação entre threads/processos (o contexto do OpenTelemetry vive em contextvars)
+def inject_context() -> Dict[str, str]:
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier
+
+def extract_context(carrier: Optional[Dict[str, str]]) -> otel_context.Context:
+    return propagate.extract(carrier or {})
+
+current_context = otel_context.get_current
+
+@contextmanager
+def use_context(ctx: Optional[otel_context.Context]):
+    if ctx is None:
+        yield
+        return
+    token = otel_context.attach(ctx)
+    try:
+        yield
+    finally:
+        otel_context.detach(token)
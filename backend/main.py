@@ -1,30 +1,94 @@
-import os
+import asyncio
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 
+# Configuração única (env + backend/.env, lidos uma vez) -- ver backend/lib/settings.py
+from backend.lib.settings import settings
+
 # Importar routers
 from backend.routers import ai_tasks # Incluindo o router que acabamos de criar
 from backend.routers import projects # Adiciona import
+from backend.services.task_executor import task_executor, add_event_listener
+from backend.services.task_registry import task_registry
+from backend.services.task_events import task_event_bus
+from backend.services.task_batches import task_batches
+from backend.services.semantic_cache import semantic_cache
+from backend.services.task_recovery import task_leases
+from backend.services.task_queue import QueueDispatcher, create_task_queue
+from backend.services import project_service
+from backend.lib.repository import supabase_repository, task_repository
+from backend.lib import telemetry
 
-# Carrega variáveis de ambiente do backend/.env
-from dotenv import find_dotenv, load_dotenv
-env_path = find_dotenv(filename=".env", raise_error_if_not_found=False, usecwd=True)
-if env_path:
-    print(f"Loading .env file from: {env_path}")
-    load_dotenv(dotenv_path=env_path)
-else:
-    print("Warning: backend/.env file not found. Relying on environment variables.")
+# Logging configurado uma vez, aqui (os módulos só usam logging.getLogger / logging.info)
+logging.basicConfig(level=settings.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
 # --- Lifespan ---
+async def recover_orphaned_tasks():
+    # Varredura de recuperação a cada lease: retoma as tarefas cujo processo parou de
+    # renovar o lease, só quantas cabem agora no pool (como o backend.worker). Um nó
+    # ocupado deixa as órfãs para outro processo ou para a próxima volta.
+    while True:
+        try:
+            free = task_executor.idle_workers() - task_batches.stats()["runs_waiting"]
+            if free > 0:
+                claimed = await task_leases.claim_orphans(limit=free)
+                await ai_tasks.resume_orphaned_tasks(claimed)
+        except Exception as e:
+            logging.error(f"Task recovery sweep failed: {e}", exc_info=True)
+        await asyncio.sleep(task_leases.lease_seconds)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("API starting up...")
-    print("Necessary services initialized (placeholder).")
+    await supabase_repository.start() # Pool HTTP compartilhado para o Supabase
+    task_registry.start(task_repository, asyncio.get_running_loop())
+    add_event_listener(task_registry.on_executor_event) # PROCESSING/COMPLETED/FAILED
+    task_event_bus.bind_loop(asyncio.get_running_loop())
+    add_event_listener(task_event_bus.publish) # Stream SSE de progresso
+    add_event_listener(project_service.invalidate_on_task_event) # Cache da lista de projetos
+    project_service.niche_analysis_store.bind_loop(asyncio.get_running_loop())
+    add_event_listener(project_service.niche_analysis_store.on_executor_event) # Base da reanálise incremental
+    add_event_listener(task_batches.on_executor_event) # Libera a próxima execução dos lotes
+    add_event_listener(telemetry.task_event_metrics) # Histogramas de fila/etapas/LLM em /metrics
+    queue_backend = create_task_queue(settings.task_queue_backend, task_repository)
+    if queue_backend is None:
+        task_executor.start()
+    else:
+        # Modo fila: este processo só enfileira; as Crews rodam em `python -m backend.worker`
+        task_executor.start(dispatcher=QueueDispatcher(
+            queue_backend, task_repository, max_inflight=settings.task_remote_max_inflight,
+            poll_seconds=settings.task_queue_poll_seconds, user_max_queued=settings.task_user_max_queued,
+        ))
+    recovery_sweep = None
+    if settings.task_recovery_enabled and not task_executor.is_remote: # No modo fila, a recuperação é dos workers
+        task_leases.start(task_repository) # Heartbeat dos leases das tarefas deste processo
+        add_event_listener(task_leases.on_executor_event)
+        recovery_sweep = asyncio.get_running_loop().create_task(recover_orphaned_tasks()) # Fora do caminho do startup
+    if settings.semantic_cache_enabled:
+        semantic_cache.start() # Índice em mmap; o modelo de embeddings carrega em segundo plano
+    if settings.crew_preload:
+        # Aquece o stack CrewAI em segundo plano: a API já atende enquanto ele importa
+        asyncio.get_running_loop().create_task(ai_tasks.load_crew_service())
+    print("Necessary services initialized.")
     yield
     print("API shutting down...")
+    # Execuções que ainda não entraram no pool são marcadas como FAILED (ou, com a
+    # recuperação ligada, ficam PENDING para o próximo processo); as Crews em
+    # andamento terminam antes de encerrar o processo
+    recovery = settings.task_recovery_enabled
+    if recovery_sweep is not None:
+        recovery_sweep.cancel() # Não assume órfãs que não conseguiria terminar
+    task_batches.abandon_pending(fail=not recovery)
+    await task_executor.shutdown(drain_timeout=settings.task_drain_timeout, fail_pending=not recovery)
+    await task_leases.stop() # Vence os leases restantes: o próximo processo retoma sem esperar
+    await task_registry.stop() # Último flush das atualizações de status
+    semantic_cache.stop() # Grava os vetores pendentes do índice
+    await supabase_repository.close()
+    telemetry.shutdown_tracing() # Exporta os spans pendentes
 
 # --- Criação da App FastAPI ---
 app = FastAPI(
@@ -38,7 +102,7 @@ app = FastAPI(
 origins = [
     "http://localhost:5173",
     "http://localhost:3000",
-    os.getenv("FRONTEND_URL"),
+    settings.frontend_url,
     "https://funil-eterno-cfe.web.app"
 ]
 origins = [origin for origin in origins if origin]
@@ -52,8 +116,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"], # Paginação de /projects
 )
 
+# --- Observabilidade ---
+# Tracing (OTEL_ENABLED) instrumenta o FastAPI; métricas ficam em /metrics (formato Prometheus)
+telemetry.configure_tracing(app)
+if settings.metrics_enabled:
+    app.add_middleware(telemetry.HttpMetricsMiddleware)
+    telemetry.metrics.gauge("funil_executor_queue_depth", "Tarefas aceitas esperando um worker.",
+                            task_executor.queue_depth)
+    telemetry.metrics.gauge("funil_executor_inflight", "Tarefas aceitas (na fila ou rodando).",
+                            lambda: task_executor.stats()["running"] + task_executor.queue_depth())
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_endpoint():
+        return PlainTextResponse(telemetry.metrics.render(), media_type="text/plain; version=0.0.4")
+
 # --- Inclusão de Routers ---
 app.include_router(ai_tasks.router, prefix="/api/v1/tasks", tags=["AI Tasks"])
 app.include_router(projects.router, prefix="/api/v1/projects", tags=["Projects"])
@@ -66,6 +145,6 @@ async def read_root():
 # --- Execução com Uvicorn ---
 if __name__ == "__main__":
     import uvicorn
-    port = int(os.getenv("PORT", 8000))
+    port = settings.port
     print(f"Starting Uvicorn server locally on http://127.0.0.1:{port} ...")
     uvicorn.run("main:app", host="127.0.0.1", port=port, reload=True) 
\ No newline at end of file
@@ -1,29 +1,44 @@
 # backend/routers/ai_tasks.py
-from fastapi import APIRouter, HTTPException, Body, Depends, BackgroundTasks, status
+from fastapi import APIRouter, HTTPException, Body, Depends, Request, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 import uuid # Para gerar IDs de tarefa
 from datetime import datetime, timezone
 import logging # Adicionado logging
+import functools
+import importlib
+import asyncio
+import orjson
 
-# Importar cliente Supabase Admin
-try:
-    from backend.lib.supabase_client import supabase_admin_client
-    # Verifica se foi inicializado corretamente
-    if not supabase_admin_client:
-        logging.error("Supabase admin client FAILED to initialize in ai_tasks.py.")
-    else:
-        logging.info("Supabase admin client successfully imported in ai_tasks.py.")
-except ImportError:
-    supabase_admin_client = None
-    logging.error("Supabase admin client could NOT be imported in ai_tasks.py.")
-
-# Importar serviço CrewAI
-try:
-    from backend.services import crew_service
-except ImportError:
-    crew_service = None
-    logging.warning("crew_service not found or could not be imported in ai_tasks.py.")
+# Acesso assíncrono ao Supabase (pool HTTP compartilhado)
+from backend.lib.repository import supabase_repository, task_repository
+
+# Serviço CrewAI: importado só no primeiro uso (crewai/langchain/tiktoken pesam no cold start)
+_crew_service = None
+
+async def load_crew_service():
+    """Importa backend.services.crew_service numa thread (sem travar o event loop). None se indisponível."""
+    global _crew_service
+    if _crew_service is None:
+        try:
+            _crew_service = await asyncio.to_thread(importlib.import_module, "backend.services.crew_service")
+        except ImportError as e:
+            logging.warning(f"crew_service could not be imported in ai_tasks.py: {e}")
+    return _crew_service
+
+from backend.services.task_executor import task_executor, ExecutorSaturatedError, report_event
+from backend.services.result_cache import niche_result_cache
+from backend.services.semantic_cache import semantic_cache
+from backend.services.task_registry import task_registry, FAILED, COMPLETED, CANCELLED, TERMINAL_STATUSES
+from backend.services.task_scheduler import INTERACTIVE
+from backend.services.task_events import task_event_bus
+from backend.services.task_batches import task_batches, aggregate_status, BatchRun
+from backend.services.project_service import niche_analysis_store
+from backend.services.task_recovery import task_leases
+from backend.routers.projects import get_current_user_id
+from backend.lib.settings import settings
+from backend.specs.niche import present_result
 
 router = APIRouter()
 
@@ -46,10 +61,30 @@ class NicheAnalysisInput(BaseModel):
     skills: List[str] = Field(..., min_length=1)
     initial_idea: Optional[str] = None
 
+class NicheAnalysisBatchInput(BaseModel):
+    items: List[NicheAnalysisInput] = Field(..., min_length=1, max_length=settings.task_batch_max_items)
+
 class AsyncTaskStatus(BaseModel):
     task_id: str
     status: str
     message: str
+    queue_position: Optional[int] = None # 0 = execução imediata
+
+class BatchTaskItem(BaseModel):
+    task_id: str
+    project_id: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+
+class BatchTaskStatus(BaseModel):
+    batch_id: str
+    status: str # PENDING, PROCESSING, COMPLETED, FAILED ou PARTIAL (finalizado com falhas)
+    message: str
+    task_ids: List[str] # Um por item, na ordem enviada (itens idênticos recebem o mesmo ID)
+    total: int # Tarefas distintas do lote
+    counts: Dict[str, int] # Tarefas por status
+    progress: float # Fração das tarefas já finalizadas (0-1)
+    tasks: List[BatchTaskItem] = []
 
 # Modelo para inserir na tabela async_tasks (simplificado)
 class TaskRecordCreate(BaseModel):
@@ -66,7 +101,6 @@ class TaskRecordCreate(BaseModel):
 @router.post("/analyze-niche", response_model=AsyncTaskStatus, status_code=status.HTTP_202_ACCEPTED, summary="Inicia Análise de Nicho Assíncrona")
 async def start_niche_analysis_endpoint(
     payload: NicheAnalysisInput,
-    background_tasks: BackgroundTasks
     # TODO: Adicionar dependência para pegar user_id do token: user_id: str = Depends(get_current_user_id)
 ):
     """
@@ -74,11 +108,12 @@ async def start_niche_analysis_endpoint(
     em segundo plano e retorna um ID de tarefa para consulta.
     """
     logging.info(f"Received request for /analyze-niche for project: {payload.project_id}")
+    crew_service = await load_crew_service()
     if not crew_service:
         raise HTTPException(status_code=501, detail="Serviço CrewAI não está disponível.")
-    if not supabase_admin_client:
+    if not supabase_repository.available:
         # Log extra antes de lançar a exceção
-        logging.error("Aborting /analyze-niche: Supabase admin client is not available.")
+        logging.error("Aborting /analyze-niche: Supabase repository is not available.")
         raise HTTPException(status_code=503, detail="Conexão com banco de dados não disponível.")
 
     task_id = uuid.uuid4()
@@ -93,51 +128,498 @@ async def start_niche_analysis_endpoint(
         logging.error(f"Invalid UUID format received: user_id='{payload.user_id}', project_id='{payload.project_id}'")
         raise HTTPException(status_code=400, detail="Formato inválido para project_id ou user_id.")
 
-    # 1. Criar registro REAL da tarefa no Supabase
+    # Cache de resultados: entradas equivalentes (mesmo modelo/temperatura) reaproveitam a análise
+    inputs = payload.model_dump()
+    cache_key = crew_service.niche_cache_key(inputs)
+    cached_result = niche_result_cache.get(cache_key)
+    seed_niches = None
+    if cached_result is None:
+        # Cache semântico: entradas quase iguais servem (ou dão a semente de) a análise do vizinho
+        cached_result, seed_niches = (await _semantic_lookup(crew_service, [inputs]))[0]
+    shared_run, is_leader = (None, False)
+    if cached_result is None:
+        # Admission control: só quem vai de fato rodar uma Crew ocupa o pool
+        # (inclui a cota de fila do usuário: um usuário não ocupa a fila de todos)
+        if not niche_result_cache.is_inflight(cache_key) and task_executor.is_saturated(str(user_id_uuid)):
+            _raise_saturated(task_executor.queue_depth())
+        # Single-flight: requisições idênticas simultâneas compartilham a mesma execução
+        shared_run, is_leader = niche_result_cache.claim(cache_key)
+
+    # 1. Criar registro REAL da tarefa no Supabase (sem bloquear o event loop)
     try:
+        # Análise anterior do projeto: com entradas pouco alteradas, só os nichos afetados são refeitos
+        previous = await _load_previous_analyses([str(project_id_uuid)]) if is_leader else {}
         task_data_to_insert = {
             "id": str(task_id), # Envia como string, o DB converte para UUID se o tipo for UUID
             "project_id": str(project_id_uuid),
             "user_id": str(user_id_uuid),
             "task_type": task_type,
             "status": 'PENDING',
+            "result": None,
             # created_at e updated_at usarão DEFAULT do DB
         }
+        if cached_result is not None:
+            # Cache hit: a tarefa já nasce concluída
+            task_data_to_insert.update({"status": 'COMPLETED', "result": cached_result})
+        else:
+            _stamp_for_recovery(task_data_to_insert, inputs, seed_niches)
         logging.info(f"Attempting to insert task {task_id} into Supabase...")
-        response = supabase_admin_client.table('async_tasks').insert(task_data_to_insert).execute()
-        logging.info(f"Supabase insert response for task {task_id}: {response}")
-
-        # Verificação de erro mais robusta (Supabase-py v1 vs v2 pode variar)
-        # Ajustei para como a biblioteca v1 geralmente se comporta (sem async/await direto aqui)
-        # E checando o erro na resposta explicitamente.
-        if hasattr(response, 'error') and response.error:
-             logging.error(f"Supabase insert error (API Error): {response.error.message}")
-             # Lança exceção para ser pega pelo bloco except externo
-             raise Exception(f"Supabase insert error: {response.error.message}")
-        # Verifica se 'data' existe e não está vazia (indicador de sucesso comum)
-        elif not response.data:
-             logging.warning(f"Supabase insert for task {task_id} returned no data. Assuming success, but verify.")
-             # Poderia lançar erro aqui se 'data' for estritamente necessário
-
+        await task_repository.insert_tasks([task_data_to_insert])
         logging.info(f"Task {task_id} registered in DB for project {payload.project_id}")
+        task_registry.register(task_data_to_insert)
 
     except Exception as db_error:
          logging.error(f"Erro ao registrar tarefa {task_id} no DB: {db_error}", exc_info=True)
+         if is_leader:
+             niche_result_cache.complete(cache_key, error=db_error) # Libera eventuais seguidores
          # Retorna 500 Internal Server Error se falhar ao falar com o DB
          raise HTTPException(status_code=500, detail=f"Erro interno ao registrar tarefa.")
+    except asyncio.CancelledError:
+         if is_leader:
+             niche_result_cache.complete(cache_key, error=RuntimeError("Request cancelled before scheduling."))
+         raise
 
-    # 2. Adicionar a execução da Crew à fila de background tasks
-    background_tasks.add_task(
-        crew_service.run_niche_analysis_task, # A função em crew_service é async
-        task_id=str(task_id), # Passa como string
-        inputs=payload.model_dump()
-    )
-    logging.info(f"Task {task_id} added to background queue.")
+    if cached_result is not None:
+        source = "semantic cache" if "semantic_match" in cached_result else "result cache"
+        logging.info(f"Task {task_id} served from {source} (key {cache_key[:12]}).")
+        niche_analysis_store.save_later(str(project_id_uuid), cached_result)
+        return AsyncTaskStatus(
+            task_id=str(task_id),
+            status="COMPLETED",
+            message="Análise de nicho recuperada do cache."
+        )
+
+    if not is_leader:
+        # Outra requisição idêntica já está rodando: conclui este registro quando ela terminar
+        shared_run.add_done_callback(functools.partial(_complete_follower_task, str(task_id)))
+        logging.info(f"Task {task_id} attached to in-flight analysis (key {cache_key[:12]}).")
+        return AsyncTaskStatus(
+            task_id=str(task_id),
+            status="PENDING",
+            message="Tarefa de análise de nicho iniciada com sucesso."
+        )
+
+    # 2. Enviar a execução da Crew para o pool dedicado (fora do threadpool da API)
+    try:
+        queue_position = task_executor.submit(
+            str(task_id),
+            crew_service.run_niche_analysis_task,
+            user=str(user_id_uuid), # Fila justa e cotas por usuário (ver task_scheduler)
+            priority=INTERACTIVE,
+            on_done=functools.partial(_on_analysis_done, cache_key, crew_service.niche_semantic_text(inputs),
+                                      crew_service.niche_cache_scope()),
+            task_id=str(task_id), # Passa como string
+            inputs=inputs,
+            previous=previous.get(str(project_id_uuid)),
+            seed_niches=seed_niches,
+        )
+    except ExecutorSaturatedError as saturated:
+        # Corrida com outra requisição entre a checagem e o submit
+        task_registry.update(str(task_id), FAILED, error_message="Executor saturado.")
+        niche_result_cache.complete(cache_key, error=saturated)
+        _raise_saturated(saturated.queue_depth, saturated.retry_after)
+    except RuntimeError as not_running:
+        logging.error(f"Task executor is not running; task {task_id} was not scheduled.")
+        task_registry.update(str(task_id), FAILED, error_message="Executor indisponível.")
+        niche_result_cache.complete(cache_key, error=not_running)
+        raise HTTPException(status_code=503, detail="Serviço de execução de tarefas indisponível.")
+    logging.info(f"Task {task_id} submitted to executor (queue position {queue_position}).")
 
     return AsyncTaskStatus(
         task_id=str(task_id),
         status="PENDING",
-        message="Tarefa de análise de nicho iniciada com sucesso."
+        message="Tarefa de análise de nicho iniciada com sucesso.",
+        queue_position=queue_position
+    )
+
+@router.post("/analyze-niche/batch", response_model=BatchTaskStatus, status_code=status.HTTP_202_ACCEPTED, summary="Inicia Análises de Nicho em Lote")
+async def start_niche_analysis_batch_endpoint(payload: NicheAnalysisBatchInput):
+    """
+    Várias análises de nicho numa única chamada (ex.: agência cadastrando
+    vários clientes). Todos os itens são validados antes de qualquer escrita,
+    as tarefas são inseridas numa única ida ao banco e entradas equivalentes
+    rodam uma única Crew. As execuções entram no pool aos poucos, dividindo os
+    limites com os pedidos avulsos (ver task_batches); o progresso agregado
+    fica em GET /batch/{batch_id}/status.
+    """
+    logging.info(f"Received request for /analyze-niche/batch with {len(payload.items)} item(s)")
+    crew_service = await load_crew_service()
+    if not crew_service:
+        raise HTTPException(status_code=501, detail="Serviço CrewAI não está disponível.")
+    if not supabase_repository.available:
+        logging.error("Aborting /analyze-niche/batch: Supabase repository is not available.")
+        raise HTTPException(status_code=503, detail="Conexão com banco de dados não disponível.")
+
+    # 1. Validação de todos os itens de uma vez (nenhuma tarefa é criada se algum for inválido)
+    errors = []
+    for index, item in enumerate(payload.items):
+        for field in ("project_id", "user_id"):
+            try:
+                uuid.UUID(getattr(item, field))
+            except ValueError:
+                errors.append({"index": index, "field": field, "message": "Formato inválido (UUID esperado)."})
+    if errors:
+        logging.error(f"Rejecting /analyze-niche/batch: {len(errors)} invalid field(s).")
+        raise HTTPException(status_code=400, detail={"message": "Itens inválidos no lote.", "errors": errors})
+
+    # 2. Deduplicação: itens idênticos (mesmo projeto, usuário e entradas) viram uma única tarefa
+    task_ids: List[str] = []
+    rows: Dict[str, Dict[str, Any]] = {}
+    task_inputs: Dict[str, tuple] = {} # task_id -> (cache_key, inputs)
+    by_item: Dict[tuple, str] = {}
+    for item in payload.items:
+        inputs = item.model_dump()
+        cache_key = crew_service.niche_cache_key(inputs)
+        item_key = (str(uuid.UUID(item.project_id)), str(uuid.UUID(item.user_id)), cache_key)
+        task_id = by_item.get(item_key)
+        if task_id is None:
+            task_id = by_item[item_key] = str(uuid.uuid4())
+            rows[task_id] = {
+                "id": task_id, "project_id": item_key[0], "user_id": item_key[1],
+                "task_type": "ANALYZE_NICHE", "status": 'PENDING', "result": None,
+            }
+            task_inputs[task_id] = (cache_key, inputs)
+        task_ids.append(task_id)
+
+    # 3. Cache e single-flight por chave: entradas equivalentes em projetos diferentes
+    #    (ou já rodando em outra requisição) compartilham uma única execução
+    key_inputs = {cache_key: inputs for cache_key, inputs in task_inputs.values()}
+    cached: Dict[str, Any] = {cache_key: niche_result_cache.get(cache_key) for cache_key in key_inputs}
+    seeds: Dict[str, Optional[List[str]]] = {}
+    missing = [cache_key for cache_key, result in cached.items() if result is None]
+    # Cache semântico das chaves que faltaram, num único lote de embeddings
+    for cache_key, (result, seed) in zip(missing, await _semantic_lookup(crew_service, [key_inputs[k] for k in missing])):
+        cached[cache_key], seeds[cache_key] = result, seed
+    claims: Dict[str, tuple] = {} # cache_key -> (task_id do líder, future compartilhado, is_leader)
+    for task_id, (cache_key, _) in task_inputs.items():
+        if cached[cache_key] is not None:
+            rows[task_id].update({"status": 'COMPLETED', "result": cached[cache_key]})
+        elif cache_key not in claims:
+            claims[cache_key] = (task_id, *niche_result_cache.claim(cache_key))
+    leaders = [cache_key for cache_key, (_, _, is_leader) in claims.items() if is_leader]
+    for task_id, (cache_key, inputs) in task_inputs.items():
+        if rows[task_id]["status"] == COMPLETED:
+            rows[task_id].update(_not_recoverable()) # Inserção em lote: todas as linhas com as mesmas colunas
+        else:
+            _stamp_for_recovery(rows[task_id], inputs, seeds.get(cache_key))
+
+    # 4. Análises anteriores dos projetos que vão rodar (uma consulta) e todas as tarefas numa única ida ao banco
+    try:
+        previous = await _load_previous_analyses([rows[claims[cache_key][0]]["project_id"] for cache_key in leaders])
+        await task_repository.insert_tasks(list(rows.values()))
+    except Exception as db_error:
+        logging.error(f"Erro ao registrar as {len(rows)} tarefas do lote no DB: {db_error}", exc_info=True)
+        for cache_key in leaders:
+            niche_result_cache.complete(cache_key, error=db_error) # Libera eventuais seguidores
+        raise HTTPException(status_code=500, detail="Erro interno ao registrar tarefas do lote.")
+    except asyncio.CancelledError:
+        for cache_key in leaders:
+            niche_result_cache.complete(cache_key, error=RuntimeError("Request cancelled before scheduling."))
+        raise
+    for row in rows.values():
+        task_registry.register(row)
+        if row["status"] == COMPLETED:
+            niche_analysis_store.save_later(row["project_id"], row["result"])
+
+    # 5. Uma execução por chave nova; as demais tarefas aguardam a execução compartilhada
+    runs = []
+    for task_id, (cache_key, inputs) in task_inputs.items():
+        if rows[task_id]["status"] == COMPLETED:
+            continue
+        leader_task_id, shared_run, is_leader = claims[cache_key]
+        if is_leader and leader_task_id == task_id:
+            runs.append(BatchRun(
+                task_id, crew_service.run_niche_analysis_task,
+                {"task_id": task_id, "inputs": inputs, "previous": previous.get(rows[task_id]["project_id"]),
+                 "seed_niches": seeds.get(cache_key)},
+                on_done=functools.partial(_on_analysis_done, cache_key, crew_service.niche_semantic_text(inputs),
+                                          crew_service.niche_cache_scope()),
+                user=rows[task_id]["user_id"],
+            ))
+        else:
+            shared_run.add_done_callback(functools.partial(_complete_follower_task, task_id))
+    batch_id = task_batches.create(task_ids, runs)
+    logging.info(f"Batch {batch_id}: {len(payload.items)} item(s), {len(rows)} task(s), {len(runs)} new run(s), "
+                 f"{sum(1 for row in rows.values() if row['status'] == 'COMPLETED')} from cache.")
+
+    records = {task_id: task_registry.get(task_id) or row for task_id, row in rows.items()}
+    return _batch_status(task_batches.get(batch_id), records, "Lote de análises de nicho iniciado com sucesso.")
+
+@router.get("/batch/{batch_id}/status", response_model=BatchTaskStatus, summary="Consulta o Status Agregado de um Lote")
+async def get_batch_status_endpoint(batch_id: str):
+    """Progresso do lote (contagem por status) e o status de cada tarefa, sem os resultados."""
+    batch = task_batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Lote não encontrado.")
+    try:
+        records = await task_registry.load_many(batch["task_ids"])
+    except Exception as db_error:
+        logging.error(f"Erro ao consultar tarefas do lote {batch_id} no DB: {db_error}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Erro interno ao consultar lote.")
+    return _batch_status(batch, records)
+
+def _batch_status(batch: Dict[str, Any], records: Dict[str, Dict[str, Any]],
+                  message: Optional[str] = None) -> BatchTaskStatus:
+    unique_ids = list(dict.fromkeys(batch["task_ids"]))
+    summary = aggregate_status([records.get(task_id) for task_id in unique_ids])
+    if message is None:
+        finished = sum(summary["counts"].get(status, 0) for status in (COMPLETED, FAILED, CANCELLED))
+        message = f"{finished} de {summary['total']} tarefas finalizadas."
+    return BatchTaskStatus(
+        batch_id=batch["id"],
+        message=message,
+        task_ids=batch["task_ids"],
+        tasks=[
+            BatchTaskItem(task_id=task_id, project_id=record.get("project_id"), status=record["status"],
+                          error=record.get("error_message"))
+            if (record := records.get(task_id)) else BatchTaskItem(task_id=task_id, status="UNKNOWN")
+            for task_id in unique_ids
+        ],
+        **summary,
+    )
+
+async def _semantic_lookup(crew_service, inputs_list: List[Dict[str, Any]]) -> List[tuple]:
+    """
+    (resultado servido, nichos-semente) de cada entrada pelo cache semântico.
+    Acima de SEMANTIC_CACHE_SERVE_THRESHOLD serve a análise do vizinho; entre o
+    limiar de semente e o de servir, os nichos dele são o ponto de partida da pesquisa.
+    """
+    if not semantic_cache.running or not inputs_list:
+        return [(None, None)] * len(inputs_list)
+    matches = await semantic_cache.lookup_many(
+        [crew_service.niche_semantic_text(inputs) for inputs in inputs_list],
+        crew_service.niche_cache_scope(),
+        timeout=settings.semantic_cache_lookup_timeout,
+        min_similarity=settings.semantic_cache_seed_threshold,
+    )
+    found = []
+    for inputs, match in zip(inputs_list, matches):
+        result = None
+        if match is not None:
+            result = await asyncio.to_thread(match.result) # Lido do disco só quando há vizinho
+        if not isinstance(result, dict):
+            found.append((None, None))
+        elif match.similarity >= settings.semantic_cache_serve_threshold:
+            # As entradas do resultado são as deste pedido (base da próxima reanálise incremental do projeto)
+            found.append(({**result, "inputs": crew_service.niche_result_inputs(inputs),
+                           "semantic_match": {"similarity": round(match.similarity, 4), "inputs": match.text}}, None))
+        else:
+            found.append((None, [niche["nicho"] for niche in result.get("niches", [])] or None))
+    return found
+
+def _on_analysis_done(cache_key: str, semantic_text: str, scope: str, result: Any, error: Optional[BaseException]):
+    # Roda na thread que concluiu a execução: libera os seguidores e indexa no cache semântico
+    niche_result_cache.complete(cache_key, result, error)
+    if error is None:
+        semantic_cache.add(cache_key, semantic_text, scope, result)
+
+async def _load_previous_analyses(project_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    # Melhor esforço: sem a análise anterior, a tarefa só faz a análise completa
+    if not settings.niche_incremental or not project_ids:
+        return {}
+    try:
+        return await niche_analysis_store.load_many(project_ids)
+    except Exception as db_error:
+        logging.warning(f"Could not load previous niche analyses for {len(project_ids)} project(s): {db_error}")
+        return {}
+
+def _leases_enabled() -> bool:
+    # No modo fila o lease é de quem roda a tarefa (o worker), não da API
+    return settings.task_recovery_enabled and not task_executor.is_remote
+
+def _not_recoverable() -> Dict[str, Any]:
+    # Colunas de recuperação de uma tarefa que já nasce concluída (cache hit)
+    return {"checkpoint": None, **({"lease_owner": None, "lease_expires_at": None} if _leases_enabled() else {})}
+
+def _stamp_for_recovery(row: Dict[str, Any], inputs: Dict[str, Any], seed_niches: Optional[List[str]]):
+    # Checkpoint inicial (o que é preciso para reagendar ou rodar num worker) e lease deste processo
+    row["checkpoint"] = {"inputs": inputs, "seed_niches": seed_niches}
+    if _leases_enabled():
+        task_leases.stamp(row)
+
+async def resume_orphaned_tasks(records: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Reagenda as tarefas assumidas pela varredura de recuperação (task_leases.claim_orphans)
+    a partir do último checkpoint. Entram como um lote, na prioridade "batch": a
+    retomada depois de um deploy não passa na frente dos pedidos novos.
+    """
+    if not records:
+        return None
+    runs = await prepare_claimed_runs(records)
+    batch_id = task_batches.create([record["id"] for record in records], runs)
+    logging.info(f"Recovery batch {batch_id}: {len(records)} task(s), {len(runs)} resumed run(s).")
+    return batch_id
+
+async def prepare_claimed_runs(records: List[Dict[str, Any]]) -> List[BatchRun]:
+    """
+    Execuções das tarefas assumidas por este processo (linhas de async_tasks com
+    o checkpoint): recuperação de órfãs ou tarefas tiradas da fila por um worker.
+    Resolve cache e single-flight como os endpoints; tarefas sem checkpoint falham.
+    """
+    crew_service = await load_crew_service()
+    resumable = []
+    for record in records:
+        task_registry.register(record)
+        inputs = (record.get("checkpoint") or {}).get("inputs")
+        if crew_service is None or not inputs:
+            report_event(record["id"], "failed", error="Tarefa interrompida sem checkpoint para retomada.")
+        else:
+            resumable.append(record)
+
+    claims: Dict[str, tuple] = {}
+    for record in resumable:
+        cache_key = crew_service.niche_cache_key(record["checkpoint"]["inputs"])
+        cached_result = niche_result_cache.get(cache_key)
+        if cached_result is not None:
+            report_event(record["id"], "completed", result=cached_result)
+        else:
+            claims[record["id"]] = (cache_key, *niche_result_cache.claim(cache_key))
+    leaders = [record["project_id"] for record in resumable if record["id"] in claims and claims[record["id"]][2]]
+    previous = await _load_previous_analyses(leaders)
+
+    runs = []
+    for record in resumable:
+        if record["id"] not in claims:
+            continue
+        cache_key, shared_run, is_leader = claims[record["id"]]
+        checkpoint = record["checkpoint"]
+        if is_leader:
+            runs.append(BatchRun(
+                record["id"], crew_service.run_niche_analysis_task,
+                {"task_id": record["id"], "inputs": checkpoint["inputs"], "previous": previous.get(record["project_id"]),
+                 "seed_niches": checkpoint.get("seed_niches"), "checkpoint": checkpoint},
+                on_done=functools.partial(_on_analysis_done, cache_key,
+                                          crew_service.niche_semantic_text(checkpoint["inputs"]),
+                                          crew_service.niche_cache_scope()),
+                user=record.get("user_id"),
+            ))
+        else:
+            shared_run.add_done_callback(functools.partial(_complete_follower_task, record["id"]))
+    if len(resumable) < len(records):
+        logging.warning(f"{len(records) - len(resumable)} claimed task(s) had no checkpoint to resume from.")
+    return runs
+
+def _complete_follower_task(task_id: str, shared_run):
+    # Roda na thread que concluiu a execução líder; publica o evento final do
+    # seguidor (o task_registry grava o status e o SSE é notificado)
+    error = shared_run.exception()
+    if error is None:
+        report_event(task_id, "completed", result=shared_run.result())
+    else:
+        report_event(task_id, "failed", error=str(error))
+
+@router.get("/{task_id}/status", response_model=BaseTaskOutput, summary="Consulta o Status de uma Tarefa")
+async def get_task_status_endpoint(task_id: str):
+    """
+    Retorna o status atual da tarefa. Servido da memória do processo; só vai ao
+    banco para tarefas que este processo não conhece.
+    """
+    record = task_registry.get(task_id)
+    if record is None:
+        try:
+            uuid.UUID(task_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Formato inválido para task_id.")
+        try:
+            record = await task_registry.load(task_id)
+        except Exception as db_error:
+            logging.error(f"Erro ao consultar tarefa {task_id} no DB: {db_error}", exc_info=True)
+            raise HTTPException(status_code=500, detail="Erro interno ao consultar tarefa.")
+    if record is None:
+        raise HTTPException(status_code=404, detail="Tarefa não encontrada.")
+    return BaseTaskOutput(
+        task_id=task_id,
+        status=record["status"],
+        result=present_result(record.get("result")),
+        error=record.get("error_message"),
     )
 
-# TODO: Adicionar endpoint GET /tasks/{task_id}/status para consultar o status 
\ No newline at end of file
+@router.delete("/{task_id}", response_model=BaseTaskOutput, summary="Cancela uma Tarefa")
+async def cancel_task_endpoint(task_id: str, user_id: str = Depends(get_current_user_id)):
+    """
+    Cancela uma tarefa na fila ou em execução (status CANCELLED). Na fila, ela
+    sai sem rodar; em execução, a Crew para na próxima chamada de LLM (ver
+    task_executor.cancel). Tarefas que aguardavam esta mesma execução
+    (entradas idênticas) terminam como FAILED.
+    """
+    try:
+        uuid.UUID(task_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato inválido para task_id.")
+    record = local = task_registry.get(task_id)
+    if local is None:
+        try:
+            record = await task_registry.load(task_id)
+        except Exception as db_error:
+            logging.error(f"Erro ao consultar tarefa {task_id} no DB: {db_error}", exc_info=True)
+            raise HTTPException(status_code=500, detail="Erro interno ao consultar tarefa.")
+    if record is None or str(record.get("user_id")) != user_id:
+        # Tarefa de outro usuário responde como inexistente
+        raise HTTPException(status_code=404, detail="Tarefa não encontrada.")
+    if local is None and record["status"] not in TERMINAL_STATUSES:
+        # Só o processo que agendou a tarefa consegue tirá-la da fila ou interrompê-la
+        raise HTTPException(status_code=409, detail="Tarefa não está agendada neste servidor.")
+    if record["status"] in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Tarefa já finalizada ({record['status']}).")
+
+    if task_executor.cancel(task_id) is None and not task_batches.cancel(task_id):
+        # Seguidora de uma execução compartilhada: só este registro é encerrado
+        current = task_registry.get(task_id)
+        if current is not None and current["status"] not in TERMINAL_STATUSES:
+            report_event(task_id, "cancelled", error="Task cancelled by request.")
+    record = task_registry.get(task_id) or record
+    return BaseTaskOutput(task_id=task_id, status=record["status"], error=record.get("error_message"))
+
+@router.get("/{task_id}/events", summary="Stream de Progresso da Tarefa (SSE)")
+async def stream_task_events_endpoint(task_id: str, request: Request):
+    """
+    Server-Sent Events com o progresso da tarefa: início/fim de cada etapa da
+    Crew, a saída intermediária da pesquisa e os tokens do LLM conforme são
+    gerados. A conexão é encerrada após o evento `completed` ou `failed`.
+    """
+    if not task_event_bus.knows(task_id):
+        record = task_registry.get(task_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Tarefa não encontrada.")
+        if record["status"] in TERMINAL_STATUSES:
+            # Tarefa já encerrada (ex.: cache hit): envia só o evento final
+            if record["status"] == COMPLETED:
+                final = {"type": "completed", "result": record.get("result")}
+            else:
+                final = {"type": "cancelled" if record["status"] == CANCELLED else "failed",
+                         "error": record.get("error_message")}
+            return StreamingResponse(iter([_format_sse(final)]), media_type="text/event-stream")
+
+    async def event_stream():
+        async for event in task_event_bus.subscribe(task_id):
+            if await request.is_disconnected():
+                break
+            yield ": keepalive\n\n" if event is None else _format_sse(event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _format_sse(event: Dict[str, Any]) -> str:
+    if event["type"] == "completed":
+        event = {**event, "result": present_result(event.get("result"))}
+    data = orjson.dumps(event, default=str, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+@router.get("/executor/stats", summary="Métricas do Pool de Execução das Crews")
+async def executor_stats_endpoint():
+    """Profundidade da fila, tarefas em execução e tempos de fila/execução."""
+    return {**task_executor.stats(), "registry": task_registry.stats(), "result_cache": niche_result_cache.stats(),
+            "semantic_cache": semantic_cache.stats(), "batches": task_batches.stats()}
+
+def _raise_saturated(queue_depth: int, retry_after: Optional[int] = None):
+    if retry_after is None:
+        retry_after = task_executor.estimate_retry_after(queue_depth)
+    logging.warning(f"Rejecting /analyze-niche: executor saturated (queue depth {queue_depth}).")
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail={"message": "Muitas análises em andamento. Tente novamente em instantes.", "queue_depth": queue_depth},
+        headers={"Retry-After": str(retry_after)},
+    )
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from pydantic import BaseModel, Field
 from typing import List, Optional, Any, Dict # Adicionado Dict
-# Importar Supabase client ou dependência de usuário autenticado (faremos depois)
-# from dependencies import get_current_user, get_supabase_client
+import uuid
+import logging
+
+from backend.lib.repository import supabase_repository, RepositoryError
+from backend.services import project_service
 
 router = APIRouter()
 
@@ -31,28 +34,51 @@ class ProjectListRead(BaseModel):
     class Config:
         from_attributes = True
 
-# --- Endpoints (Placeholders - Sem lógica DB ainda) ---
+# --- Dependências ---
+async def get_current_user_id(x_user_id: str = Header(..., description="ID do usuário (Supabase Auth)")) -> str:
+    # TODO: Trocar pelo user_id extraído do JWT do Supabase quando a autenticação chegar na API
+    try:
+        return str(uuid.UUID(x_user_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato inválido para X-User-Id.")
+
+def _require_db():
+    if not supabase_repository.available:
+        logging.error("Aborting projects request: Supabase repository is not available.")
+        raise HTTPException(status_code=503, detail="Conexão com banco de dados não disponível.")
+
+# --- Endpoints ---
 
 @router.post("/", response_model=ProjectRead, status_code=status.HTTP_201_CREATED, summary="Criar Novo Projeto")
-async def create_project(project_data: ProjectCreate):
-    # Lógica placeholder
-    print(f"Recebido pedido para criar projeto: {project_data.nome_projeto}")
-    dummy_user_id = "dummy-user-uuid" # Pegar do token JWT depois
-    dummy_id = "dummy-project-uuid"
-    return ProjectRead(
-        id=dummy_id,
-        user_id=dummy_user_id,
-        nome_projeto=project_data.nome_projeto,
-        estado_progresso={"nicho_persona": None},
-        created_at="2024-01-01T10:00:00Z",
-        updated_at="2024-01-01T10:00:00Z"
-    )
+async def create_project(project_data: ProjectCreate, user_id: str = Depends(get_current_user_id)):
+    _require_db()
+    try:
+        row = await project_service.create_project(user_id, project_data.nome_projeto)
+    except RepositoryError as db_error:
+        logging.error(f"Erro ao criar projeto para o usuário {user_id}: {db_error}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Erro interno ao criar projeto.")
+    logging.info(f"Project {row['id']} created for user {user_id}.")
+    return ProjectRead(**row)
 
 @router.get("/", response_model=List[ProjectListRead], summary="Listar Projetos do Usuário")
-async def list_projects():
-    # Lógica placeholder
-    print("Recebido pedido para listar projetos")
-    return [
-        ProjectListRead(id="proj1", nome_projeto="Meu Primeiro Funil", updated_at="2024-01-02T11:00:00Z"),
-        ProjectListRead(id="proj2", nome_projeto="Projeto Teste CFE", updated_at="2024-01-03T12:00:00Z"),
-    ] 
\ No newline at end of file
+async def list_projects(
+    response: Response,
+    user_id: str = Depends(get_current_user_id),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor da página anterior"),
+):
+    """
+    Lista os projetos mais recentes primeiro. Se houver mais páginas, o cursor da
+    próxima vem no header `X-Next-Cursor`.
+    """
+    _require_db()
+    try:
+        rows, next_cursor = await project_service.list_projects(user_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+    except RepositoryError as db_error:
+        logging.error(f"Erro ao listar projetos do usuário {user_id}: {db_error}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Erro interno ao listar projetos.")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
@@ -1,56 +1,134 @@
-import os
-from crewai import Agent, Task, Crew, Process
-from langchain_openai import ChatOpenAI # Ou seu LLM preferido
-from dotenv import load_dotenv
+from crewai import Agent, Task, Crew, Process, BaseLLM
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import convert_to_messages
 import logging
+import threading
 from typing import Dict, Any, Optional, List
+from backend.lib import telemetry
+from backend.lib.settings import settings
+from backend.services.result_cache import make_cache_key, normalize_terms, normalize_text
+from backend.services.task_executor import report_event, TaskCancelledError
+from backend.services import niche_fanout, llm_gateway
+from backend.specs.niche import CandidateList, NicheList, compact_result, parse_llm_json
 # Importar ferramentas (Ex: Busca Web, RagTool se necessário depois)
 # from crewai_tools import SerperDevTool, RagTool
 
-# Configura logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Este módulo (crewai, langchain, tiktoken) é pesado: a API só o importa no
+# primeiro uso (ver routers/ai_tasks.load_crew_service). Configuração e logging
+# vêm do backend.lib.settings / main.
 
-# Carrega variáveis de ambiente (essencial para API Keys)
-# dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env') # Caminho relativo
-from dotenv import find_dotenv
-env_path = find_dotenv(filename=".env", raise_error_if_not_found=False, usecwd=True) # Procura no dir atual (backend)
-if env_path:
-    logging.info(f"Crew Service: Loading .env file from: {env_path}")
-    load_dotenv(dotenv_path=env_path)
-else:
-    logging.warning("Crew Service: backend/.env file not found.")
 
+# --- Streaming de Progresso ---
+# Cada worker roda uma tarefa por vez, então a tarefa corrente fica num thread-local
+# e o LLM compartilhado consegue rotear os tokens para a tarefa certa. O handler
+# vai em cada chamada dos Agents (GatewayCrewLLM), não no LLM compartilhado.
+_stream_context = threading.local()
+
+class _TokenForwarder(BaseCallbackHandler):
+    """Publica os tokens gerados pelo LLM como eventos `token` da tarefa corrente."""
+    flush_chars = 32 # Agrupa tokens para não gerar um evento por sílaba
+    run_inline = True # Em chamadas async, roda na própria thread (o thread-local continua válido)
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        task_id = getattr(_stream_context, "task_id", None)
+        if not task_id:
+            return
+        _stream_context.buffer = getattr(_stream_context, "buffer", "") + token
+        if len(_stream_context.buffer) >= self.flush_chars or "\n" in token:
+            self._flush(task_id)
+
+    def on_llm_end(self, response, **kwargs):
+        task_id = getattr(_stream_context, "task_id", None)
+        if task_id:
+            self._flush(task_id)
+
+    @staticmethod
+    def _flush(task_id: str):
+        text = getattr(_stream_context, "buffer", "")
+        if text:
+            report_event(task_id, "token", step=getattr(_stream_context, "step", None), text=text)
+        _stream_context.buffer = ""
+
+_token_forwarder = _TokenForwarder()
+
+def _end_step_span():
+    handle = getattr(_stream_context, "step_span", None)
+    if handle is not None:
+        _stream_context.step_span = None
+        telemetry.end_span(handle)
+
+def _set_step(task_id: str, step: Optional[str]):
+    _TokenForwarder._flush(task_id)
+    _end_step_span()
+    _stream_context.step = step
+    if step:
+        report_event(task_id, "step_started", step=step)
+        # As chamadas de LLM da etapa viram spans filhos deste
+        _stream_context.step_span = telemetry.start_span(f"crew.{step}", task_id=task_id)
+
+def _on_research_done(task_id: str, output):
+    # Saída intermediária: a lista de nichos já pode ser exibida antes da validação
+    raw = getattr(output, "raw", str(output))
+    try:
+        niches = [niche.model_dump(exclude_none=True) for niche in parse_llm_json(raw, CandidateList).nichos]
+    except ValueError:
+        niches = raw # Fora do formato pedido: vai o texto mesmo
+    report_event(task_id, "step_finished", step="research", output=niches)
+    # Checkpoint durável: se o processo cair, a retomada roda só a validação
+    report_event(task_id, "checkpoint", checkpoint={"stage": "validation", "research": raw})
+    _set_step(task_id, "validation")
+
+def _on_validation_done(task_id: str, output):
+    report_event(task_id, "step_finished", step="validation")
+    _set_step(task_id, None)
+
+# --- Configuração LLM (Centralizada no llm_gateway) ---
+get_llm_settings = llm_gateway.get_llm_settings
 
-# --- Configuração LLM (Centralizada) ---
-# Cache simples para evitar reinicializar LLM toda hora
-_crew_llm = None
 def get_crew_llm():
-    global _crew_llm
-    if _crew_llm is None:
-        logging.info("Initializing LLM for CrewAI...")
-        try:
-            api_key = os.getenv("OPENAI_API_KEY") # Adapte se usar outro LLM/key name
-            if not api_key:
-                raise ValueError("API Key for CrewAI LLM (e.g., OPENAI_API_KEY) not found in environment variables.")
-            _crew_llm = ChatOpenAI(
-                # model=os.getenv("CREWAI_LLM_MODEL", "gpt-4o"), # Usar modelo mais potente se tiver
-                model=os.getenv("CREWAI_LLM_MODEL", "gpt-3.5-turbo"), # Começar com gpt-3.5 para testes
-                temperature=float(os.getenv("CREWAI_LLM_TEMPERATURE", 0.3))
-            )
-            logging.info("CrewAI LLM initialized successfully.")
-        except ValueError as ve:
-            logging.error(ve)
-            _crew_llm = None # Garante que não será usado se falhar
-        except Exception as e:
-            logging.error(f"Unexpected error initializing CrewAI LLM: {e}", exc_info=True)
-            _crew_llm = None
-    return _crew_llm
+    # LLM compartilhado do gateway (rate limit, retry, orçamento e contabilização de tokens)
+    try:
+        return llm_gateway.get_llm()
+    except ValueError as ve:
+        logging.error(ve)
+    except Exception as e:
+        logging.error(f"Unexpected error initializing CrewAI LLM: {e}", exc_info=True)
+    return None
+
+class GatewayCrewLLM(BaseLLM):
+    """
+    LLM dos Agents da Crew sobre o GatewayChatOpenAI compartilhado. O crewai
+    troca qualquer `llm=` que não seja um BaseLLM por um crewai.LLM (LiteLLM),
+    e as chamadas pulariam o rate limit, o orçamento e a contabilização do gateway.
+    """
+
+    def __init__(self, llm):
+        super().__init__(model=llm.model_name, temperature=llm.temperature)
+        self.llm = llm
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None) -> str:
+        # `callbacks` do crewai são handlers do LiteLLM: a contagem de tokens fica com o gateway
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        message = self.llm.invoke(convert_to_messages(messages), stop=self.stop or None,
+                                  config={"callbacks": [_token_forwarder]}) # Tokens -> eventos SSE da tarefa corrente
+        return message.content
+
+    def supports_function_calling(self) -> bool:
+        return False # Os Agents não usam ferramentas (nem output_pydantic) por enquanto
+
+    def get_context_window_size(self) -> int:
+        return settings.llm_max_prompt_tokens # Acima disso o gateway recusa o prompt
 
 # --- Definição: Niche Analysis Crew ---
-def create_niche_analysis_crew(passions: List[str], skills: List[str], initial_idea: Optional[str] = None):
+def create_niche_analysis_crew(passions: List[str], skills: List[str], initial_idea: Optional[str] = None,
+                               task_id: Optional[str] = None, seed_niches: Optional[List[str]] = None,
+                               research_output: Optional[str] = None):
+    # Com `research_output` (checkpoint de uma execução interrompida), a Crew só tem a validação
     llm = get_crew_llm()
     if not llm:
         raise RuntimeError("LLM for CrewAI could not be initialized.")
+    llm = GatewayCrewLLM(llm)
 
     # TODO: Adicionar ferramentas como SerperDevTool ou RagTool se precisar de pesquisa web/docs
     # search_tool = SerperDevTool(api_key=os.getenv("SERPER_API_KEY"))
@@ -93,49 +171,130 @@ def create_niche_analysis_crew(passions: List[str], skills: List[str], initial_i
                          - Quem é o público principal?
                          - Quais são os principais problemas/desejos desse público relacionados ao nicho?
                          - Quem são 1-2 concorrentes notáveis (se houver)?
-                      4. Formate a saída de forma clara e concisa.""",
-      expected_output="""Uma lista de 5-7 nichos potenciais, cada um com:
-                         - Nome do Nicho
-                         - Breve descrição da tendência
-                         - Público Principal
-                         - Problemas/Desejos Chave
-                         - 1-2 Concorrentes Notáveis (ou 'Pouca concorrência aparente')""",
+                      4. Responda APENAS com JSON, sem texto fora dele.{_seed_hint(seed_niches)}""",
+      expected_output=f"""Um array JSON com 5-7 nichos potenciais, cada um um objeto com as chaves:
+                         - "nicho": nome do nicho
+                         - "tendencia": breve descrição da tendência
+                         - "publico": público principal
+                         - "problemas": lista dos problemas/desejos chave
+                         - "concorrentes": lista com 1-2 concorrentes notáveis (vazia se houver pouca concorrência aparente)
+                         - "paixoes": quais das paixões {passions} o nicho aproveita
+                         - "habilidades": quais das habilidades {skills} o nicho aproveita
+                         - "ideia_inicial": true apenas para o nicho da ideia inicial do usuário""",
       agent=researcher,
+      callback=(lambda output: _on_research_done(task_id, output)) if task_id else None,
     )
 
     # Tarefa 2: Validação e Ranking
     task_validation = Task(
-      description=f"""1. Analise a lista de nichos fornecida pelo pesquisador (no contexto).
+      description=f"""1. Analise a lista de nichos {_research_source(research_output)}
                       2. Para cada nicho, avalie o potencial de demanda e monetização especificamente para
                          um empreendedor digital iniciante criar produtos. Considere a facilidade de entrada
                          e a intensidade da concorrência.
                       3. Atribua um score de viabilidade (0-100) para cada nicho, onde 100 é o mais promissor.
                       4. Forneça uma breve justificativa (1-2 frases) para o score de cada nicho.
-                      5. Ordene a lista final do nicho mais promissor para o menos promissor.""",
-      expected_output="""Uma lista ordenada de nichos (do maior score para o menor), cada um com:
-                         - Nome do Nicho
-                         - Score de Viabilidade (0-100)
-                         - Justificativa do Score (1-2 frases)""",
+                      5. Ordene a lista final do nicho mais promissor para o menos promissor.
+                      6. Responda APENAS com JSON, sem texto fora dele.""",
+      expected_output="""Um array JSON ordenado (do maior score para o menor) com os mesmos objetos da pesquisa,
+                         mantendo todas as chaves ("nicho", "tendencia", "publico", "problemas", "concorrentes",
+                         "paixoes", "habilidades", "ideia_inicial") e acrescentando:
+                         - "score": score de viabilidade, inteiro de 0 a 100
+                         - "justificativa": justificativa do score em 1-2 frases""",
       agent=validator,
-      context=[task_research] # Depende do resultado da tarefa anterior
+      context=[task_research] if research_output is None else [], # Depende do resultado da tarefa anterior
+      callback=(lambda output: _on_validation_done(task_id, output)) if task_id else None,
     )
 
     # --- Montagem da Crew ---
+    resumed = research_output is not None
     niche_crew = Crew(
-      agents=[researcher, validator],
-      tasks=[task_research, task_validation],
+      agents=[validator] if resumed else [researcher, validator],
+      tasks=[task_validation] if resumed else [task_research, task_validation],
       process=Process.sequential,
       verbose=1 # 0=silencioso, 1=processo, 2=debug
       # memory=True # Ativar memória se necessário para conversas mais longas
     )
     return niche_crew
 
+def _research_source(research_output: Optional[str]) -> str:
+    if research_output is None:
+        return "fornecida pelo pesquisador (no contexto)."
+    # Placeholder preenchido no kickoff: o JSON da pesquisa tem chaves que o template da Crew interpretaria
+    return """já produzida pelo pesquisador:
+                         {pesquisa_checkpoint}"""
+
+def _seed_hint(seed_niches: Optional[List[str]]) -> str:
+    if not seed_niches:
+        return ""
+    return f"""
+                      5. Como ponto de partida, uma análise anterior com entradas parecidas chegou aos nichos
+                         {seed_niches}. Reaproveite os que fizerem sentido para estas paixões e habilidades."""
+
+# --- Modo de Execução ---
+# "crew": Crew sequencial (pesquisador -> validador).
+# "fanout": lista os candidatos e pesquisa/pontua cada nicho em paralelo (ver niche_fanout).
+def get_analysis_mode() -> str:
+    mode = settings.niche_analysis_mode.lower()
+    if mode not in ("crew", "fanout"):
+        logging.warning(f"Unknown NICHE_ANALYSIS_MODE '{mode}', falling back to 'crew'.")
+        return "crew"
+    return mode
+
+# --- Chave de Cache ---
+def niche_cache_scope() -> str:
+    """Modo, modelo e temperatura: análises de escopos diferentes não se substituem."""
+    model, temperature = get_llm_settings()
+    return f"{get_analysis_mode()}|{model}|{temperature}"
+
+def niche_semantic_text(inputs: Dict[str, Any]) -> str:
+    """Entradas normalizadas em texto, para o embedding do cache semântico."""
+    return "; ".join([
+        f"paixões: {', '.join(normalize_terms(inputs.get('passions', [])))}",
+        f"habilidades: {', '.join(normalize_terms(inputs.get('skills', [])))}",
+        f"ideia: {normalize_text(inputs.get('initial_idea'))}",
+    ])
+
+def niche_cache_key(inputs: Dict[str, Any]) -> str:
+    """Chave canônica da análise: entradas normalizadas + modo, modelo e temperatura do LLM."""
+    model, temperature = get_llm_settings()
+    return make_cache_key({
+        "task": "ANALYZE_NICHE",
+        "mode": get_analysis_mode(),
+        "passions": normalize_terms(inputs.get("passions", [])),
+        "skills": normalize_terms(inputs.get("skills", [])),
+        "initial_idea": normalize_text(inputs.get("initial_idea")),
+        "model": model,
+        "temperature": temperature,
+    })
+
+def niche_result_inputs(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Entradas normalizadas, como ficam no campo `inputs` do resultado."""
+    return {"passions": normalize_terms(inputs.get("passions", [])), "skills": normalize_terms(inputs.get("skills", [])),
+            "initial_idea": normalize_text(inputs.get("initial_idea"))}
+
+def _result_context(passions: List[str], skills: List[str], initial_idea: Optional[str], model: str) -> Dict[str, Any]:
+    # Entradas normalizadas e modelo: base da comparação na próxima análise do projeto
+    return {
+        "inputs": niche_result_inputs({"passions": passions, "skills": skills, "initial_idea": initial_idea}),
+        "model": model,
+    }
+
 # --- Função para Executar a Crew ---
-# Esta função será chamada em background pela API
-def run_niche_analysis_task(task_id: str, inputs: Dict[str, Any]):
+# Esta função será chamada em background pela API (via task_executor).
+# Retorna o resultado estruturado (specs.niche.NicheAnalysisResult, já
+# serializado) para que a API possa cacheá-lo e gravá-lo em async_tasks.result.
+# `previous` é a última análise por nicho do projeto (estado_progresso.analise_nicho):
+# com entradas pouco alteradas, só os nichos afetados são refeitos (niche_fanout.plan_incremental).
+# `seed_niches` são os nichos de uma análise com entradas parecidas (cache semântico),
+# usados como ponto de partida da pesquisa.
+# `checkpoint` é o último estado gravado (async_tasks.checkpoint) de uma execução
+# interrompida: a retomada pula as etapas já concluídas (ver task_recovery).
+def run_niche_analysis_task(task_id: str, inputs: Dict[str, Any], previous: Optional[Dict[str, Any]] = None,
+                            seed_niches: Optional[List[str]] = None,
+                            checkpoint: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     logging.info(f"Starting niche analysis task {task_id} with inputs: {inputs}")
-    # TODO: Atualizar status da tarefa no Supabase para 'PROCESSING'
-    # supabase.table('async_tasks').update({'status': 'PROCESSING'}).eq('id', task_id).execute()
+    # O status em async_tasks (PROCESSING/COMPLETED/FAILED) é atualizado pelo
+    # task_registry a partir dos eventos do task_executor.
 
     try:
         passions = inputs.get("passions", [])
@@ -145,15 +304,63 @@ def run_niche_analysis_task(task_id: str, inputs: Dict[str, Any]):
         if not passions or not skills:
             raise ValueError("Paixões e Habilidades são necessárias para a análise de nicho.")
 
-        crew = create_niche_analysis_crew(passions, skills, initial_idea)
-        result = crew.kickoff(inputs=inputs) # Passa inputs se tarefas os usarem diretamente
+        model, _ = get_llm_settings()
+        plan = None
+        if previous and settings.niche_incremental:
+            plan = niche_fanout.plan_incremental(previous, passions, skills, initial_idea, model)
 
-        logging.info(f"Niche analysis task {task_id} completed. Result: {result}")
-        # TODO: Atualizar status e resultado da tarefa no Supabase para 'COMPLETED'
-        # final_result = {"analysis": result} # Estruture como quiser
-        # supabase.table('async_tasks').update({'status': 'COMPLETED', 'result': final_result}).eq('id', task_id).execute()
+        # O caminho incremental usa as chamadas por nicho do fanout em qualquer modo
+        if plan is not None or get_analysis_mode() == "fanout":
+            llm = get_crew_llm()
+            if not llm:
+                raise RuntimeError("LLM for CrewAI could not be initialized.")
+            # Sem task_id no thread-local: tokens de nichos paralelos se misturariam no stream
+            with llm_gateway.task_scope(task_id):
+                final_result = llm_gateway.run_sync(
+                    niche_fanout.run_fanout_analysis(llm, passions, skills, initial_idea, task_id=task_id,
+                                                     plan=plan, seed=seed_niches, checkpoint=checkpoint)
+                )
+            final_result = compact_result(final_result["niches"], incremental=final_result.get("incremental"),
+                                          **_result_context(passions, skills, initial_idea, model))
+            kind = "incremental" if plan is not None else "fanout"
+            logging.info(f"Niche analysis task {task_id} completed ({kind}, {len(final_result['niches'])} niches).")
+            return final_result
+
+        research_output = (checkpoint or {}).get("research")
+        if research_output is not None:
+            logging.info(f"Niche analysis task {task_id} resuming from checkpoint (research done).")
+        crew = create_niche_analysis_crew(passions, skills, initial_idea, task_id=task_id, seed_niches=seed_niches,
+                                          research_output=research_output)
+        _stream_context.task_id = task_id
+        _set_step(task_id, "research" if research_output is None else "validation")
+        with llm_gateway.task_scope(task_id):
+            kickoff_inputs = inputs if research_output is None else {**inputs, "pesquisa_checkpoint": research_output}
+            result = crew.kickoff(inputs=kickoff_inputs) # Passa inputs se tarefas os usarem diretamente
+
+        raw = getattr(result, "raw", str(result))
+        try:
+            niches = [niche.model_dump(exclude_none=True) for niche in parse_llm_json(raw, NicheList).nichos]
+        except ValueError as e:
+            # Saída fora do formato falha a tarefa: um texto sem validação não entra nos caches
+            # nem vira a análise anterior do projeto (base da reanálise incremental)
+            logging.warning(f"Niche analysis task {task_id}: crew output is not a valid niche list: {raw[:500]!r}")
+            raise ValueError(f"A análise gerada não está no formato esperado: {e}") from e
+        niche_fanout.attribute_origin(niches, raw, passions, skills)
+        niches.sort(key=lambda niche: niche["score"], reverse=True)
+        logging.info(f"Niche analysis task {task_id} completed (crew, {len(niches)} niches).")
+        return compact_result(niches, **_result_context(passions, skills, initial_idea, model))
 
+    except TaskCancelledError:
+        logging.info(f"Niche analysis task {task_id} stopped: cancelled by request.")
+        raise
     except Exception as e:
         logging.error(f"Error running niche analysis task {task_id}: {e}", exc_info=True)
-        # TODO: Atualizar status e erro da tarefa no Supabase para 'FAILED'
-        # supabase.table('async_tasks').update({'status': 'FAILED', 'error_message': str(e)}).eq('id', task_id).execute()
+        raise # Propaga para o executor marcar FAILED e não cachear a falha
+    finally:
+        _end_step_span()
+        _stream_context.task_id = None
+        _stream_context.step = None
+        # Tokens e custo da tarefa -> registro em async_tasks (via task_registry)
+        usage = llm_gateway.pop_task_usage(task_id)
+        if usage:
+            report_event(task_id, "usage", usage=usage)
@@ -0,0 +1,345 @@
+# backend/services/llm_gateway.py
+# Ponto único de acesso ao LLM para todas as Crews/modos de análise:
+# - um ChatOpenAI compartilhado com pool HTTP reaproveitado (sync e async);
+# - limitador token-bucket de RPM e TPM, respeitado antes de cada chamada;
+# - retry com backoff exponencial + jitter (e Retry-After) em 429/timeouts/5xx;
+# - orçamento rígido de tokens de prompt (contados com tiktoken) e de resposta;
+# - contabilização de tokens e custo por tarefa.
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Coroutine, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+import tiktoken
+from langchain_openai import ChatOpenAI
+
+from backend.lib import telemetry
+from backend.lib.settings import settings
+from backend.services.task_executor import report_event, raise_if_cancelled
+
+logger = logging.getLogger(__name__)
+
+_RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                     openai.InternalServerError)
+
+# Preço em USD por 1K tokens (entrada, saída). Sobrescreva com LLM_PRICE_INPUT_PER_1K / LLM_PRICE_OUTPUT_PER_1K.
+_PRICES_PER_1K = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+}
+
+
+class TokenBudgetExceeded(Exception):
+    """O prompt (ou o total da tarefa) passa do orçamento configurado; a chamada não é enviada."""
+
+
+def get_llm_settings() -> Tuple[str, float]:
+    # Modelo e temperatura também fazem parte da chave do cache de resultados
+    return settings.crewai_llm_model, settings.crewai_llm_temperature
+
+
+# --- Rate limiting ---
+class TokenBucket:
+    """Balde de tokens com reposição contínua; `rate_per_minute <= 0` desativa o limite."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.refill_per_second = self.capacity / 60.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _reserve(self, amount: float) -> float:
+        # Retorna 0 se reservou; senão, quantos segundos esperar antes de tentar de novo
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_second)
+            self._updated = now
+            amount = min(amount, self.capacity) # Uma chamada maior que o balde espera encher
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.refill_per_second
+
+    def acquire(self, amount: float = 1):
+        if not self.enabled:
+            return
+        while (wait := self._reserve(amount)) > 0:
+            time.sleep(min(wait, 5.0) * (1 + random.random() * 0.1))
+
+    async def acquire_async(self, amount: float = 1):
+        if not self.enabled:
+            return
+        while (wait := self._reserve(amount)) > 0:
+            await asyncio.sleep(min(wait, 5.0) * (1 + random.random() * 0.1))
+
+    def refund(self, amount: float):
+        if not self.enabled or amount <= 0:
+            return
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+_rpm_bucket = TokenBucket(settings.llm_rpm_limit)
+_tpm_bucket = TokenBucket(settings.llm_tpm_limit)
+
+
+# --- Contagem de tokens / orçamento ---
+_encodings: Dict[str, Any] = {}
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    model = model or get_llm_settings()[0]
+    if model not in _encodings:
+        try:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # tiktoken baixa os arquivos BPE no primeiro uso; sem rede, usa estimativa
+            logger.warning(f"tiktoken encoding unavailable for {model} ({e}); estimating ~4 chars/token.")
+            _encodings[model] = None
+    encoding = _encodings[model]
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def _count_messages(messages, model: str) -> int:
+    # ~4 tokens de overhead por mensagem no formato de chat da OpenAI
+    return sum(count_tokens(str(m.content), model) + 4 for m in messages) + 2
+
+def _budgets() -> Tuple[int, int, int]:
+    return settings.llm_max_prompt_tokens, settings.llm_max_response_tokens, settings.llm_task_token_budget
+
+
+# --- Contabilização por tarefa ---
+_current_task: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("llm_current_task", default=None)
+_usage_lock = threading.Lock()
+_usage: Dict[str, Dict[str, Any]] = {}
+
+@contextmanager
+def task_scope(task_id: str):
+    """Atribui as chamadas de LLM feitas dentro do bloco à tarefa `task_id`."""
+    token = _current_task.set(task_id)
+    try:
+        yield
+    finally:
+        _current_task.reset(token)
+
+def _record_usage(model: str, prompt_tokens: int, completion_tokens: int):
+    task_id = _current_task.get()
+    if not task_id:
+        return
+    price_in, price_out = _PRICES_PER_1K.get(model, (0.0, 0.0))
+    if settings.llm_price_input_per_1k is not None:
+        price_in = settings.llm_price_input_per_1k
+    if settings.llm_price_output_per_1k is not None:
+        price_out = settings.llm_price_output_per_1k
+    with _usage_lock:
+        usage = _usage.setdefault(task_id, {"model": model, "calls": 0, "prompt_tokens": 0,
+                                            "completion_tokens": 0, "cost_usd": 0.0})
+        usage["calls"] += 1
+        usage["prompt_tokens"] += prompt_tokens
+        usage["completion_tokens"] += completion_tokens
+        usage["cost_usd"] = round(usage["cost_usd"] + prompt_tokens / 1000 * price_in
+                                  + completion_tokens / 1000 * price_out, 6)
+
+def get_task_usage(task_id: str) -> Optional[Dict[str, Any]]:
+    with _usage_lock:
+        usage = _usage.get(task_id)
+        return dict(usage) if usage else None
+
+def pop_task_usage(task_id: str) -> Optional[Dict[str, Any]]:
+    with _usage_lock:
+        return _usage.pop(task_id, None)
+
+
+# --- Retry ---
+def _retry_delay(error: Exception, attempt: int) -> float:
+    retry_after = getattr(getattr(error, "response", None), "headers", {}).get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after) + random.random()
+        except ValueError:
+            pass
+    return random.uniform(0, settings.llm_retry_base_seconds * (2 ** attempt)) # "Full jitter": evita tempestade de retries sincronizados
+
+
+# --- Observabilidade ---
+@contextmanager
+def _instrumented_call(model: str, prompt_tokens: int):
+    """Span `llm.call` + histograma de duração e contagem de tokens da chamada (com retries)."""
+    started = time.perf_counter()
+    call = {"outcome": "error", "attempts": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    with telemetry.span("llm.call", **{"gen_ai.system": "openai", "gen_ai.request.model": model,
+                                       "llm.prompt_tokens_estimate": prompt_tokens}) as span:
+        try:
+            yield call
+            call["outcome"] = "ok"
+        finally:
+            seconds = time.perf_counter() - started
+            telemetry.set_attributes(span, **{"gen_ai.usage.input_tokens": call["prompt_tokens"],
+                                              "gen_ai.usage.output_tokens": call["completion_tokens"],
+                                              "llm.attempts": call["attempts"]})
+            task_id = _current_task.get()
+            if task_id:
+                # Via evento: no modo processo a métrica precisa chegar ao processo da API
+                report_event(task_id, "llm_call", model=model, seconds=seconds, outcome=call["outcome"],
+                             prompt_tokens=call["prompt_tokens"], completion_tokens=call["completion_tokens"])
+            else:
+                telemetry.observe_llm_call(model, seconds, call["outcome"], call["prompt_tokens"],
+                                           call["completion_tokens"])
+
+
+class GatewayChatOpenAI(ChatOpenAI):
+    """ChatOpenAI que passa pelo orçamento, rate limit, retry e contabilização do gateway."""
+
+    def _admit(self, messages) -> Tuple[int, int]:
+        max_prompt, max_response, task_budget = _budgets()
+        prompt_tokens = _count_messages(messages, self.model_name)
+        if prompt_tokens > max_prompt:
+            raise TokenBudgetExceeded(f"Prompt has {prompt_tokens} tokens (budget {max_prompt}).")
+        task_id = _current_task.get()
+        raise_if_cancelled(task_id) # DELETE da tarefa em execução: para antes de gastar mais tokens
+        if task_budget and task_id:
+            used = get_task_usage(task_id) or {}
+            spent = used.get("prompt_tokens", 0) + used.get("completion_tokens", 0)
+            if spent + prompt_tokens + max_response > task_budget:
+                raise TokenBudgetExceeded(f"Task {task_id} would exceed its token budget ({task_budget}).")
+        return prompt_tokens, prompt_tokens + (self.max_tokens or max_response)
+
+    def _settle(self, result, reserved: int, prompt_tokens: int):
+        message = result.generations[0].message if result.generations else None
+        usage = getattr(message, "usage_metadata", None) or {}
+        token_usage = (result.llm_output or {}).get("token_usage") or {}
+        used_prompt = usage.get("input_tokens") or token_usage.get("prompt_tokens") or prompt_tokens
+        used_completion = usage.get("output_tokens") or token_usage.get("completion_tokens") or 0
+        _tpm_bucket.refund(reserved - used_prompt - used_completion) # Devolve o que foi reservado a mais
+        _record_usage(self.model_name, used_prompt, used_completion)
+        return used_prompt, used_completion
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt_tokens, reserved = self._admit(messages)
+        max_retries = settings.llm_max_retries
+        with _instrumented_call(self.model_name, prompt_tokens) as call:
+            for attempt in range(max_retries + 1):
+                _rpm_bucket.acquire(1)
+                _tpm_bucket.acquire(reserved)
+                call["attempts"] = attempt + 1
+                try:
+                    result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+                    break
+                except _RETRYABLE_ERRORS as e:
+                    _tpm_bucket.refund(reserved)
+                    if attempt == max_retries:
+                        raise
+                    delay = _retry_delay(e, attempt)
+                    logger.warning(f"LLM call failed ({type(e).__name__}); retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+                    time.sleep(delay)
+            call["prompt_tokens"], call["completion_tokens"] = self._settle(result, reserved, prompt_tokens)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt_tokens, reserved = self._admit(messages)
+        max_retries = settings.llm_max_retries
+        with _instrumented_call(self.model_name, prompt_tokens) as call:
+            for attempt in range(max_retries + 1):
+                await _rpm_bucket.acquire_async(1)
+                await _tpm_bucket.acquire_async(reserved)
+                call["attempts"] = attempt + 1
+                try:
+                    result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+                    break
+                except _RETRYABLE_ERRORS as e:
+                    _tpm_bucket.refund(reserved)
+                    if attempt == max_retries:
+                        raise
+                    delay = _retry_delay(e, attempt)
+                    logger.warning(f"LLM call failed ({type(e).__name__}); retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+            call["prompt_tokens"], call["completion_tokens"] = self._settle(result, reserved, prompt_tokens)
+        return result
+
+
+# --- Instância compartilhada ---
+_llm: Optional[GatewayChatOpenAI] = None
+_llm_lock = threading.Lock()
+_transports: Tuple[Optional[httpx.BaseTransport], Optional[httpx.AsyncBaseTransport]] = (None, None)
+
+def set_http_transports(transport: Optional[httpx.BaseTransport] = None,
+                        async_transport: Optional[httpx.AsyncBaseTransport] = None):
+    """Troca o transporte HTTP do LLM (ex.: LLM falso do benchmark). Vale a partir do próximo get_llm()."""
+    global _llm, _transports
+    with _llm_lock:
+        _transports = (transport, async_transport)
+        _llm = None
+
+def get_llm(callbacks: Optional[List[Any]] = None) -> GatewayChatOpenAI:
+    """
+    Retorna o LLM compartilhado (criado na primeira chamada). Levanta ValueError
+    se a API key não estiver configurada.
+    """
+    global _llm
+    if _llm is not None:
+        return _llm
+    with _llm_lock:
+        if _llm is None:
+            if not settings.openai_api_key: # Adapte se usar outro LLM/key name
+                raise ValueError("API Key for CrewAI LLM (e.g., OPENAI_API_KEY) not found in environment variables.")
+            model, temperature = get_llm_settings()
+            timeout = settings.llm_timeout_seconds
+            pool = settings.llm_max_connections
+            limits = httpx.Limits(max_connections=pool, max_keepalive_connections=pool)
+            _llm = GatewayChatOpenAI(
+                model=model,
+                temperature=temperature,
+                max_tokens=_budgets()[1],
+                timeout=timeout,
+                max_retries=0, # Os retries ficam com o gateway (com jitter e rate limit)
+                api_key=settings.openai_api_key,
+                streaming=settings.crewai_llm_streaming,
+                stream_usage=True, # Uso de tokens também no modo streaming
+                callbacks=callbacks,
+                # Pools HTTP reaproveitados entre chamadas (o async vive no loop do gateway)
+                http_client=httpx.Client(limits=limits, timeout=timeout, transport=_transports[0]),
+                http_async_client=httpx.AsyncClient(limits=limits, timeout=timeout, transport=_transports[1]),
+            )
+            logging.info(f"LLM gateway initialized ({model}, rpm={_rpm_bucket.capacity:g}, tpm={_tpm_bucket.capacity:g}).")
+    return _llm
+
+
+# --- Loop de eventos do gateway ---
+# As chamadas async rodam sempre no mesmo loop (numa thread dedicada), para que
+# o httpx.AsyncClient compartilhado nunca seja usado por loops diferentes.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-gateway-loop", daemon=True).start()
+    return _loop
+
+def run_sync(coro: Coroutine) -> Any:
+    """Executa `coro` no loop do gateway e espera o resultado (chamado das threads de worker)."""
+    task_id = _current_task.get()
+    trace_context = telemetry.current_context() # Spans do loop do gateway continuam filhos da tarefa
+
+    async def _scoped():
+        with task_scope(task_id), telemetry.use_context(trace_context):
+            return await coro
+
+    return asyncio.run_coroutine_threadsafe(_scoped(), _get_loop()).result()
@@ -0,0 +1,302 @@
+# backend/services/niche_fanout.py
+# Modo "fanout" da análise de nicho: em vez de um pesquisador gerar todos os
+# nichos numa única chamada longa e o validador pontuar tudo depois, primeiro
+# lista os candidatos (chamada curta) e então pesquisa + pontua cada nicho em
+# paralelo, com limite de concorrência e timeout por chamada.
+#
+# Cada nicho guarda de quais paixões/habilidades veio (`origem`). Numa nova
+# análise do mesmo projeto com entradas pouco alteradas, `plan_incremental`
+# mantém os nichos não afetados e só os nichos novos são pesquisados.
+import json
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import json_repair
+
+from backend.lib import telemetry
+from backend.lib.settings import settings
+from backend.services.result_cache import normalize_terms, normalize_text
+from backend.services.task_executor import report_event, TaskCancelledError
+from backend.specs.niche import Niche, NicheOrigin, parse_llm_json
+
+logger = logging.getLogger(__name__)
+
+
+def _fanout_settings():
+    return (
+        settings.niche_fanout_concurrency,
+        settings.niche_fanout_timeout_seconds,
+    )
+
+def _parse_json(text: str) -> Any:
+    # O LLM às vezes devolve JSON dentro de ```json ... ``` ou com vírgulas sobrando
+    return json_repair.loads(text)
+
+
+# Tamanho da lista final de nichos (mesma faixa pedida à Crew)
+MIN_NICHES, MAX_NICHES = 5, 7
+
+def _enumerate_prompt(passions: List[str], skills: List[str], initial_idea: Optional[str],
+                      count: Tuple[int, int] = (MIN_NICHES, MAX_NICHES), focus: Optional[List[str]] = None,
+                      exclude: Optional[List[str]] = None) -> str:
+    idea = f"\nInclua também a ideia inicial do usuário como um dos nichos: '{initial_idea}'." if initial_idea else ""
+    focus_text = f"\nPriorize nichos que envolvam especialmente: {focus}." if focus else ""
+    exclude_text = f"\nNão repita nenhum destes nichos, já analisados: {exclude}." if exclude else ""
+    return f"""Você é um Analista de Mercado Digital Experiente, especializado em produtos de informação
+(cursos, e-books, mentorias). Baseado nas paixões {passions} e habilidades {skills} do usuário,
+liste de {count[0]} a {count[1]} nichos de mercado potenciais para produtos digitais.{idea}{focus_text}{exclude_text}
+Responda APENAS com um array JSON de objetos com as chaves:
+- "nicho": nome do nicho
+- "paixoes": as paixões do usuário em que o nicho se baseia
+- "habilidades": as habilidades do usuário em que o nicho se baseia
+- "ideia_inicial": true apenas para o nicho da ideia inicial do usuário"""
+
+def _research_prompt(niche: str, passions: List[str], skills: List[str]) -> str:
+    return f"""Você é um Analista de Mercado Digital e Validador de Demanda. Analise o nicho "{niche}"
+para um empreendedor digital iniciante com paixões {passions} e habilidades {skills}.
+Responda APENAS com um objeto JSON com as chaves:
+- "nicho": nome do nicho
+- "tendencia": breve descrição da tendência (crescendo, estável, diminuindo)
+- "publico": público principal
+- "problemas": lista dos principais problemas/desejos desse público
+- "concorrentes": lista com 1-2 concorrentes notáveis (ou vazia se houver pouca concorrência aparente)
+- "score": score de viabilidade de 0 a 100 (demanda, monetização, facilidade de entrada, concorrência)
+- "justificativa": justificativa do score em 1-2 frases"""
+
+
+async def _research_niche(llm, candidate: Dict[str, Any], passions: List[str], skills: List[str],
+                          semaphore: asyncio.Semaphore, timeout: float, task_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    niche = candidate["nicho"]
+    async with semaphore:
+        if task_id:
+            report_event(task_id, "step_started", step="research", niche=niche)
+        try:
+            with telemetry.span("fanout.research", task_id=task_id, niche=niche):
+                message = await asyncio.wait_for(llm.ainvoke(_research_prompt(niche, passions, skills)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Research for niche '{niche}' timed out after {timeout}s; skipping.")
+            return None
+        except TaskCancelledError:
+            raise # Tarefa cancelada: interrompe a análise inteira, não só este nicho
+        except Exception as e:
+            logger.warning(f"Research for niche '{niche}' failed: {e}; skipping.")
+            return None
+    try:
+        data = parse_llm_json(message.content, Niche)
+    except ValueError as e:
+        logger.warning(f"Research for niche '{niche}' returned no valid niche object ({e}); skipping.")
+        return None
+    data.origem = NicheOrigin(**candidate["origem"])
+    data.ideia_inicial = candidate.get("ideia_inicial") or None
+    result = data.model_dump(exclude_none=True)
+    if task_id:
+        report_event(task_id, "step_finished", step="research", niche=niche, output=result)
+    return result
+
+
+def _parse_candidates(content: str, passions: List[str], skills: List[str],
+                      exclude: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Lista de candidatos da enumeração, sem duplicados (nem os de `exclude`).
+    A origem de cada nicho fica restrita às entradas do usuário; sem origem
+    reconhecível, o nicho é atribuído a todas (qualquer mudança o afeta).
+    """
+    candidates = _parse_json(content)
+    if isinstance(candidates, dict):
+        candidates = candidates.get("nichos") # Formato {"nichos": [...]} da Crew
+    if not isinstance(candidates, list):
+        raise ValueError("LLM did not return a list of candidate niches.")
+    passion_terms, skill_terms = normalize_terms(passions), normalize_terms(skills)
+    seen = {normalize_text(name) for name in exclude or ()}
+    niches = []
+    for candidate in candidates:
+        if not isinstance(candidate, dict):
+            candidate = {"nicho": candidate} # Formato antigo: só o nome
+        name = str(candidate.get("nicho") or "").strip()
+        key = normalize_text(name)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        origin = {
+            "paixoes": [t for t in normalize_terms(_as_list(candidate.get("paixoes"))) if t in passion_terms],
+            "habilidades": [t for t in normalize_terms(_as_list(candidate.get("habilidades"))) if t in skill_terms],
+        }
+        if not origin["paixoes"] and not origin["habilidades"]:
+            origin = {"paixoes": passion_terms, "habilidades": skill_terms}
+        niches.append({"nicho": name, "origem": origin, "ideia_inicial": candidate.get("ideia_inicial") is True})
+    return niches
+
+def attribute_origin(niches: List[Dict[str, Any]], content: str, passions: List[str],
+                     skills: List[str]) -> List[Dict[str, Any]]:
+    """
+    Aplica aos nichos já pesquisados (ex.: saída da Crew) a `origem` e a marca
+    de ideia inicial declaradas na resposta `content` do LLM, pelo nome do nicho.
+    """
+    try:
+        candidates = _parse_candidates(content, passions, skills)
+    except ValueError:
+        candidates = []
+    by_name = {normalize_text(candidate["nicho"]): candidate for candidate in candidates}
+    everything = {"paixoes": normalize_terms(passions), "habilidades": normalize_terms(skills)}
+    for niche in niches:
+        candidate = by_name.get(normalize_text(niche["nicho"]))
+        niche["origem"] = candidate["origem"] if candidate else everything
+        if candidate and candidate["ideia_inicial"]:
+            niche["ideia_inicial"] = True
+    return niches
+
+def _as_list(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    return [str(value)] if value else []
+
+
+def plan_incremental(previous: Optional[Dict[str, Any]], passions: List[str], skills: List[str],
+                     initial_idea: Optional[str], model: str) -> Optional[Dict[str, Any]]:
+    """
+    Compara as entradas atuais com as da análise anterior do projeto
+    (`previous`, ver project_service.NicheAnalysisStore) e decide o que
+    reaproveitar. Retorna None quando é preciso uma análise completa: sem
+    análise anterior por nicho, outro modelo de LLM, ou mudança maior que
+    NICHE_INCREMENTAL_MAX_CHANGE das entradas.
+    """
+    if not previous or not previous.get("niches") or previous.get("model") != model:
+        return None
+    old_inputs = previous.get("inputs") or {}
+    old_passions, old_skills = set(old_inputs.get("passions", [])), set(old_inputs.get("skills", []))
+    new_passions, new_skills = set(normalize_terms(passions)), set(normalize_terms(skills))
+    removed = (old_passions - new_passions) | (old_skills - new_skills)
+    added = sorted((new_passions - old_passions) | (new_skills - old_skills))
+    idea_changed = normalize_text(initial_idea) != old_inputs.get("initial_idea", "")
+
+    universe = len(old_passions | new_passions) + len(old_skills | new_skills)
+    if universe and (len(removed) + len(added)) / universe > settings.niche_incremental_max_change:
+        return None
+
+    def affected(niche: Dict[str, Any]) -> bool:
+        origin = niche.get("origem")
+        if not origin:
+            return True # Análise antiga, sem origem: não dá para saber
+        sources = set(origin.get("paixoes", [])) | set(origin.get("habilidades", []))
+        return bool(sources & removed) or (idea_changed and niche.get("ideia_inicial", False))
+
+    kept = [niche for niche in previous["niches"] if not affected(niche)]
+    if not kept:
+        return None
+    return {
+        "kept": kept,
+        "dropped": [niche["nicho"] for niche in previous["niches"] if affected(niche)],
+        "focus": added,
+        "initial_idea": initial_idea if idea_changed else None,
+    }
+
+
+async def _enumerate(llm, prompt: str, timeout: float, task_id: Optional[str]) -> str:
+    if task_id:
+        report_event(task_id, "step_started", step="enumeration")
+    with telemetry.span("fanout.enumeration", task_id=task_id):
+        message = await asyncio.wait_for(llm.ainvoke(prompt), timeout)
+    return message.content
+
+
+def _checkpoint(task_id: Optional[str], candidates: List[Dict[str, Any]], researched: List[Dict[str, Any]]):
+    # Gravado em async_tasks.checkpoint: a retomada pula a enumeração e os nichos já pesquisados
+    if task_id:
+        report_event(task_id, "checkpoint", checkpoint={"stage": "research", "candidates": candidates,
+                                                        "researched": list(researched)})
+
+
+async def _research_all(llm, candidates: List[Dict[str, Any]], passions: List[str], skills: List[str],
+                        concurrency: int, timeout: float, task_id: Optional[str],
+                        done: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    # `done`: nichos já pesquisados numa execução interrompida (do checkpoint)
+    researched = list(done or [])
+    finished = {normalize_text(n["nicho"]) for n in researched}
+    pending = [c for c in candidates if normalize_text(c["nicho"]) not in finished]
+    if researched:
+        logger.info(f"Resuming niche research: {len(researched)} done, {len(pending)} left.")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def research(candidate: Dict[str, Any]):
+        result = await _research_niche(llm, candidate, passions, skills, semaphore, timeout, task_id)
+        if result is not None:
+            researched.append(result)
+            _checkpoint(task_id, candidates, researched)
+
+    await asyncio.gather(*(research(candidate) for candidate in pending))
+    return researched
+
+
+async def run_fanout_analysis(llm, passions: List[str], skills: List[str], initial_idea: Optional[str] = None,
+                              task_id: Optional[str] = None, plan: Optional[Dict[str, Any]] = None,
+                              seed: Optional[List[str]] = None,
+                              checkpoint: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Análise completa ou, com `plan` (de plan_incremental), só dos nichos novos.
+    Com `seed` (nichos de uma análise com entradas parecidas), a enumeração é
+    pulada e esses nichos são pesquisados para as entradas atuais. Com o
+    `checkpoint` de uma execução interrompida, retoma de onde ela parou.
+    """
+    checkpoint = checkpoint if (checkpoint or {}).get("stage") == "research" else {}
+    if plan is not None:
+        return await _run_incremental(llm, passions, skills, plan, task_id, checkpoint)
+    concurrency, timeout = _fanout_settings()
+
+    # 1. Enumerar candidatos (chamada curta), ou partir da semente ou do checkpoint
+    if checkpoint.get("candidates"):
+        niches = checkpoint["candidates"]
+    elif seed:
+        seeded = [{"nicho": name} for name in seed[:MAX_NICHES]]
+        if initial_idea:
+            seeded.insert(0, {"nicho": initial_idea, "ideia_inicial": True})
+        niches = _parse_candidates(json.dumps(seeded, ensure_ascii=False), passions, skills)
+    else:
+        content = await _enumerate(llm, _enumerate_prompt(passions, skills, initial_idea), timeout, task_id)
+        niches = _parse_candidates(content, passions, skills)
+    if task_id:
+        report_event(task_id, "step_finished", step="enumeration", output=[n["nicho"] for n in niches])
+        if not checkpoint:
+            _checkpoint(task_id, niches, [])
+    logger.info(f"Fan-out analysis: researching {len(niches)} niche(s) with concurrency {concurrency}.")
+
+    # 2. Pesquisar e pontuar cada nicho em paralelo
+    researched = await _research_all(llm, niches, passions, skills, concurrency, timeout, task_id,
+                                     done=checkpoint.get("researched"))
+    if not researched:
+        raise RuntimeError("Research failed for every candidate niche.")
+
+    # 3. Juntar e ordenar
+    ranked = sorted(researched, key=lambda n: n["score"], reverse=True)
+    return {"niches": ranked}
+
+
+async def _run_incremental(llm, passions: List[str], skills: List[str], plan: Dict[str, Any],
+                           task_id: Optional[str], checkpoint: Dict[str, Any]) -> Dict[str, Any]:
+    concurrency, timeout = _fanout_settings()
+    kept = plan["kept"]
+    if task_id:
+        report_event(task_id, "step_finished", step="reuse", output=[n["nicho"] for n in kept], dropped=plan["dropped"])
+
+    # 1. Candidatos só para as entradas novas (ou para repor nichos descartados)
+    missing = max(0, MIN_NICHES - len(kept))
+    wanted = max(missing, 2) if plan["focus"] or plan["initial_idea"] else missing
+    candidates: List[Dict[str, Any]] = checkpoint.get("candidates") or []
+    if wanted and not checkpoint:
+        names = [n["nicho"] for n in kept]
+        prompt = _enumerate_prompt(passions, skills, plan["initial_idea"], count=(wanted, wanted + 2),
+                                   focus=plan["focus"] or None, exclude=names)
+        candidates = _parse_candidates(await _enumerate(llm, prompt, timeout, task_id), passions, skills, exclude=names)
+        if task_id:
+            report_event(task_id, "step_finished", step="enumeration", output=[n["nicho"] for n in candidates])
+            _checkpoint(task_id, candidates, [])
+    logger.info(f"Incremental niche analysis: reusing {len(kept)} niche(s), researching {len(candidates)} new one(s).")
+
+    # 2. Pesquisa só dos novos; 3. reordena a união (mantendo o tamanho da lista)
+    researched = await _research_all(llm, candidates, passions, skills, concurrency, timeout, task_id,
+                                     done=checkpoint.get("researched"))
+    ranked = sorted(kept + researched, key=lambda n: n["score"], reverse=True)[:MAX_NICHES]
+    return {
+        "niches": ranked,
+        "incremental": {"reused": len(kept), "researched": len(researched), "dropped": len(plan["dropped"])},
+    }
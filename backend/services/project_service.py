@@ -0,0 +1,211 @@
+# backend/services/project_service.py
+import json
+import time
+import base64
+import asyncio
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from backend.lib.repository import project_repository
+from backend.lib.settings import settings
+from backend.services.task_registry import task_registry
+
+logger = logging.getLogger(__name__)
+
+# Colunas da listagem (ProjectListRead): nada de estado_progresso no payload da lista
+LIST_COLUMNS = ("id", "nome_projeto", "updated_at")
+
+
+# --- Cursor (keyset em updated_at, id) ---
+def encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps([row["updated_at"], row["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Levanta ValueError se o cursor for inválido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        updated_at, project_id = json.loads(raw)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+    if not isinstance(updated_at, str) or not isinstance(project_id, str):
+        raise ValueError("Invalid cursor payload.")
+    return updated_at, project_id
+
+
+class ProjectListCache:
+    """
+    Cache read-through das páginas de projetos por usuário. Cada usuário tem
+    uma geração; invalidar incrementa a geração e descarta as páginas, e uma
+    leitura que começou antes da invalidação não grava o resultado (evita
+    repopular o cache com dados velhos).
+    """
+
+    def __init__(self, ttl_seconds: float = 60, max_users: int = 5000, max_pages_per_user: int = 20):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.max_pages_per_user = max_pages_per_user
+        self._pages: "OrderedDict[str, OrderedDict]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, user_id: str) -> int:
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def get(self, user_id: str, page_key: Tuple) -> Optional[Any]:
+        with self._lock:
+            pages = self._pages.get(user_id)
+            entry = pages.get(page_key) if pages is not None else None
+            if entry is None or time.time() - entry[0] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id: str, page_key: Tuple, value: Any, generation: int):
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return # Invalidado durante a leitura
+            pages = self._pages.setdefault(user_id, OrderedDict())
+            pages[page_key] = (time.time(), value)
+            while len(pages) > self.max_pages_per_user:
+                pages.popitem(last=False)
+            self._pages.move_to_end(user_id)
+            while len(self._pages) > self.max_users:
+                evicted, _ = self._pages.popitem(last=False)
+                self._generations.pop(evicted, None)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._pages.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"users": len(self._pages), "hits": self.hits, "misses": self.misses}
+
+
+project_list_cache = ProjectListCache(ttl_seconds=settings.project_list_cache_ttl_seconds)
+
+
+async def create_project(user_id: str, nome_projeto: str) -> Dict[str, Any]:
+    row = await project_repository.create_project(user_id, nome_projeto, estado_progresso={"nicho_persona": None})
+    project_list_cache.invalidate(user_id)
+    return row
+
+async def list_projects(user_id: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Retorna (página, próximo cursor). Paginação por keyset em (updated_at, id)
+    decrescente, então o custo de qualquer página não depende da posição.
+    Índice esperado no banco: projects (user_id, updated_at DESC, id DESC).
+    """
+    after = decode_cursor(cursor) if cursor else None
+    page_key = (cursor, limit)
+    cached = project_list_cache.get(user_id, page_key)
+    if cached is not None:
+        return cached
+    generation = project_list_cache.generation(user_id)
+    # Busca um a mais para saber se existe próxima página sem um COUNT
+    rows = await project_repository.list_projects(user_id, columns=LIST_COLUMNS, limit=limit + 1, after=after)
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    page = (rows[:limit], next_cursor)
+    project_list_cache.put(user_id, page_key, page, generation)
+    return page
+
+def invalidate_on_task_event(task_id: str, event: Dict[str, Any]):
+    # Listener do task_executor: tarefas concluídas podem mudar os projetos do usuário
+    # (a análise de nicho é gravada depois, em segundo plano: NicheAnalysisStore.save invalida de novo)
+    if event["type"] != "completed":
+        return
+    record = task_registry.get(task_id)
+    if record and record.get("user_id"):
+        project_list_cache.invalidate(record["user_id"])
+
+
+class NicheAnalysisStore:
+    """
+    Última análise de nicho de cada projeto, por nicho, em
+    `projects.estado_progresso.analise_nicho` (entradas normalizadas, modelo
+    e nichos com a origem de cada um). É a base da reanálise incremental:
+    a API carrega a análise anterior antes de agendar a tarefa e grava a nova
+    quando a tarefa conclui (ver niche_fanout.plan_incremental).
+    """
+    state_key = "analise_nicho"
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self.saves = 0
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._write_lock = asyncio.Lock()
+
+    # --- Leitura ---
+    async def load(self, project_id: str) -> Optional[Dict[str, Any]]:
+        row = await project_repository.get_project(project_id, columns=("estado_progresso",))
+        return self._extract(row)
+
+    async def load_many(self, project_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        rows = await project_repository.get_projects(list(dict.fromkeys(project_ids)),
+                                                     columns=("id", "estado_progresso"))
+        found = {row["id"]: self._extract(row) for row in rows}
+        return {project_id: state for project_id, state in found.items() if state}
+
+    def _extract(self, row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        state = ((row or {}).get("estado_progresso") or {}).get(self.state_key)
+        return state if isinstance(state, dict) and state.get("niches") else None
+
+    # --- Escrita ---
+    async def save(self, project_id: str, result: Dict[str, Any]):
+        """Grava os nichos de `result` no estado do projeto (ler-alterar-gravar do JSON)."""
+        state = {
+            "inputs": result["inputs"],
+            "model": result["model"],
+            "niches": result["niches"],
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        async with self._write_lock: # Duas gravações no mesmo estado_progresso não se atropelam
+            row = await project_repository.get_project(project_id, columns=("user_id", "estado_progresso"))
+            if row is None:
+                return
+            progress = dict(row.get("estado_progresso") or {})
+            progress[self.state_key] = state
+            await project_repository.update_project(project_id, estado_progresso=progress)
+        # A lista pode ter sido lida entre a conclusão da tarefa e esta gravação
+        project_list_cache.invalidate(row["user_id"])
+        self.saves += 1
+
+    def save_later(self, project_id: Optional[str], result: Any):
+        """Agenda `save` no loop da API (chamável de qualquer thread). Ignora resultados sem nichos."""
+        if not project_id or self._loop is None or not isinstance(result, dict):
+            return
+        if not all(key in result for key in ("inputs", "model", "niches")):
+            return # Ex.: saída em texto da Crew sequencial
+        future = asyncio.run_coroutine_threadsafe(self.save(project_id, result), self._loop)
+        future.add_done_callback(functools.partial(self._log_failure, project_id))
+
+    @staticmethod
+    def _log_failure(project_id: str, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Failed to store niche analysis for project {project_id}: {future.exception()}")
+
+    def on_executor_event(self, task_id: str, event: Dict[str, Any]):
+        # Listener do task_executor: a análise concluída vira a base da próxima
+        # (no modo fila, o worker que rodou a análise já gravou)
+        if event["type"] != "completed" or event.get("remote"):
+            return
+        record = task_registry.get(task_id)
+        if record and record.get("task_type") == "ANALYZE_NICHE":
+            self.save_later(record.get("project_id"), event.get("result"))
+
+
+niche_analysis_store = NicheAnalysisStore()
@@ -0,0 +1,218 @@
+# backend/services/result_cache.py
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+
+from backend.lib.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+# --- Normalização / chave canônica ---
+def normalize_text(value: Optional[str]) -> str:
+    # Caixa e espaços não mudam o significado da entrada
+    return " ".join((value or "").casefold().split())
+
+def normalize_terms(values: Iterable[str]) -> List[str]:
+    # Ordem também não importa; remove vazios e duplicados
+    return sorted({normalize_text(v) for v in values if normalize_text(v)})
+
+def make_cache_key(payload: Dict[str, Any]) -> str:
+    """Hash SHA-256 de uma representação JSON canônica do payload."""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache de resultados com TTL e LRU em memória, um nível opcional em disco
+    (um arquivo JSON por chave) e single-flight: chamadas concorrentes para a
+    mesma chave compartilham um único Future enquanto a primeira está rodando.
+
+    Os arquivos em disco são JSON compacto (orjson), opcionalmente comprimidos
+    com zstd (`disk_compression="zstd"`, extensão .json.zst).
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 6 * 3600, disk_dir: Optional[str] = None,
+                 disk_max_entries: int = 5000, disk_compression: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self._zstd = None
+        if (disk_compression or "").lower() == "zstd":
+            import zstandard # Só com compressão ligada
+            self._zstd = zstandard
+        elif disk_compression and disk_compression.lower() != "none":
+            logger.warning(f"Unknown cache compression '{disk_compression}', storing uncompressed JSON.")
+        self._suffix = ".json.zst" if self._zstd else ".json"
+        self._read_errors = (OSError, ValueError) + ((self._zstd.ZstdError,) if self._zstd else ())
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    # --- Leitura / escrita ---
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+        # Fora do lock: leitura em disco pode ser lenta
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._memory_put(key, *entry)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any):
+        stored_at = time.time()
+        with self._lock:
+            self._memory_put(key, stored_at, value)
+        self._disk_put(key, stored_at, value)
+
+    def _memory_put(self, key: str, stored_at: float, value: Any):
+        self._memory[key] = (stored_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # --- Single-flight ---
+    def claim(self, key: str) -> Tuple[Future, bool]:
+        """
+        Retorna (future, is_leader). O líder deve executar o trabalho e chamar
+        `complete`; os demais apenas aguardam o future compartilhado.
+        """
+        with self._lock:
+            shared = self._inflight.get(key)
+            if shared is not None:
+                return shared, False
+            shared = Future()
+            shared.set_running_or_notify_cancel()
+            self._inflight[key] = shared
+            return shared, True
+
+    def is_inflight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._inflight
+
+    def complete(self, key: str, result: Any = None, error: Optional[BaseException] = None):
+        """Publica o resultado do líder (cacheando-o se não houve erro) e libera a chave."""
+        if error is None and result is not None:
+            self.set(key, result)
+        with self._lock:
+            shared = self._inflight.pop(key, None)
+        if shared is None:
+            return
+        if error is not None:
+            shared.set_exception(error)
+        elif result is None:
+            shared.set_exception(RuntimeError("Leader run finished without a result."))
+        else:
+            shared.set_result(result)
+
+    # --- Nível em disco ---
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}{self._suffix}")
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, Any]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            if self._zstd is not None:
+                data = self._zstd.ZstdDecompressor().decompress(data)
+            entry = orjson.loads(data)
+        except FileNotFoundError:
+            return None
+        except self._read_errors as e:
+            logger.warning(f"Discarding unreadable cache file {path}: {e}")
+            self._disk_remove(path)
+            return None
+        if now - entry.get("stored_at", 0) > self.ttl_seconds:
+            self._disk_remove(path)
+            return None
+        return entry["stored_at"], entry["value"]
+
+    def _disk_put(self, key: str, stored_at: float, value: Any):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            data = orjson.dumps({"stored_at": stored_at, "value": value}, option=orjson.OPT_NON_STR_KEYS)
+            if self._zstd is not None:
+                data = self._zstd.ZstdCompressor(level=3).compress(data)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path) # Escrita atômica
+        except (OSError, TypeError) as e:
+            logger.warning(f"Could not write cache file {path}: {e}")
+            self._disk_remove(tmp_path)
+            return
+        self._disk_writes += 1
+        if self._disk_writes % 50 == 0:
+            self._disk_prune()
+
+    def _disk_prune(self):
+        # Remove os arquivos mais antigos quando o diretório passa do limite
+        try:
+            entries = [e for e in os.scandir(self.disk_dir) if e.name.endswith(self._suffix)]
+        except OSError:
+            return
+        excess = len(entries) - self.disk_max_entries
+        if excess <= 0:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:excess]:
+            self._disk_remove(entry.path)
+
+    @staticmethod
+    def _disk_remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._memory),
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_enabled": bool(self.disk_dir),
+                "disk_compression": "zstd" if self._zstd else None,
+            }
+
+
+# Cache compartilhado das análises de nicho. NICHE_CACHE_DIR vazio desativa o nível em disco.
+niche_result_cache = ResultCache(
+    max_entries=settings.niche_cache_max_entries,
+    ttl_seconds=settings.niche_cache_ttl_seconds,
+    disk_dir=settings.niche_cache_dir or None,
+    disk_compression=settings.niche_cache_compression,
+)
@@ -0,0 +1,481 @@
+# backend/services/semantic_cache.py
+# Cache semântico das análises de nicho: entradas parecidas ("marketing digital"
+# x "marketing online") não batem no cache exato (result_cache), mas caem perto
+# no espaço de embeddings. Cada análise concluída vira um vetor num índice local;
+# uma nova requisição procura o vizinho mais próximo antes de rodar a Crew.
+#
+# Embeddings: sentence-transformers na CPU, numa thread própria que junta os
+# textos pendentes de várias requisições num único `encode` (lote). O pacote e o
+# modelo só são carregados em `start()` (fora do caminho do cold start da API).
+#
+# Índice em disco (SEMANTIC_CACHE_DIR), lido com mmap no startup. São até
+# `max_entries` posições; cheio, a análise nova ocupa a posição da mais antiga.
+#   vectors.f32      float32 [posições, D], normalizados (cosseno = produto escalar);
+#                    cresce em blocos e cada vetor é gravado no lugar, sem regravar o arquivo
+#   entries.jsonl    cabeçalho (modelo, dimensão, geração dos resultados) + log das posições:
+#                    a última linha de cada posição vale; `{"slot": n}` sozinho a libera
+#   results.N.jsonl  resultados completos, lidos do disco só quando há um acerto. Resultados
+#                    de posições reaproveitadas viram lixo até a compactação, que grava a
+#                    geração N+1 e troca o entries.jsonl (ponto de commit)
+import os
+import glob
+import json
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from backend.lib.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticMatch:
+    """Vizinho mais próximo de uma consulta (`result` só é lido do disco se pedido)."""
+    __slots__ = ("similarity", "key", "text", "_cache", "_row")
+
+    def __init__(self, cache: "SemanticCache", row: int, similarity: float, entry: Dict[str, Any]):
+        self.similarity = similarity
+        self.key = entry["key"]
+        self.text = entry["text"]
+        self._cache = cache
+        self._row = row
+
+    def result(self) -> Optional[Any]:
+        return self._cache._read_result(self._row, self.key)
+
+
+class _Encoder:
+    """Thread única de embeddings: cada rodada codifica tudo o que estiver na fila (até `batch_size`)."""
+
+    def __init__(self, model_name: str, batch_size: int):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.dimension: Optional[int] = None
+        self.batches = 0
+        self.texts = 0
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="semantic-encoder", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def encode(self, text: str) -> Future:
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        try:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(self.model_name, device="cpu")
+            self.dimension = model.get_sentence_embedding_dimension()
+            logger.info(f"Semantic cache encoder ready ({self.model_name}, dim {self.dimension}).")
+        except Exception as e:
+            logger.error(f"Semantic cache disabled: could not load embedding model {self.model_name}: {e}")
+            model = None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None) # Encerra depois deste lote
+                    break
+                batch.append(item)
+            if model is None:
+                for _, future in batch:
+                    future.set_exception(RuntimeError("Embedding model unavailable."))
+                continue
+            try:
+                vectors = model.encode([text for text, _ in batch], batch_size=self.batch_size,
+                                       normalize_embeddings=True, convert_to_numpy=True)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(batch)} text(s) failed: {e}", exc_info=True)
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector.astype(np.float32))
+
+
+class SemanticCache:
+    """
+    Índice vetorial plano (busca exata por produto escalar) das análises
+    concluídas. `lookup_many` devolve o vizinho mais próximo de cada texto no
+    mesmo escopo (modo/modelo/temperatura); quem decide servir o resultado ou
+    só usá-lo como semente é a API, pelos limiares de similaridade. Com
+    `max_entries` posições ocupadas, cada análise nova substitui a mais antiga
+    (as vencidas pelo TTL saem primeiro).
+    """
+
+    def __init__(self, directory: Optional[str] = None, model_name: str = "", batch_size: int = 32,
+                 max_entries: int = 50000, ttl_seconds: float = 6 * 3600, flush_every: int = 20,
+                 growth_rows: int = 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.flush_every = flush_every
+        self.growth_rows = growth_rows
+        self._encoder = _Encoder(model_name, batch_size)
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None # [capacidade, D]: mmap de vectors.f32 ou array em memória
+        self._entries: List[Optional[Dict[str, Any]]] = [] # Metadados por posição (None = livre)
+        self._stored_at = np.empty(0) # Por posição, para achar a mais antiga (-inf = livre)
+        self._results: Dict[int, Any] = {} # Resultados sem diretório (só memória)
+        self._generation = 0 # Arquivo de resultados corrente: results.{geração}.jsonl
+        self._results_size = 0
+        self._live_bytes = 0 # Bytes de resultados ainda referenciados
+        self._log_lines = 0 # Linhas de posição no entries.jsonl
+        self._unflushed = 0
+        self._started = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compactions = 0
+
+    # --- Ciclo de vida ---
+    def start(self):
+        """Carrega o índice do disco (mmap) e começa a carregar o modelo em segundo plano."""
+        if self._started:
+            return
+        self._started = True
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load()
+        self._encoder.start()
+
+    def stop(self):
+        if not self._started:
+            return
+        self._encoder.stop()
+        self.flush()
+        self._started = False
+
+    @property
+    def running(self) -> bool:
+        return self._started
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _results_path(self, generation: Optional[int] = None) -> str:
+        return self._path(f"results.{self._generation if generation is None else generation}.jsonl")
+
+    def _load(self):
+        try:
+            with open(self._path("entries.jsonl"), "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            self._remove_files() # Sobras de um índice sem cabeçalho
+            return
+        try:
+            header = json.loads(lines[0])
+            if header["model"] != self._encoder.model_name:
+                raise ValueError(f"index built with {header['model']}")
+            vectors = self._map(header["dimension"])
+            self._generation = header["generation"]
+            self._results_size = os.path.getsize(self._results_path())
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            logger.warning(f"Discarding semantic index in {self.directory}: {e}")
+            self._remove_files()
+            return
+        slots: Dict[int, Optional[Dict[str, Any]]] = {}
+        damaged = 0
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+                slots[entry.pop("slot")] = entry or None
+            except (ValueError, KeyError):
+                damaged += 1 # Linha cortada por uma queda no meio da gravação
+        size = max((slot + 1 for slot, entry in slots.items() if entry and slot < len(vectors)), default=0)
+        self._vectors = vectors
+        self._entries = [None] * size
+        self._stored_at = np.full(len(vectors), -np.inf)
+        for slot, entry in slots.items():
+            if entry and slot < size:
+                self._entries[slot] = entry
+                self._stored_at[slot] = entry["stored_at"]
+        self._live_bytes = sum(entry["length"] + 1 for entry in self._entries if entry)
+        self._log_lines = len(lines) - 1
+        for path in glob.glob(self._path("results.*.jsonl")) + glob.glob(self._path("*.tmp")):
+            if path != self._results_path():
+                os.remove(path) # Compactação interrompida antes do commit
+        if damaged:
+            self._compact()
+        logger.info(f"Semantic cache loaded {size - self._entries.count(None)} entr(ies) from {self.directory}.")
+
+    def _remove_files(self):
+        for path in [self._path("entries.jsonl"), self._path("vectors.f32"),
+                     *glob.glob(self._path("results.*.jsonl")), *glob.glob(self._path("*.tmp"))]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _map(self, dimension: int, capacity: int = 0) -> np.ndarray:
+        # vectors.f32 cresce em blocos (truncate) e é mapeado de novo: o que já foi gravado não é copiado
+        path = self._path("vectors.f32")
+        row_bytes = dimension * np.dtype(np.float32).itemsize
+        with open(path, "ab") as f:
+            size = f.seek(0, os.SEEK_END)
+            if capacity * row_bytes > size:
+                f.truncate(capacity * row_bytes)
+                size = capacity * row_bytes
+        rows = size // row_bytes
+        if rows == 0:
+            return np.zeros((0, dimension), dtype=np.float32)
+        return np.memmap(path, dtype=np.float32, mode="r+", shape=(rows, dimension))
+
+    # --- Consulta ---
+    async def lookup_many(self, texts: List[str], scope: str, timeout: float,
+                          min_similarity: float = 0.0) -> List[Optional[SemanticMatch]]:
+        """
+        Vizinho mais próximo de cada texto com similaridade >= `min_similarity`
+        (None sem índice, sem vizinho à altura ou se o embedding não sair em `timeout`).
+        """
+        if not self._started or not texts:
+            return [None] * len(texts)
+        futures = [asyncio.wrap_future(self._encoder.encode(text)) for text in texts]
+        try:
+            vectors = await asyncio.wait_for(asyncio.gather(*futures), timeout)
+        except Exception as e:
+            logger.warning(f"Semantic lookup skipped: {e!r}")
+            return [None] * len(texts)
+        return [self._nearest(vector, scope, min_similarity) for vector in vectors]
+
+    def _nearest(self, vector: np.ndarray, scope: str, min_similarity: float = 0.0) -> Optional[SemanticMatch]:
+        now = time.time()
+        with self._lock:
+            scores = self._scores(vector)
+            if scores is None:
+                self.misses += 1
+                return None
+            # Só os 10 melhores são ordenados (O(n) para achá-los): podem ser de outro escopo, expirados ou livres
+            k = min(10, len(scores))
+            candidates = np.argpartition(-scores, k - 1)[:k]
+            for row in candidates[np.argsort(-scores[candidates])]:
+                if scores[row] < min_similarity:
+                    break # Ordenados: nenhum dos seguintes passa do limiar
+                entry = self._entries[row]
+                if entry is not None and entry["scope"] == scope and now - entry["stored_at"] <= self.ttl_seconds:
+                    self.hits += 1
+                    return SemanticMatch(self, int(row), float(scores[row]), entry)
+            self.misses += 1
+            return None
+
+    def _scores(self, vector: np.ndarray) -> Optional[np.ndarray]:
+        # Similaridade com todas as posições ocupadas (o mmap é lido no lugar); chamado com o lock
+        if not self._entries or self._vectors.shape[1] != len(vector):
+            return None
+        return self._vectors[:len(self._entries)] @ vector
+
+    def _read_result(self, row: int, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries[row] if row < len(self._entries) else None
+            if entry is None or entry["key"] != key:
+                return None # Posição reaproveitada por outra análise depois da busca
+            if not self.directory:
+                return self._results.get(row)
+            try:
+                with open(self._results_path(), "rb") as f:
+                    f.seek(entry["offset"])
+                    data = f.read(entry["length"])
+            except OSError as e:
+                logger.warning(f"Could not read semantic cache result for row {row}: {e}")
+                return None
+        try:
+            return orjson.loads(data)
+        except ValueError as e:
+            logger.warning(f"Corrupted semantic cache result for row {row}: {e}")
+            return None
+
+    # --- Escrita ---
+    def add(self, key: str, text: str, scope: str, result: Any):
+        """Indexa uma análise concluída. Não bloqueia: o embedding sai no próximo lote do encoder."""
+        if not self._started or result is None:
+            return
+        self._encoder.encode(text).add_done_callback(lambda future: self._on_encoded(future, key, text, scope, result))
+
+    def _on_encoded(self, future: Future, key: str, text: str, scope: str, result: Any):
+        if future.exception() is not None:
+            return
+        vector = future.result()
+        entry = {"key": key, "scope": scope, "text": text, "stored_at": time.time()}
+        with self._lock:
+            try:
+                slot = self._claim_slot(len(vector))
+                if self.directory:
+                    entry.update(self._append_result(result))
+                    self._vectors[slot] = vector
+                    # Só depois do vetor gravado a posição volta a valer no log
+                    self._append_entries([{"slot": slot, **entry}])
+                else:
+                    self._vectors[slot] = vector
+                    self._results[slot] = result
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not persist semantic cache entry: {e}")
+                return
+            self._entries[slot] = entry
+            self._stored_at[slot] = entry["stored_at"]
+            self._unflushed += 1
+            should_flush = self._unflushed >= self.flush_every
+            if self.directory and self._wasteful():
+                self._compact()
+        if should_flush:
+            self.flush()
+
+    def _claim_slot(self, dimension: int) -> int:
+        # Chamado com o lock: a próxima posição nova ou, cheio, a livre/mais antiga (que é liberada)
+        if self._vectors is not None and self._vectors.shape[1] != dimension:
+            raise ValueError(f"embedding dimension changed ({self._vectors.shape[1]} -> {dimension})")
+        if len(self._entries) < self.max_entries:
+            slot = len(self._entries)
+            if self._vectors is None or slot >= len(self._vectors):
+                self._grow(dimension, slot + 1)
+            self._entries.append(None)
+            return slot
+        slot = int(np.argmin(self._stored_at[:len(self._entries)]))
+        evicted = self._entries[slot]
+        if evicted is not None:
+            if self.directory:
+                self._append_entries([{"slot": slot}]) # Libera a posição antes de sobrescrever o vetor
+                self._live_bytes -= evicted["length"] + 1
+            else:
+                self._results.pop(slot, None)
+            self._entries[slot] = None
+            self._stored_at[slot] = -np.inf
+            self.evictions += 1
+        return slot
+
+    def _grow(self, dimension: int, needed: int):
+        capacity = min(self.max_entries, max(needed, 2 * len(self._entries), self.growth_rows))
+        if self.directory:
+            new_index = self._vectors is None
+            self._vectors = self._map(dimension, capacity)
+            if new_index:
+                self._write_entries([]) # Cabeçalho com modelo e dimensão
+        else:
+            vectors = np.zeros((capacity, dimension), dtype=np.float32)
+            if self._vectors is not None:
+                vectors[:len(self._vectors)] = self._vectors
+            self._vectors = vectors
+        stored_at = np.full(capacity, -np.inf)
+        stored_at[:len(self._stored_at)] = self._stored_at
+        self._stored_at = stored_at
+
+    def _append_result(self, result: Any) -> Dict[str, int]:
+        data = orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS)
+        with open(self._results_path(), "ab") as f:
+            offset = f.tell()
+            f.write(data + b"\n")
+        self._results_size = offset + len(data) + 1
+        self._live_bytes += len(data) + 1
+        return {"offset": offset, "length": len(data)}
+
+    def _append_entries(self, lines: List[Dict[str, Any]]):
+        with open(self._path("entries.jsonl"), "a", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        self._log_lines += len(lines)
+
+    def _write_entries(self, entries: List[Optional[Dict[str, Any]]], generation: Optional[int] = None):
+        # Regrava o entries.jsonl inteiro (escrita atômica): cabeçalho + uma linha por posição ocupada
+        header = {"model": self._encoder.model_name, "dimension": self._vectors.shape[1],
+                  "generation": self._generation if generation is None else generation}
+        tmp_path = self._path("entries.jsonl.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for slot, entry in enumerate(entries):
+                if entry is not None:
+                    f.write(json.dumps({"slot": slot, **entry}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self._path("entries.jsonl"))
+        self._log_lines = len(entries) - entries.count(None)
+
+    def _wasteful(self) -> bool:
+        # Log ou resultados com mais do dobro do que ainda vale (posições reaproveitadas)
+        live = len(self._entries) - self._entries.count(None)
+        return (self._log_lines > 2 * live + 1000
+                or self._results_size > 2 * self._live_bytes + (1 << 20))
+
+    def _compact(self):
+        # Chamado com o lock: copia os resultados vivos para a próxima geração e regrava o log
+        generation = self._generation + 1
+        entries = list(self._entries)
+        try:
+            with open(self._results_path(), "rb") as source, open(self._results_path(generation), "wb") as target:
+                for slot, entry in enumerate(entries):
+                    if entry is None:
+                        continue
+                    source.seek(entry["offset"])
+                    data = source.read(entry["length"])
+                    entries[slot] = {**entry, "offset": target.tell()}
+                    target.write(data + b"\n")
+                size = target.tell()
+            if isinstance(self._vectors, np.memmap):
+                self._vectors.flush() # Os vetores precisam estar no disco antes do log que os referencia
+            self._write_entries(entries, generation)
+        except OSError as e:
+            logger.warning(f"Could not compact semantic index in {self.directory}: {e}")
+            if os.path.exists(self._results_path(generation)):
+                os.remove(self._results_path(generation))
+            return
+        try:
+            os.remove(self._results_path())
+        except OSError:
+            pass # Sobra removida no próximo startup
+        self._entries = entries
+        self._generation = generation
+        self._results_size = self._live_bytes = size
+        self.compactions += 1
+
+    def flush(self):
+        """Grava no disco os vetores alterados no mmap."""
+        with self._lock:
+            if isinstance(self._vectors, np.memmap):
+                self._vectors.flush()
+            self._unflushed = 0
+
+    # --- Métricas ---
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self._started,
+                "entries": len(self._entries) - self._entries.count(None),
+                "capacity": len(self._vectors) if self._vectors is not None else 0,
+                "unflushed": self._unflushed,
+                "evictions": self.evictions,
+                "compactions": self.compactions,
+                "hits": self.hits,
+                "misses": self.misses,
+                "encoder_batches": self._encoder.batches,
+                "encoded_texts": self._encoder.texts,
+            }
+
+
+semantic_cache = SemanticCache(
+    directory=settings.semantic_cache_dir or None,
+    model_name=settings.semantic_cache_model,
+    batch_size=settings.semantic_cache_batch_size,
+    max_entries=settings.semantic_cache_max_entries,
+    ttl_seconds=settings.niche_cache_ttl_seconds,
+)
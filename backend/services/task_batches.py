@@ -0,0 +1,253 @@
+# backend/services/task_batches.py
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from backend.lib.settings import settings
+from backend.services.task_executor import task_executor, report_event, ExecutorSaturatedError, TaskCancelledError
+from backend.services.task_registry import PENDING, PROCESSING, COMPLETED, FAILED, CANCELLED
+from backend.services.task_scheduler import BATCH
+
+logger = logging.getLogger(__name__)
+
+# Status agregado de um lote concluído em que só parte das tarefas falhou
+PARTIAL = "PARTIAL"
+
+
+class BatchRun:
+    """Execução pendente de um lote: `fn(**kwargs)` no task_executor sob o ID `task_id`, em nome de `user`."""
+    __slots__ = ("task_id", "fn", "kwargs", "on_done", "user")
+
+    def __init__(self, task_id: str, fn: Callable[..., Any], kwargs: Dict[str, Any],
+                 on_done: Optional[Callable[[Any, Optional[BaseException]], None]] = None,
+                 user: Optional[str] = None):
+        self.task_id = task_id
+        self.fn = fn
+        self.kwargs = kwargs
+        self.on_done = on_done
+        self.user = user
+
+
+class TaskBatchScheduler:
+    """
+    Lotes de tarefas criados por uma única requisição. As execuções de um lote
+    entram no task_executor aos poucos: no máximo `max_inflight` por lote e só
+    enquanto o pool não estiver saturado, para que um lote grande não tome a
+    fila dos pedidos avulsos nem estoure os limites de LLM compartilhados.
+    Cada tarefa finalizada no executor libera a próxima execução pendente.
+    No executor, as execuções de lote entram na classe de prioridade "batch".
+
+    Os lotes vivem só em memória (as tarefas em si estão em `async_tasks`).
+    """
+
+    def __init__(self, max_inflight: int = 2, max_batches: int = 1000):
+        self.max_inflight = max(1, max_inflight)
+        self.max_batches = max_batches
+        self._batches: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: Dict[str, Deque[BatchRun]] = {}
+        self._inflight: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.batches_created = 0
+        self.runs_submitted = 0
+
+    # --- Criação ---
+    def create(self, task_ids: List[str], runs: Iterable[BatchRun]) -> str:
+        """Registra o lote e agenda o que couber agora; o restante entra conforme o pool libera."""
+        batch_id = str(uuid.uuid4())
+        with self._lock:
+            self._batches[batch_id] = {
+                "id": batch_id,
+                "task_ids": list(task_ids),
+                "created_at": time.time(),
+            }
+            self._pending[batch_id] = deque(runs)
+            self._inflight[batch_id] = set()
+            self.batches_created += 1
+            self._evict()
+        self.pump()
+        return batch_id
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            return {**batch, "waiting": len(self._pending.get(batch_id, ()))}
+
+    # --- Agendamento ---
+    def pump(self):
+        """Submete execuções pendentes enquanto houver vaga (lotes mais antigos primeiro)."""
+        while self._pump_once():
+            pass # Recusas numa corrida e o pool já com vaga: nenhum evento chamaria o pump por elas
+
+    def _pump_once(self) -> bool:
+        # As vagas são reservadas com o lock e o submit acontece fora dele: uma
+        # execução que termina na hora publica o evento final dentro do submit,
+        # e on_executor_event (que também pega o lock) roda nesta mesma thread.
+        with self._lock:
+            reserved: List[Tuple[str, BatchRun]] = []
+            for batch_id, pending in list(self._pending.items()):
+                inflight = self._inflight[batch_id]
+                while pending and len(inflight) < self.max_inflight and not task_executor.is_saturated(pending[0].user):
+                    run = pending.popleft()
+                    inflight.add(run.task_id)
+                    reserved.append((batch_id, run))
+                if not pending:
+                    del self._pending[batch_id]
+
+        refused: Dict[str, List[BatchRun]] = {}
+        abandoned: List[BatchRun] = []
+        error: Optional[BaseException] = None
+        for batch_id, run in reserved:
+            if error is not None or batch_id in refused:
+                (abandoned if error is not None else refused[batch_id]).append(run)
+                continue
+            try:
+                task_executor.submit(run.task_id, run.fn, user=run.user, priority=BATCH, on_done=run.on_done,
+                                     **run.kwargs)
+            except ExecutorSaturatedError:
+                refused[batch_id] = [run] # Corrida com um pedido avulso: tenta de novo no próximo evento
+                continue
+            except RuntimeError as not_running:
+                logger.error(f"Task executor is not running; abandoning batch run(s) from {batch_id}.")
+                abandoned.append(run)
+                error = not_running
+                continue
+            with self._lock:
+                self.runs_submitted += 1
+
+        with self._lock:
+            for batch_id, runs in refused.items():
+                self._release(batch_id, runs)
+                # Voltam para o início do lote, na ordem original
+                self._pending.setdefault(batch_id, deque()).extendleft(reversed(runs))
+            if error is not None:
+                self._release(None, abandoned)
+                abandoned.extend(run for pending in self._pending.values() for run in pending)
+                self._pending.clear()
+        self._fail_runs(abandoned, error)
+        return bool(refused) and error is None and not any(
+            task_executor.is_saturated(runs[0].user) for runs in refused.values())
+
+    def _release(self, batch_id: Optional[str], runs: List[BatchRun]):
+        # Chamado com o lock: devolve as vagas reservadas de execuções que não entraram no pool
+        batches = [batch_id] if batch_id is not None else list(self._inflight)
+        for key in batches:
+            inflight = self._inflight.setdefault(key, set())
+            for run in runs:
+                inflight.discard(run.task_id)
+
+    def on_executor_event(self, task_id: str, event: Dict[str, Any]):
+        # Listener do task_executor: qualquer tarefa finalizada libera uma vaga no pool
+        if event["type"] not in ("completed", "failed", "cancelled"):
+            return
+        with self._lock:
+            for inflight in self._inflight.values():
+                inflight.discard(task_id)
+            has_pending = bool(self._pending)
+        if has_pending:
+            self.pump()
+
+    def cancel(self, task_id: str) -> bool:
+        """Tira uma execução que ainda espera vaga no pool. False se ela não está esperando."""
+        with self._lock:
+            for batch_id, pending in self._pending.items():
+                run = next((run for run in pending if run.task_id == task_id), None)
+                if run is not None:
+                    pending.remove(run)
+                    if not pending:
+                        del self._pending[batch_id]
+                    break
+            else:
+                return False
+        if run.on_done is not None:
+            try:
+                run.on_done(None, TaskCancelledError(f"Task {task_id} was cancelled."))
+            except Exception as callback_error:
+                logger.error(f"on_done callback for task {task_id} failed: {callback_error}", exc_info=True)
+        report_event(task_id, "cancelled", error="Task cancelled by request.")
+        return True
+
+    def abandon_pending(self, reason: str = "Servidor encerrado antes de iniciar a tarefa.", fail: bool = True):
+        """
+        Descarta as execuções que ainda não entraram no pool (ex.: no shutdown):
+        marca como FAILED ou, com `fail=False`, deixa PENDING para a recuperação.
+        """
+        with self._lock:
+            abandoned = [run for pending in self._pending.values() for run in pending]
+            self._pending.clear()
+        if fail:
+            self._fail_runs(abandoned, RuntimeError(reason))
+        elif abandoned:
+            logger.info(f"Leaving {len(abandoned)} pending batch run(s) for recovery by another worker.")
+
+    @staticmethod
+    def _fail_runs(runs: List[BatchRun], error: Optional[BaseException]):
+        # Fora do lock: os callbacks publicam eventos que voltam para on_executor_event
+        for run in runs:
+            if run.on_done is not None:
+                try:
+                    run.on_done(None, error)
+                except Exception as callback_error:
+                    logger.error(f"on_done callback for task {run.task_id} failed: {callback_error}", exc_info=True)
+            report_event(run.task_id, "failed", error=str(error))
+
+    def _evict(self):
+        # Descarta os lotes mais antigos que já não têm execuções esperando vaga
+        excess = len(self._batches) - self.max_batches
+        for batch_id in list(self._batches):
+            if excess <= 0:
+                break
+            if batch_id not in self._pending:
+                del self._batches[batch_id]
+                self._inflight.pop(batch_id, None)
+                excess -= 1
+
+    # --- Métricas ---
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": len(self._batches),
+                "batches_created": self.batches_created,
+                "runs_waiting": sum(len(pending) for pending in self._pending.values()),
+                "runs_submitted": self.runs_submitted,
+            }
+
+
+def aggregate_status(records: List[Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Resume as tarefas de um lote: contagem por status, progresso (fração já
+    finalizada) e o status do lote. `None` conta como tarefa desconhecida;
+    tarefas canceladas contam como finalizadas sem sucesso.
+    """
+    counts: Dict[str, int] = {}
+    for record in records:
+        status = record["status"] if record else "UNKNOWN"
+        counts[status] = counts.get(status, 0) + 1
+    total = len(records)
+    unsuccessful = counts.get(FAILED, 0) + counts.get(CANCELLED, 0)
+    finished = counts.get(COMPLETED, 0) + unsuccessful
+    if finished < total:
+        started = finished or counts.get(PROCESSING, 0)
+        status = PROCESSING if started else PENDING
+    elif unsuccessful == 0:
+        status = COMPLETED
+    elif counts.get(COMPLETED, 0) == 0:
+        status = FAILED
+    else:
+        status = PARTIAL
+    return {
+        "status": status,
+        "total": total,
+        "counts": counts,
+        "progress": round(finished / total, 4) if total else 1.0,
+    }
+
+
+task_batches = TaskBatchScheduler(
+    max_inflight=settings.task_batch_max_inflight,
+    max_batches=settings.task_batch_history,
+)
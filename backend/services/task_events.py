@@ -0,0 +1,98 @@
+# backend/services/task_events.py
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Set
+
+from backend.lib.settings import settings
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_EVENTS = ("completed", "failed", "cancelled")
+INTERNAL_EVENTS = ("checkpoint",) # Só para o task_registry (estado de retomada), não vão para o SSE
+
+
+class TaskEventBus:
+    """
+    Pub/sub em memória dos eventos de progresso de cada tarefa. Recebe eventos
+    de qualquer thread (listener do task_executor) e entrega aos assinantes
+    (conexões SSE) no event loop da API. Mantém um histórico curto por tarefa
+    para que quem conecta depois do início receba o que já aconteceu.
+    """
+
+    def __init__(self, history_size: int = 500, retention_seconds: float = 600):
+        self.history_size = history_size
+        self.retention_seconds = retention_seconds
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._history: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._finished_at: Dict[str, float] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def publish(self, task_id: str, event: Dict[str, Any]):
+        if event["type"] in INTERNAL_EVENTS:
+            return
+        with self._lock:
+            history = self._history.setdefault(task_id, deque(maxlen=self.history_size))
+            history.append(event)
+            if event["type"] in TERMINAL_EVENTS:
+                self._finished_at[task_id] = time.time()
+            subscribers = list(self._subscribers.get(task_id, ()))
+            self._purge_expired()
+        if subscribers and self._loop is not None:
+            for queue in subscribers:
+                self._loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def knows(self, task_id: str) -> bool:
+        with self._lock:
+            return task_id in self._history
+
+    async def subscribe(self, task_id: str, keepalive: float = 15.0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Gera o histórico e depois os eventos ao vivo até o evento final.
+        Gera `None` a cada `keepalive` segundos sem eventos.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            backlog = list(self._history.get(task_id, ()))
+            self._subscribers.setdefault(task_id, set()).add(queue)
+        try:
+            for event in backlog:
+                yield event
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(task_id)
+                if subscribers is not None:
+                    subscribers.discard(queue)
+                    if not subscribers:
+                        del self._subscribers[task_id]
+
+    def _purge_expired(self):
+        # Chamado com o lock; descarta o histórico de tarefas encerradas há muito tempo
+        now = time.time()
+        expired = [t for t, ts in self._finished_at.items() if now - ts > self.retention_seconds]
+        for task_id in expired:
+            del self._finished_at[task_id]
+            self._history.pop(task_id, None)
+
+
+task_event_bus = TaskEventBus(
+    history_size=settings.task_events_history,
+    retention_seconds=settings.task_events_retention_seconds,
+)
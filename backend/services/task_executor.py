@@ -0,0 +1,392 @@
+# backend/services/task_executor.py
+import time
+import logging
+import functools
+import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from backend.lib import telemetry
+from backend.lib.settings import settings
+from backend.services.task_scheduler import FairTaskQueue, QueuedTask, INTERACTIVE, BATCH
+
+logger = logging.getLogger(__name__)
+
+# --- Eventos de ciclo de vida (worker -> API) ---
+# Em modo thread os eventos são despachados direto; em modo processo o filho
+# escreve numa fila multiprocessing e uma thread do processo pai despacha.
+EventListener = Callable[[str, Dict[str, Any]], None]
+_event_listeners: List[EventListener] = []
+_child_event_queue = None # Só é definido dentro dos processos filhos
+
+def add_event_listener(listener: EventListener):
+    if listener not in _event_listeners:
+        _event_listeners.append(listener)
+
+def report_event(task_id: str, event_type: str, **data):
+    """Publica um evento da tarefa (pode ser chamado de dentro do código da Crew)."""
+    event = {"type": event_type, "ts": time.time(), **data}
+    if _child_event_queue is not None:
+        _child_event_queue.put((task_id, event))
+    else:
+        _dispatch_event(task_id, event)
+
+def _dispatch_event(task_id: str, event: Dict[str, Any]):
+    for listener in list(_event_listeners):
+        try:
+            listener(task_id, event)
+        except Exception as e:
+            logger.error(f"Event listener failed for task {task_id} ({event.get('type')}): {e}", exc_info=True)
+
+def _init_child(event_queue):
+    global _child_event_queue
+    _child_event_queue = event_queue
+    telemetry.configure_tracing() # Cada processo filho exporta os próprios spans
+
+
+class TaskCancelledError(Exception):
+    """A tarefa foi cancelada (DELETE /api/v1/tasks/{id}) antes de terminar."""
+
+
+# Tarefas em execução marcadas para cancelamento (checadas pelo próprio worker)
+_cancelled_tasks: Set[str] = set()
+
+def raise_if_cancelled(task_id: Optional[str]):
+    """Ponto de cancelamento cooperativo: o llm_gateway chama antes de cada chamada de LLM."""
+    if task_id and task_id in _cancelled_tasks:
+        raise TaskCancelledError(f"Task {task_id} was cancelled.")
+
+
+class ExecutorSaturatedError(Exception):
+    """Levantada quando o pool e a fila de espera estão cheios (admission control)."""
+
+    def __init__(self, queue_depth: int, retry_after: int):
+        super().__init__(f"Task executor saturated (queue depth {queue_depth}).")
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+
+
+def _run_timed(task_id: str, fn: Callable[..., Any], kwargs: Dict[str, Any], submitted_at: float,
+               trace_carrier: Dict[str, str]):
+    # Roda dentro do worker (thread ou processo filho); devolve o resultado junto
+    # com os timestamps para o processo pai calcular tempo de fila e de execução.
+    started_at = time.time()
+    report_event(task_id, "started", queue_wait=started_at - submitted_at)
+    # Spans filhos da requisição que criou a tarefa (o contexto veio no carrier)
+    parent = telemetry.extract_context(trace_carrier)
+    with telemetry.span("task.queue_wait", context=parent, start_time=int(submitted_at * 1e9), task_id=task_id):
+        pass
+    with telemetry.span("task.run", context=parent, task_id=task_id, function=getattr(fn, "__name__", None)):
+        result = fn(**kwargs)
+    return result, started_at, time.time()
+
+
+class TaskExecutor:
+    """
+    Pool limitado para as Crews (que são bloqueantes), separado do threadpool
+    que atende as requisições. Aceita no máximo `max_workers` execuções
+    simultâneas e `max_queue` tarefas esperando; acima disso `submit` recusa.
+
+    As tarefas esperam numa fila justa (ver task_scheduler) e só vão para o
+    pool quando há worker livre: a ordem é por usuário e classe de prioridade,
+    não por chegada, e cada usuário tem cota de execuções e de fila.
+
+    No modo fila (TASK_QUEUE_BACKEND != local) o processo da API não roda
+    Crews: `start(dispatcher=...)` faz `submit`/`cancel`/métricas delegarem ao
+    QueueDispatcher (ver task_queue), e quem roda é `python -m backend.worker`.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 20, kind: str = "thread",
+                 user_max_running: int = 0, user_max_queued: int = 0,
+                 weights: Optional[Dict[str, float]] = None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Invalid executor kind: {kind!r} (use 'thread' or 'process').")
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self._pool: Optional[ThreadPoolExecutor | ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._queue = FairTaskQueue(weights or {INTERACTIVE: 1.0, BATCH: 1.0},
+                                    user_max_running=user_max_running, user_max_queued=user_max_queued)
+        self._running: Dict[str, Tuple[Future, QueuedTask]] = {}
+        self._idle = threading.Event() # Nada rodando nem esperando (usado no drain do shutdown)
+        self._idle.set()
+        self._accepting = False
+        self._event_queue = None
+        self._event_pump: Optional[threading.Thread] = None
+        self._remote = None # QueueDispatcher no modo fila
+        # Métricas
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._run_times: deque = deque(maxlen=500)
+        self._wait_times: deque = deque(maxlen=500)
+
+    # --- Ciclo de vida ---
+    def start(self, dispatcher=None):
+        if dispatcher is not None:
+            self._remote = dispatcher
+            dispatcher.start()
+            return
+        with self._lock:
+            if self._pool is not None:
+                return
+            if self.kind == "process":
+                self._event_queue = multiprocessing.get_context().Queue()
+                self._event_pump = threading.Thread(target=self._pump_events, name="crew-event-pump", daemon=True)
+                self._event_pump.start()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers, initializer=_init_child, initargs=(self._event_queue,)
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="crew-worker")
+            self._accepting = True
+        logger.info(f"Task executor started ({self.kind}, workers={self.max_workers}, queue={self.max_queue}).")
+
+    async def shutdown(self, drain_timeout: float = 30.0, fail_pending: bool = True):
+        """
+        Para de aceitar tarefas e espera as que estão em andamento ou na fila (até `drain_timeout`).
+        Com `fail_pending=False`, as que sobrarem na fila ficam PENDING para a recuperação
+        de outro processo (task_recovery) em vez de marcadas como FAILED.
+        """
+        if self._remote is not None:
+            await self._remote.shutdown(drain_timeout, fail_pending)
+            return
+        with self._lock:
+            if self._pool is None:
+                return
+            self._accepting = False
+            pending = len(self._running) + len(self._queue)
+            pool = self._pool
+        if pending:
+            logger.info(f"Draining task executor: waiting for {pending} task(s) up to {drain_timeout}s...")
+            if not await asyncio.to_thread(self._idle.wait, drain_timeout):
+                logger.warning("Task executor drain timed out; unfinished tasks will be dropped.")
+        with self._lock:
+            leftovers = self._queue.drain()
+        if fail_pending:
+            for task in leftovers:
+                self._finish(task, None, RuntimeError(f"Task {task.task_id} was cancelled before running."))
+        elif leftovers:
+            logger.info(f"Leaving {len(leftovers)} queued task(s) for recovery by another worker.")
+        pool.shutdown(wait=False, cancel_futures=True)
+        if self._event_queue is not None:
+            self._event_queue.put(None) # Encerra a thread de despacho
+            self._event_pump.join(timeout=5)
+            self._event_queue = None
+            self._event_pump = None
+        with self._lock:
+            self._pool = None
+        logger.info("Task executor stopped.")
+
+    def _pump_events(self):
+        queue = self._event_queue
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            _dispatch_event(*item)
+
+    # --- Submissão ---
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    @property
+    def is_remote(self) -> bool:
+        """True no modo fila: as tarefas rodam nos workers, não neste processo."""
+        return self._remote is not None
+
+    def idle_workers(self) -> int:
+        # Workers livres sem nada esperando na fila local (quanto um worker de fila pode pegar agora)
+        with self._lock:
+            return max(0, self.max_workers - len(self._running) - len(self._queue))
+
+    def is_saturated(self, user: Optional[str] = None) -> bool:
+        """Pool e fila cheios ou, com `user`, a cota de fila desse usuário esgotada."""
+        if self._remote is not None:
+            return self._remote.is_saturated(user)
+        return len(self._running) + len(self._queue) >= self.capacity or self._queue.user_queue_full(user)
+
+    def queue_depth(self) -> int:
+        # Tarefas aceitas que ainda não ganharam um worker.
+        if self._remote is not None:
+            return self._remote.queue_depth()
+        return len(self._queue)
+
+    def submit(self, task_id: str, fn: Callable[..., Any], /, *, user: Optional[str] = None,
+               priority: str = INTERACTIVE, on_done: Optional[Callable[[Any, Optional[BaseException]], None]] = None,
+               **kwargs) -> int:
+        """
+        Agenda `fn(**kwargs)` em nome de `user` com a classe `priority`.
+        Retorna a posição na fila (0 = já vai rodar). Levanta
+        ExecutorSaturatedError se não houver espaço ou se `user` esgotou a
+        cota de fila. `on_done(result, error)` é chamado ao final, fora do
+        lock, na thread que completou o future.
+        """
+        if self._remote is not None:
+            return self._remote.submit(task_id, fn, user=user, priority=priority, on_done=on_done, **kwargs)
+        with self._lock:
+            if not self._accepting or self._pool is None:
+                raise RuntimeError("Task executor is not running.")
+            if self.is_saturated(user):
+                self._rejected += 1
+                depth = self.queue_depth()
+                raise ExecutorSaturatedError(depth, retry_after=self.estimate_retry_after(depth))
+            task = QueuedTask(task_id, fn, kwargs, on_done, user, priority, telemetry.inject_context())
+            position = self._queue.push(task) + 1
+            self._submitted += 1
+            self._idle.clear()
+            started = self._dispatch()
+        self._watch(started)
+        return 0 if any(queued is task for queued, _ in started) else position
+
+    def _dispatch(self) -> List[Tuple[QueuedTask, Future]]:
+        # Chamado com o lock: entrega ao pool as próximas tarefas da fila justa enquanto houver worker livre
+        started = []
+        while self._pool is not None and len(self._running) < self.max_workers:
+            task = self._queue.pop()
+            if task is None:
+                break
+            future = self._pool.submit(_run_timed, task.task_id, task.fn, task.kwargs, task.submitted_at,
+                                       task.trace_carrier)
+            self._running[task.task_id] = (future, task)
+            started.append((task, future))
+        return started
+
+    def _watch(self, started: List[Tuple[QueuedTask, Future]]):
+        # Fora do lock: um future que já terminou chama o callback na hora
+        for task, future in started:
+            future.add_done_callback(functools.partial(self._on_done, task))
+
+    def _on_done(self, task: QueuedTask, future: Future):
+        result, error = None, None
+        with self._lock:
+            self._running.pop(task.task_id, None)
+            self._queue.release(task.user)
+            cancelled = task.task_id in _cancelled_tasks
+            _cancelled_tasks.discard(task.task_id)
+            if cancelled:
+                error = TaskCancelledError(f"Task {task.task_id} was cancelled.")
+            elif future.cancelled():
+                error = RuntimeError(f"Task {task.task_id} was cancelled before running.")
+            elif future.exception() is not None:
+                error = future.exception()
+                self._failed += 1
+                logger.error(f"Task {task.task_id} raised in executor: {error}")
+            else:
+                result, started_at, finished_at = future.result()
+                self._completed += 1
+                self._wait_times.append(started_at - task.submitted_at)
+                self._run_times.append(finished_at - started_at)
+            started = self._dispatch()
+            self._update_idle()
+        self._watch(started)
+        # Cancelada em execução: o evento `cancelled` já foi publicado por `cancel`
+        self._finish(task, result, error, publish=not cancelled)
+
+    def _finish(self, task: QueuedTask, result: Any, error: Optional[BaseException], publish: bool = True):
+        if task.on_done is not None:
+            try:
+                task.on_done(result, error)
+            except Exception as callback_error:
+                logger.error(f"on_done callback for task {task.task_id} failed: {callback_error}", exc_info=True)
+        if not publish:
+            return
+        if error is None:
+            _dispatch_event(task.task_id, {"type": "completed", "ts": time.time(), "result": result})
+        else:
+            _dispatch_event(task.task_id, {"type": "failed", "ts": time.time(), "error": str(error)})
+
+    def _update_idle(self):
+        # Chamado com o lock
+        if not self._running and not len(self._queue):
+            self._idle.set()
+
+    # --- Cancelamento ---
+    def cancel(self, task_id: str) -> Optional[str]:
+        """
+        Cancela uma tarefa deste executor: "queued" se ela saiu da fila antes
+        de rodar, "running" se estava em execução, None se o executor não a
+        conhece. Em execução o cancelamento é cooperativo: no modo thread a
+        Crew é interrompida na próxima chamada de LLM (`raise_if_cancelled`);
+        no modo processo ela termina no filho e o resultado é descartado.
+        """
+        if self._remote is not None:
+            return self._remote.cancel(task_id)
+        with self._lock:
+            task = self._queue.remove(task_id)
+            if task is not None:
+                where = "queued"
+            elif task_id in self._running:
+                _cancelled_tasks.add(task_id)
+                task, where = self._running[task_id][1], "running"
+            else:
+                return None
+            self._cancelled += 1
+            self._update_idle()
+        if where == "queued":
+            self._finish(task, None, TaskCancelledError(f"Task {task_id} was cancelled."), publish=False)
+        _dispatch_event(task_id, {"type": "cancelled", "ts": time.time(), "error": "Task cancelled by request."})
+        logger.info(f"Task {task_id} cancelled ({where}).")
+        return where
+
+    def estimate_retry_after(self, depth: int) -> int:
+        # Estimativa simples: tempo médio de execução * rodadas até liberar uma vaga.
+        if self._remote is not None:
+            return self._remote.estimate_retry_after(depth)
+        avg = (sum(self._run_times) / len(self._run_times)) if self._run_times else 30.0
+        rounds = depth // max(1, self.max_workers) + 1
+        return max(1, int(avg * rounds))
+
+    # --- Métricas ---
+    def stats(self) -> Dict[str, Any]:
+        if self._remote is not None:
+            return self._remote.stats()
+        with self._lock:
+            run_times = sorted(self._run_times)
+            wait_times = sorted(self._wait_times)
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": len(self._running),
+                "queue_depth": self.queue_depth(),
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+                "scheduler": self._queue.stats(),
+                "run_time_seconds": _summary(run_times),
+                "queue_wait_seconds": _summary(wait_times),
+            }
+
+
+def _summary(values: list) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"avg": None, "p50": None, "p95": None, "max": None}
+    def pct(p: float) -> float:
+        return round(values[min(len(values) - 1, int(p * len(values)))], 3)
+    return {
+        "avg": round(sum(values) / len(values), 3),
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+        "max": round(values[-1], 3),
+    }
+
+
+# Instância compartilhada, configurada por variáveis de ambiente.
+task_executor = TaskExecutor(
+    max_workers=settings.task_workers,
+    max_queue=settings.task_queue_max,
+    kind=settings.task_executor_kind,
+    user_max_running=settings.task_user_max_running,
+    user_max_queued=settings.task_user_max_queued,
+    weights={INTERACTIVE: settings.task_interactive_weight, BATCH: 1.0},
+)
@@ -0,0 +1,404 @@
+# backend/services/task_queue.py
+# Fila compartilhada entre os nós da API e os workers (`python -m backend.worker`).
+#
+# Com TASK_QUEUE_BACKEND=local (padrão) cada processo da API roda as próprias
+# Crews no task_executor. Com "postgres" ou "sqlite" a API só enfileira: o
+# task_executor delega a um QueueDispatcher, e as Crews rodam nos workers, que
+# escalam separados da API (outros núcleos ou máquinas).
+#
+# A fila só transporta o ID da tarefa: a execução é remontada no worker a partir
+# de async_tasks.checkpoint, como na recuperação (ver task_recovery). Quem pega a
+# tarefa já sai com o lease (lease_owner/lease_expires_at), então a varredura de
+# recuperação dos workers retoma as tarefas de um worker que caiu.
+#
+# Nos dois backends, `queued_at` marca em async_tasks a tarefa que espera um
+# worker (sem lease, mas não órfã: a varredura de recuperação a deixa de fora).
+# Backend "postgres": a fila é a própria async_tasks. Colunas e função usadas
+# (além das de task_recovery.py):
+#   alter table async_tasks
+#     add column if not exists queued_at timestamptz,
+#     add column if not exists queue_priority text;
+#   create index if not exists async_tasks_queued_idx on async_tasks (queue_priority, queued_at)
+#     where status = 'PENDING' and queued_at is not null and lease_owner is null;
+#   create or replace function claim_async_tasks(worker text, max_tasks integer, lease_seconds double precision)
+#   returns setof async_tasks language sql as $$
+#     update async_tasks t
+#        set lease_owner = worker, heartbeat_at = now(),
+#            lease_expires_at = now() + make_interval(secs => lease_seconds)
+#      where t.id in (select id from async_tasks
+#                      where status = 'PENDING' and queued_at is not null and lease_owner is null
+#                      order by queue_priority = 'batch', queued_at
+#                      limit max_tasks
+#                      for update skip locked)
+#     returning t.*;
+#   $$;
+#
+# Backend "sqlite": a fila fica num arquivo local (TASK_QUEUE_SQLITE_PATH), para
+# testar API + workers numa máquina só; ":memory:" serve quando API e worker
+# rodam no mesmo processo (testes).
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.lib.settings import settings
+from backend.services.task_executor import ExecutorSaturatedError, TaskCancelledError, report_event
+from backend.services.task_registry import (task_registry, PENDING, PROCESSING, COMPLETED, FAILED, CANCELLED,
+                                            TERMINAL_STATUSES, RECOVERY_COLUMNS)
+from backend.services.task_scheduler import INTERACTIVE, PRIORITIES
+
+logger = logging.getLogger(__name__)
+
+# Colunas de uma tarefa tirada da fila (checkpoint para remontar a execução + classe de prioridade)
+CLAIM_COLUMNS = RECOVERY_COLUMNS + ("queue_priority",)
+# Colunas que a API acompanha das tarefas que enfileirou
+_POLL_COLUMNS = ("id", "status", "result", "error_message", "token_usage", "updated_at")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class TaskQueueBackend:
+    """Fila compartilhada: a API chama `enqueue`, os workers chamam `claim`."""
+    name = "base"
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def enqueue(self, task_ids: List[str], priority: str):
+        raise NotImplementedError
+
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+        """Até `limit` tarefas (linhas de async_tasks com CLAIM_COLUMNS), já com o lease de `owner`."""
+        raise NotImplementedError
+
+
+class PostgresTaskQueue(TaskQueueBackend):
+    """Fila em async_tasks: `queued_at` libera a tarefa e a função claim_async_tasks a entrega com SKIP LOCKED."""
+    name = "postgres"
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def enqueue(self, task_ids: List[str], priority: str):
+        await self.repository.mark_queued(task_ids, priority, queued_at=_now().isoformat())
+
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+        return await self.repository.claim_queued(owner, limit, lease_seconds, columns=CLAIM_COLUMNS)
+
+
+class SqliteTaskQueue(TaskQueueBackend):
+    """
+    Fila num arquivo SQLite (ou em memória). O `begin immediate` serializa os
+    workers que tiram da fila ao mesmo tempo: cada um reserva as linhas
+    (`claimed_by`/`claimed_at`) e toma o lease em async_tasks, só das tarefas
+    que ainda estão PENDING e sem dono. As linhas só saem da fila depois do
+    lease gravado; se ele falhar, voltam para a fila. Reserva de um worker que
+    caiu no meio vale por um lease e depois volta a ser entregue.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str, repository):
+        self.path = path
+        self.repository = repository
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    async def start(self):
+        if self._conn is None:
+            await asyncio.to_thread(self._open)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        if self.path != ":memory:":
+            conn.execute("pragma journal_mode=wal") # API e workers em processos diferentes
+        conn.execute("create table if not exists task_queue (task_id text primary key, priority text not null, "
+                     "enqueued_at real not null, claimed_by text, claimed_at real)")
+        columns = {row[1] for row in conn.execute("pragma table_info(task_queue)")}
+        for column, kind in (("claimed_by", "text"), ("claimed_at", "real")):
+            if column not in columns: # Arquivo de fila criado por uma versão anterior
+                conn.execute(f"alter table task_queue add column {column} {kind}")
+        self._conn = conn
+
+    async def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def enqueue(self, task_ids: List[str], priority: str):
+        # Primeiro async_tasks: uma tarefa entregue a um worker já está marcada como enfileirada
+        await self.repository.mark_queued(task_ids, priority, queued_at=_now().isoformat())
+        now = time.time()
+        await asyncio.to_thread(self._execute, "insert or ignore into task_queue (task_id, priority, enqueued_at) "
+                                "values (?, ?, ?)", [(task_id, priority, now) for task_id in task_ids])
+
+    def _execute(self, sql: str, rows: List[tuple]):
+        with self._lock:
+            self._conn.executemany(sql, rows)
+
+    def _reserve(self, owner: str, limit: int, lease_seconds: float) -> List[Tuple[str, str]]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("begin immediate")
+            try:
+                rows = self._conn.execute("select task_id, priority from task_queue "
+                                          "where claimed_at is null or claimed_at < ? "
+                                          "order by priority = 'batch', enqueued_at limit ?",
+                                          (now - lease_seconds, limit)).fetchall()
+                self._conn.executemany("update task_queue set claimed_by = ?, claimed_at = ? where task_id = ?",
+                                       [(owner, now, row[0]) for row in rows])
+                self._conn.execute("commit")
+            except Exception:
+                self._conn.execute("rollback")
+                raise
+        return rows
+
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+        reserved = dict(await asyncio.to_thread(self._reserve, owner, limit, lease_seconds))
+        if not reserved:
+            return []
+        keys = [(task_id, owner) for task_id in reserved]
+        now = _now()
+        try:
+            # Tarefas canceladas enquanto estavam na fila ficam de fora (não estão mais PENDING)
+            rows = await self.repository.lease_tasks(list(reserved), columns=RECOVERY_COLUMNS, lease_owner=owner,
+                                                     heartbeat_at=now.isoformat(),
+                                                     lease_expires_at=(now + timedelta(seconds=lease_seconds)).isoformat())
+        except Exception:
+            await asyncio.to_thread(self._execute, "update task_queue set claimed_by = null, claimed_at = null "
+                                    "where task_id = ? and claimed_by = ?", keys)
+            raise
+        await asyncio.to_thread(self._execute, "delete from task_queue where task_id = ? and claimed_by = ?", keys)
+        return [{**row, "queue_priority": reserved[row["id"]]} for row in rows]
+
+
+def create_task_queue(kind: str, repository) -> Optional[TaskQueueBackend]:
+    """Backend de TASK_QUEUE_BACKEND; None para "local" (a API roda as tarefas)."""
+    if kind == "local":
+        return None
+    if kind == "postgres":
+        return PostgresTaskQueue(repository)
+    if kind == "sqlite":
+        return SqliteTaskQueue(settings.task_queue_sqlite_path, repository)
+    raise ValueError(f"Invalid task queue backend: {kind!r} (use 'local', 'postgres' or 'sqlite').")
+
+
+class _Watch:
+    """Tarefa enfileirada por este nó da API, acompanhada até finalizar."""
+    __slots__ = ("user", "priority", "on_done", "started")
+
+    def __init__(self, user: Optional[str], priority: str, on_done):
+        self.user = user
+        self.priority = priority
+        self.on_done = on_done
+        self.started = False
+
+
+class QueueDispatcher:
+    """
+    Lado da API no modo fila, no lugar do pool do task_executor: `submit` só
+    grava a tarefa na fila e um laço no event loop acompanha em async_tasks as
+    tarefas enfileiradas por este nó, publicando aqui o início e o fim (SSE,
+    cache de resultados, seguidores do single-flight, lotes). Os eventos
+    intermediários das etapas ficam no worker.
+    """
+    kind = "queue"
+
+    def __init__(self, backend: TaskQueueBackend, repository, max_inflight: int = 200,
+                 poll_seconds: float = 1.0, user_max_queued: int = 0):
+        self.backend = backend
+        self.repository = repository
+        self.max_inflight = max_inflight
+        self.poll_seconds = poll_seconds
+        self.user_max_queued = user_max_queued
+        self._lock = threading.Lock()
+        self._watched: Dict[str, _Watch] = {}
+        self._outbox: List[Tuple[str, str]] = [] # (task_id, prioridade) ainda não gravados na fila
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._accepting = False
+        # Métricas
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+
+    # --- Ciclo de vida ---
+    def start(self):
+        """Chamar dentro do lifespan: o acompanhamento roda no event loop da API."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._poller = self._loop.create_task(self._run())
+        self._accepting = True
+        logger.info(f"Task queue dispatcher started (backend {self.backend.name}); crews run in backend.worker.")
+
+    async def shutdown(self, drain_timeout: float = 30.0, fail_pending: bool = True):
+        # As tarefas enfileiradas continuam nos workers; só o que não chegou à fila é gravado agora
+        self._accepting = False
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+        await self._flush_outbox()
+        await self.backend.close()
+        logger.info(f"Task queue dispatcher stopped ({len(self._watched)} task(s) still running in workers).")
+
+    async def _run(self):
+        await self.backend.start()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._flush_outbox()
+                await self._poll()
+            except Exception as e:
+                logger.error(f"Task queue dispatcher round failed: {e}", exc_info=True)
+
+    # --- Submissão ---
+    def submit(self, task_id: str, fn, /, *, user: Optional[str] = None, priority: str = INTERACTIVE,
+               on_done=None, **kwargs) -> int:
+        """
+        Mesma assinatura de TaskExecutor.submit. `fn`/`kwargs` não viajam: o
+        worker remonta a análise a partir do checkpoint gravado com a tarefa.
+        Retorna quantas tarefas deste nó ainda esperam um worker antes dela.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown task priority: {priority!r}")
+        with self._lock:
+            if not self._accepting:
+                raise RuntimeError("Task executor is not running.")
+            if self.is_saturated(user):
+                self._rejected += 1
+                depth = self.queue_depth()
+                raise ExecutorSaturatedError(depth, retry_after=self.estimate_retry_after(depth))
+            position = self.queue_depth()
+            self._watched[task_id] = _Watch(user, priority, on_done)
+            self._outbox.append((task_id, priority))
+            self._submitted += 1
+        self._loop.call_soon_threadsafe(self._wakeup.set) # submit pode vir de outra thread (lotes)
+        return position
+
+    def is_saturated(self, user: Optional[str] = None) -> bool:
+        if len(self._watched) >= self.max_inflight:
+            return True
+        if not user or self.user_max_queued <= 0:
+            return False
+        waiting = sum(1 for watch in list(self._watched.values()) if watch.user == user and not watch.started)
+        return waiting >= self.user_max_queued
+
+    def queue_depth(self) -> int:
+        return sum(1 for watch in list(self._watched.values()) if not watch.started)
+
+    def estimate_retry_after(self, depth: int) -> int:
+        return max(1, int(self.poll_seconds * 5))
+
+    async def _flush_outbox(self):
+        with self._lock:
+            outbox, self._outbox = self._outbox, []
+        by_priority: Dict[str, List[str]] = {}
+        for task_id, priority in outbox:
+            by_priority.setdefault(priority, []).append(task_id)
+        for priority, task_ids in by_priority.items():
+            try:
+                await self.backend.enqueue(task_ids, priority)
+            except Exception as e:
+                logger.warning(f"Could not enqueue {len(task_ids)} task(s), retrying: {e}")
+                with self._lock:
+                    self._outbox[:0] = [(task_id, priority) for task_id in task_ids if task_id in self._watched]
+
+    # --- Acompanhamento ---
+    async def _poll(self):
+        with self._lock:
+            pending = {task_id for task_id, _ in self._outbox}
+            task_ids = [task_id for task_id in self._watched if task_id not in pending]
+        for start in range(0, len(task_ids), 200):
+            for row in await self.repository.get_tasks(task_ids[start:start + 200], columns=_POLL_COLUMNS):
+                self._observe(row)
+
+    def _observe(self, row: Dict[str, Any]):
+        task_id, status = row["id"], row.get("status")
+        with self._lock:
+            watch = self._watched.get(task_id)
+            if watch is None:
+                return
+            first_start = status == PROCESSING and not watch.started
+            watch.started = watch.started or status != PENDING
+            if status in TERMINAL_STATUSES:
+                del self._watched[task_id]
+        if first_start:
+            report_event(task_id, "started", remote=True)
+        if status not in TERMINAL_STATUSES:
+            return
+        task_registry.sync(row) # Estado gravado pelo worker: a API não regrava
+        if status == COMPLETED:
+            self._completed += 1
+            result, error = row.get("result"), None
+            event = {"result": result}
+        else:
+            if status == CANCELLED:
+                self._cancelled += 1
+            else:
+                self._failed += 1
+            result, error = None, RuntimeError(row.get("error_message") or f"Task {task_id} {status.lower()}.")
+            event = {"error": row.get("error_message")}
+        self._call_on_done(task_id, watch, result, error)
+        report_event(task_id, "completed" if status == COMPLETED else status.lower(), remote=True, **event)
+
+    @staticmethod
+    def _call_on_done(task_id: str, watch: _Watch, result: Any, error: Optional[BaseException]):
+        if watch.on_done is not None:
+            try:
+                watch.on_done(result, error)
+            except Exception as callback_error:
+                logger.error(f"on_done callback for task {task_id} failed: {callback_error}", exc_info=True)
+
+    # --- Cancelamento ---
+    def cancel(self, task_id: str) -> Optional[str]:
+        """
+        Cancela uma tarefa enfileirada por este nó. O status CANCELLED gravado
+        aqui tira a tarefa da fila; se um worker já a pegou, ele perde o lease
+        no próximo heartbeat e interrompe a execução.
+        """
+        with self._lock:
+            watch = self._watched.pop(task_id, None)
+            if watch is None:
+                return None
+            self._outbox = [item for item in self._outbox if item[0] != task_id]
+            self._cancelled += 1
+        where = "running" if watch.started else "queued"
+        self._call_on_done(task_id, watch, None, TaskCancelledError(f"Task {task_id} was cancelled."))
+        report_event(task_id, "cancelled", error="Task cancelled by request.")
+        logger.info(f"Task {task_id} cancelled ({where}, queue mode).")
+        return where
+
+    # --- Métricas ---
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waiting = self.queue_depth()
+            return {
+                "kind": f"{self.kind}:{self.backend.name}",
+                "max_inflight": self.max_inflight,
+                "running": len(self._watched) - waiting,
+                "queue_depth": waiting,
+                "unsent": len(self._outbox),
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+            }
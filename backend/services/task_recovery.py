@@ -0,0 +1,232 @@
+# backend/services/task_recovery.py
+# Leases e recuperação de tarefas interrompidas (deploy, crash, reload).
+#
+# Toda tarefa não finalizada tem um dono (`lease_owner` = este processo) e um
+# prazo (`lease_expires_at`), renovado por heartbeat enquanto ela está na
+# fila ou rodando. A cada lease, a varredura procura tarefas PENDING/PROCESSING
+# com lease vencido e as assume com um compare-and-set no PostgREST: dois
+# processos nunca retomam a mesma tarefa. A API então as reagenda a partir do
+# último checkpoint gravado pelo worker (ver crew_service.run_niche_analysis_task).
+#
+# Colunas usadas em async_tasks:
+#   alter table async_tasks
+#     add column if not exists checkpoint jsonb,
+#     add column if not exists lease_owner text,
+#     add column if not exists lease_expires_at timestamptz,
+#     add column if not exists heartbeat_at timestamptz,
+#     add column if not exists attempts integer not null default 0;
+#   create index if not exists async_tasks_unfinished_lease_idx
+#     on async_tasks (lease_expires_at) where status in ('PENDING', 'PROCESSING');
+import os
+import uuid
+import socket
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from backend.lib.settings import settings
+from backend.services.task_events import TERMINAL_EVENTS
+from backend.services.task_executor import task_executor
+from backend.services.task_registry import FAILED, RECOVERY_COLUMNS, TERMINAL_STATUSES
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_id() -> str:
+    # O sufixo aleatório distingue reinícios com o mesmo PID (ex.: PID 1 em contêiner)
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+def _iso(moment: datetime) -> str:
+    return moment.isoformat()
+
+
+class TaskLeases:
+    """
+    Leases das tarefas deste processo: carimba as tarefas novas, renova os
+    leases num único PATCH por heartbeat e, na varredura periódica, assume as
+    tarefas órfãs de processos que pararam de renovar.
+    """
+
+    def __init__(self, owner: Optional[str] = None, lease_seconds: float = 60.0, heartbeat_seconds: float = 15.0,
+                 max_attempts: int = 3, sweep_limit: int = 500, exclude_queued: bool = False):
+        self.owner = owner or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.max_attempts = max_attempts
+        self.sweep_limit = sweep_limit
+        self.exclude_queued = exclude_queued # Modo fila: tarefas em async_tasks à espera de um worker
+        self._repository = None
+        self._owned: Set[str] = set()
+        self._lock = threading.Lock()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.renewals = 0
+        self.lost = 0
+        self.recovered = 0
+        self.abandoned = 0
+
+    # --- Ciclo de vida ---
+    def start(self, repository):
+        """Começa o heartbeat no event loop corrente (chamar dentro do lifespan)."""
+        if repository is None or not repository.db.available:
+            logger.warning("Task leases disabled: no database.")
+            return
+        self._repository = repository
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.get_running_loop().create_task(self._heartbeat_loop())
+        logger.info(f"Task leases started (owner {self.owner}, lease {self.lease_seconds}s).")
+
+    async def stop(self, release: bool = True):
+        """Para o heartbeat e, com `release`, vence já os leases restantes (o próximo processo os retoma)."""
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+        if release:
+            with self._lock:
+                owned = list(self._owned)
+            await self.release(owned)
+
+    async def release(self, task_ids: List[str]):
+        """Vence já os leases de `task_ids` (outro processo, ou a próxima varredura, as retoma)."""
+        with self._lock:
+            self._owned.difference_update(task_ids)
+        if not task_ids or self._repository is None:
+            return
+        expired = _iso(datetime.now(timezone.utc) - timedelta(seconds=1))
+        try:
+            await self._renew(task_ids, lease_expires_at=expired)
+            logger.info(f"Released {len(task_ids)} unfinished task lease(s) for recovery.")
+        except Exception as e:
+            logger.warning(f"Could not release {len(task_ids)} task lease(s) (they expire in "
+                           f"{self.lease_seconds}s): {e}")
+
+    # --- Carimbo / acompanhamento ---
+    def stamp(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Marca uma linha nova de async_tasks como deste processo (antes do insert)."""
+        row["lease_owner"] = self.owner
+        row["lease_expires_at"] = _iso(datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds))
+        with self._lock:
+            self._owned.add(row["id"])
+        return row
+
+    def adopt(self, rows: List[Dict[str, Any]]):
+        """Acompanha tarefas já assumidas no banco por este processo (ex.: tiradas da fila por um worker)."""
+        with self._lock:
+            self._owned.update(row["id"] for row in rows)
+
+    def on_executor_event(self, task_id: str, event: Dict[str, Any]):
+        # Listener do task_executor: tarefa finalizada não precisa mais de lease
+        if event["type"] in TERMINAL_EVENTS:
+            with self._lock:
+                self._owned.discard(task_id)
+
+    # --- Heartbeat ---
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            with self._lock:
+                owned = list(self._owned)
+            if not owned:
+                continue
+            now = datetime.now(timezone.utc)
+            try:
+                kept = await self._renew(owned, heartbeat_at=_iso(now),
+                                         lease_expires_at=_iso(now + timedelta(seconds=self.lease_seconds)))
+            except Exception as e:
+                logger.warning(f"Lease heartbeat for {len(owned)} task(s) failed: {e}")
+                continue
+            self.renewals += 1
+            lost = set(owned) - set(kept)
+            if lost:
+                with self._lock:
+                    self._owned.difference_update(lost)
+                self.lost += len(lost)
+                await self._on_lost(sorted(lost))
+
+    async def _on_lost(self, task_ids: List[str]):
+        # Tarefa finalizada no banco por outro nó (ex.: DELETE num nó da API no modo fila): interrompe
+        # a execução local. Senão outro processo assumiu o lease: só deixa de renovar.
+        try:
+            rows = await self._repository.get_tasks(task_ids, columns=("id", "status"))
+        except Exception as e:
+            logger.warning(f"Could not check {len(task_ids)} lost task lease(s): {e}")
+            rows = []
+        finished = [row["id"] for row in rows if row.get("status") in TERMINAL_STATUSES]
+        for task_id in finished:
+            task_executor.cancel(task_id)
+        taken = len(task_ids) - len(finished)
+        if taken:
+            logger.warning(f"Lost the lease of {taken} task(s) to another worker: {task_ids[:5]}")
+
+    async def _renew(self, task_ids: List[str], **fields) -> List[str]:
+        kept = []
+        for start in range(0, len(task_ids), 200):
+            kept += await self._repository.renew_leases(task_ids[start:start + 200], self.owner, **fields)
+        return kept
+
+    # --- Recuperação ---
+    async def claim_orphans(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Assume até `limit` tarefas órfãs (lease vencido) e retorna as linhas
+        assumidas, com o checkpoint, para reagendar. Tarefas já interrompidas
+        `max_attempts` vezes são marcadas como FAILED em vez de retomadas.
+        """
+        if self._repository is None or limit == 0:
+            return []
+        now = datetime.now(timezone.utc)
+        window = dict(now=_iso(now), stale_before=_iso(now - timedelta(seconds=self.lease_seconds)),
+                      exclude_queued=self.exclude_queued)
+        limit = self.sweep_limit if limit is None else min(limit, self.sweep_limit)
+        orphans = await self._repository.find_orphaned_tasks(limit=limit, columns=RECOVERY_COLUMNS,
+                                                             **window)
+        claimed = []
+        for row in orphans:
+            attempts = row.get("attempts") or 0
+            if attempts >= self.max_attempts:
+                fields = {"status": FAILED, "updated_at": window["now"],
+                          "error_message": f"Tarefa interrompida {attempts} vez(es); recuperação abandonada."}
+            else:
+                fields = {"lease_owner": self.owner, "heartbeat_at": window["now"],
+                          "lease_expires_at": _iso(now + timedelta(seconds=self.lease_seconds))}
+            won = await self._repository.claim_task(row["id"], expected_attempts=attempts, columns=RECOVERY_COLUMNS,
+                                                    attempts=attempts + 1, **fields, **window)
+            if won is None:
+                continue # Outro processo chegou antes
+            if won["status"] == FAILED:
+                self.abandoned += 1
+                logger.warning(f"Task {row['id']} abandoned after {attempts} interrupted attempt(s).")
+                continue
+            with self._lock:
+                self._owned.add(won["id"])
+            claimed.append(won)
+        self.recovered += len(claimed)
+        if orphans:
+            logger.info(f"Recovery sweep: {len(orphans)} orphaned task(s), {len(claimed)} claimed by {self.owner}.")
+        return claimed
+
+    # --- Métricas ---
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            owned = len(self._owned)
+        return {
+            "owner": self.owner,
+            "owned": owned,
+            "renewals": self.renewals,
+            "lost": self.lost,
+            "recovered": self.recovered,
+            "abandoned": self.abandoned,
+        }
+
+
+task_leases = TaskLeases(
+    owner=settings.task_worker_id,
+    lease_seconds=settings.task_lease_seconds,
+    heartbeat_seconds=settings.task_heartbeat_seconds,
+    max_attempts=settings.task_recovery_max_attempts,
+    exclude_queued=settings.task_queue_backend != "local", # Com fila, PENDING sem lease é tarefa esperando worker
+)
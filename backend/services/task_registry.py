@@ -0,0 +1,250 @@
+# backend/services/task_registry.py
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from backend.lib.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Estados do ciclo de vida em async_tasks
+PENDING = "PENDING"
+PROCESSING = "PROCESSING"
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+CANCELLED = "CANCELLED" # DELETE /api/v1/tasks/{id}
+TERMINAL_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+# Colunas gravadas no upsert em lote (todas as linhas precisam ter as mesmas chaves).
+# As colunas de lease ficam de fora: são só do task_recovery (heartbeat/claim).
+_ROW_COLUMNS = ("id", "project_id", "user_id", "task_type", "status", "result", "error_message",
+                "token_usage", "checkpoint", "updated_at")
+# Lidas pela varredura de recuperação
+RECOVERY_COLUMNS = _ROW_COLUMNS + ("attempts", "lease_owner")
+
+
+class TaskRegistry:
+    """
+    Estado das tarefas mantido em memória, servindo o endpoint de status sem
+    ir ao banco. As mudanças são gravadas em `async_tasks` por write-behind:
+    uma thread junta as atualizações pendentes (a última de cada tarefa vence)
+    e faz um único upsert por ciclo.
+    """
+
+    def __init__(self, flush_interval: float = 0.5, batch_size: int = 100, max_entries: int = 10000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self._repository = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    # --- Ciclo de vida ---
+    def start(self, repository, loop: asyncio.AbstractEventLoop):
+        """`repository` é o TaskRepository assíncrono; as gravações rodam no `loop` da API."""
+        self._repository = repository
+        self._loop = loop
+        if repository is None or not repository.db.available:
+            self._repository = None
+            logger.warning("Task registry started without a database; status will be memory-only.")
+        if self._flusher is not None:
+            return
+        self._stopping.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, name="task-registry-flusher", daemon=True)
+        self._flusher.start()
+
+    async def stop(self):
+        if self._flusher is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        await asyncio.to_thread(self._flusher.join, 10)
+        self._flusher = None
+        while True: # Garante que nada ficou pendente
+            batch = self._take_batch()
+            if not batch:
+                break
+            try:
+                await self._write(batch)
+            except Exception as e:
+                logger.error(f"Final flush of {len(batch)} task update(s) failed: {e}")
+                break
+
+    # --- Escrita ---
+    def register(self, record: Dict[str, Any]):
+        """Registra uma tarefa recém-inserida no banco (sem nova escrita)."""
+        task = {column: record.get(column) for column in _ROW_COLUMNS}
+        task["updated_at"] = task["updated_at"] or _now_iso()
+        with self._lock:
+            self._tasks[task["id"]] = task
+            self._tasks.move_to_end(task["id"])
+            self._evict()
+
+    def update(self, task_id: str, status: Optional[str] = None, **fields) -> bool:
+        """
+        Atualiza o estado em memória e agenda a gravação. Estados finais não
+        regridem; `status=None` altera só os campos informados.
+        """
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                logger.warning(f"Status update for unknown task {task_id} ({status}) ignored.")
+                return False
+            status = status or task["status"]
+            if task["status"] in TERMINAL_STATUSES and status not in TERMINAL_STATUSES:
+                return False
+            task.update(fields)
+            task["status"] = status
+            task["updated_at"] = _now_iso()
+            self._tasks.move_to_end(task_id)
+            self._dirty[task_id] = dict(task)
+            pending = len(self._dirty)
+        if pending >= self.batch_size or status in TERMINAL_STATUSES:
+            self._wakeup.set()
+        return True
+
+    def on_executor_event(self, task_id: str, event: Dict[str, Any]):
+        # Listener dos eventos do task_executor
+        if event.get("remote"):
+            return # Tarefa de um worker (modo fila): o estado já veio do banco via `sync`
+        if event["type"] == "started":
+            self.update(task_id, PROCESSING)
+        elif event["type"] == "completed":
+            # O checkpoint só serve para retomar a execução: descartado ao concluir
+            self.update(task_id, COMPLETED, result=event.get("result"), error_message=None, checkpoint=None)
+        elif event["type"] == "failed":
+            self.update(task_id, FAILED, error_message=event.get("error"))
+        elif event["type"] == "cancelled":
+            self.update(task_id, CANCELLED, error_message=event.get("error"))
+        elif event["type"] == "usage":
+            self.update(task_id, token_usage=event.get("usage"))
+        elif event["type"] == "checkpoint":
+            self.save_checkpoint(task_id, event.get("checkpoint") or {})
+
+    def save_checkpoint(self, task_id: str, checkpoint: Dict[str, Any]):
+        """Mescla `checkpoint` ao da tarefa e grava já (não espera o próximo ciclo do write-behind)."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            merged = {**(task.get("checkpoint") or {}), **checkpoint} if task is not None else None
+        if merged is not None and self.update(task_id, checkpoint=merged):
+            self._wakeup.set()
+
+    def sync(self, record: Dict[str, Any]):
+        """Atualiza a memória com o estado gravado por outro processo (ex.: um worker), sem nova escrita."""
+        with self._lock:
+            task = self._tasks.get(record["id"])
+            if task is None:
+                return
+            task.update({column: record[column] for column in _ROW_COLUMNS if column in record})
+            self._dirty.pop(record["id"], None) # O banco é a versão mais nova
+            self._tasks.move_to_end(record["id"])
+
+    # --- Leitura ---
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    async def load(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Fallback para tarefas fora da memória (ex.: criadas antes de um restart)."""
+        if self._repository is None:
+            return None
+        record = await self._repository.get_task(task_id, columns=_ROW_COLUMNS)
+        if record is None:
+            return None
+        if record.get("status") in TERMINAL_STATUSES:
+            # Só estados finais podem ser cacheados: os demais podem mudar em outro processo
+            self.register(record)
+        return record
+
+    async def load_many(self, task_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Como `get` + `load` para várias tarefas, com uma única consulta para as que não estão em memória."""
+        found = {task_id: record for task_id in task_ids if (record := self.get(task_id)) is not None}
+        missing = [task_id for task_id in dict.fromkeys(task_ids) if task_id not in found]
+        if missing and self._repository is not None:
+            for record in await self._repository.get_tasks(missing, columns=_ROW_COLUMNS):
+                found[record["id"]] = record
+                if record.get("status") in TERMINAL_STATUSES:
+                    self.register(record)
+        return found
+
+    # --- Write-behind ---
+    def _flush_loop(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _take_batch(self):
+        with self._lock:
+            batch = list(self._dirty.values())[:self.batch_size]
+            for row in batch:
+                del self._dirty[row["id"]]
+        return batch
+
+    async def _write(self, batch):
+        if self._repository is not None:
+            await self._repository.upsert_tasks(batch)
+            self.flushes += 1
+            self.rows_written += len(batch)
+
+    def flush(self):
+        # Roda na thread do flusher; o upsert em si usa o cliente HTTP assíncrono no loop da API
+        batch = self._take_batch()
+        if not batch or self._repository is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._write(batch), self._loop).result(timeout=60)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(batch)} task update(s) to Supabase: {e}", exc_info=True)
+            with self._lock:
+                for row in batch:
+                    # Não sobrescreve uma atualização mais nova que chegou durante o flush
+                    self._dirty.setdefault(row["id"], row)
+            time.sleep(self.flush_interval) # Evita martelar o banco em caso de falha
+            return
+        if len(self._dirty) >= self.batch_size:
+            self._wakeup.set()
+
+    def _evict(self):
+        # Descarta as tarefas finalizadas mais antigas (já persistidas) acima do limite
+        excess = len(self._tasks) - self.max_entries
+        if excess <= 0:
+            return
+        for task_id in list(self._tasks):
+            if excess <= 0:
+                break
+            task = self._tasks[task_id]
+            if task["status"] in TERMINAL_STATUSES and task_id not in self._dirty:
+                del self._tasks[task_id]
+                excess -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tracked": len(self._tasks),
+                "pending_writes": len(self._dirty),
+                "flushes": self.flushes,
+                "rows_written": self.rows_written,
+            }
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+task_registry = TaskRegistry(
+    flush_interval=settings.task_flush_interval,
+    batch_size=settings.task_flush_batch,
+)
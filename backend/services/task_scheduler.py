@@ -0,0 +1,169 @@
+# backend/services/task_scheduler.py
+# Fila justa do task_executor: decide qual tarefa ganha o próximo worker livre.
+#
+# - Cada par (classe de prioridade, usuário) é um fluxo. Entre fluxos vale o
+#   weighted fair queuing (start-time fair queuing): cada tarefa recebe uma
+#   marca de término virtual `início + 1/peso` e a menor marca sai primeiro.
+#   Um usuário com 50 tarefas na fila só passa na frente de um usuário com 1
+#   depois que este for atendido; pedidos "interactive" têm peso maior que
+#   "batch", sem deixar os lotes famintos.
+# - Cota por usuário: no máximo `user_max_running` execuções simultâneas e
+#   `user_max_queued` tarefas esperando vaga (0 = sem limite).
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# Classes de prioridade
+INTERACTIVE = "interactive" # Pedido avulso de um usuário (alguém esperando a resposta)
+BATCH = "batch" # Execuções de POST /analyze-niche/batch
+PRIORITIES = (INTERACTIVE, BATCH)
+
+_ANONYMOUS = "" # Tarefas sem usuário formam um único fluxo
+
+Flow = Tuple[str, str]
+
+
+class QueuedTask:
+    """Tarefa aceita pelo executor, esperando um worker."""
+    __slots__ = ("task_id", "fn", "kwargs", "on_done", "user", "priority", "submitted_at", "trace_carrier",
+                 "start_tag", "finish_tag")
+
+    def __init__(self, task_id: str, fn: Callable[..., Any], kwargs: Dict[str, Any],
+                 on_done: Optional[Callable[[Any, Optional[BaseException]], None]], user: Optional[str],
+                 priority: str, trace_carrier: Dict[str, str]):
+        self.task_id = task_id
+        self.fn = fn
+        self.kwargs = kwargs
+        self.on_done = on_done
+        self.user = user or _ANONYMOUS
+        self.priority = priority
+        self.submitted_at = time.time()
+        self.trace_carrier = trace_carrier
+        self.start_tag = 0.0
+        self.finish_tag = 0.0
+
+
+class FairTaskQueue:
+    """
+    Fila de espera com WFQ entre fluxos e cota por usuário. Não é thread-safe:
+    o TaskExecutor chama tudo com o próprio lock.
+    """
+
+    def __init__(self, weights: Dict[str, float], user_max_running: int = 0, user_max_queued: int = 0):
+        unknown = set(weights) - set(PRIORITIES)
+        if unknown:
+            raise ValueError(f"Unknown task priorities: {sorted(unknown)}")
+        self.weights = weights
+        self.user_max_running = user_max_running
+        self.user_max_queued = user_max_queued
+        self._flows: Dict[Flow, Deque[QueuedTask]] = {}
+        self._last_finish: Dict[Flow, float] = {}
+        self._virtual_time = 0.0
+        self._queued_by_user: Dict[str, int] = {}
+        self._running_by_user: Dict[str, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    # --- Cotas ---
+    def queued_for(self, user: Optional[str]) -> int:
+        return self._queued_by_user.get(user or _ANONYMOUS, 0)
+
+    def running_for(self, user: Optional[str]) -> int:
+        return self._running_by_user.get(user or _ANONYMOUS, 0)
+
+    def user_queue_full(self, user: Optional[str]) -> bool:
+        return bool(user) and self.user_max_queued > 0 and self.queued_for(user) >= self.user_max_queued
+
+    def _can_run(self, user: str) -> bool:
+        return user == _ANONYMOUS or self.user_max_running <= 0 or self.running_for(user) < self.user_max_running
+
+    # --- Fila ---
+    def push(self, task: QueuedTask) -> int:
+        """Enfileira `task` e retorna quantas tarefas da fila saem antes dela."""
+        if task.priority not in self.weights:
+            raise ValueError(f"Unknown task priority: {task.priority!r}")
+        flow = (task.priority, task.user)
+        task.start_tag = max(self._virtual_time, self._last_finish.get(flow, 0.0))
+        task.finish_tag = task.start_tag + 1.0 / self.weights[task.priority]
+        self._last_finish[flow] = task.finish_tag
+        self._flows.setdefault(flow, deque()).append(task)
+        self._queued_by_user[task.user] = self._queued_by_user.get(task.user, 0) + 1
+        self._size += 1
+        return sum(1 for queue in self._flows.values() for queued in queue if queued.finish_tag < task.finish_tag)
+
+    def pop(self) -> Optional[QueuedTask]:
+        """Próxima tarefa a rodar: menor marca de término entre os usuários abaixo da cota."""
+        best: Optional[Tuple[float, float, Flow]] = None
+        for flow, queue in self._flows.items():
+            head = queue[0]
+            if not self._can_run(head.user):
+                continue
+            key = (head.finish_tag, head.submitted_at, flow)
+            if best is None or key[:2] < best[:2]:
+                best = key
+        if best is None:
+            return None
+        task = self._flows[best[2]].popleft()
+        self._virtual_time = max(self._virtual_time, task.start_tag)
+        self._forget(task)
+        if len(self._last_finish) > 2 * len(self._flows) + 100:
+            # Marcas de fluxos ociosos que o tempo virtual já alcançou não mudam mais nada
+            self._last_finish = {flow: finish for flow, finish in self._last_finish.items()
+                                 if flow in self._flows or finish > self._virtual_time}
+        self._running_by_user[task.user] = self._running_by_user.get(task.user, 0) + 1
+        return task
+
+    def remove(self, task_id: str) -> Optional[QueuedTask]:
+        """Tira uma tarefa da fila (cancelamento). None se ela não está esperando."""
+        for queue in self._flows.values():
+            for task in queue:
+                if task.task_id == task_id:
+                    queue.remove(task)
+                    self._forget(task)
+                    return task
+        return None
+
+    def drain(self) -> List[QueuedTask]:
+        """Esvazia a fila (ex.: no shutdown) e retorna as tarefas que estavam esperando."""
+        tasks = [task for queue in self._flows.values() for task in queue]
+        for task in tasks:
+            self._flows[(task.priority, task.user)].remove(task)
+            self._forget(task)
+        return tasks
+
+    def release(self, user: Optional[str]):
+        """Uma execução do usuário terminou: libera a cota."""
+        user = user or _ANONYMOUS
+        running = self._running_by_user.get(user, 0) - 1
+        if running > 0:
+            self._running_by_user[user] = running
+        else:
+            self._running_by_user.pop(user, None)
+
+    def _forget(self, task: QueuedTask):
+        flow = (task.priority, task.user)
+        if not self._flows[flow]:
+            del self._flows[flow]
+            # Fluxo ocioso: a marca antiga não vale mais que o tempo virtual atual
+            if self._last_finish.get(flow, 0.0) <= self._virtual_time:
+                self._last_finish.pop(flow, None)
+        queued = self._queued_by_user[task.user] - 1
+        if queued > 0:
+            self._queued_by_user[task.user] = queued
+        else:
+            del self._queued_by_user[task.user]
+        self._size -= 1
+
+    # --- Métricas ---
+    def stats(self) -> Dict[str, Any]:
+        by_priority: Dict[str, int] = {}
+        for (priority, _), queue in self._flows.items():
+            by_priority[priority] = by_priority.get(priority, 0) + len(queue)
+        return {
+            "queued_by_priority": by_priority,
+            "queued_users": len(self._queued_by_user),
+            "running_users": len(self._running_by_user),
+            "virtual_time": round(self._virtual_time, 3),
+        }
@@ -0,0 +1,141 @@
+# backend/specs/niche.py
+# Formato estruturado da análise de nicho: o que a Crew e o modo fanout devem
+# produzir, validado com Pydantic, e o que fica gravado em async_tasks.result.
+# O resultado guarda só os campos (consultáveis via jsonb, ex.:
+# result->'niches'->0->>'score'); o texto do ranking é montado na leitura.
+from typing import Any, Dict, List, Optional, Type, TypeVar
+
+import json_repair
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+# Versão do formato de async_tasks.result (resultados antigos: só {"analysis": texto})
+RESULT_VERSION = 2
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def _as_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "; ".join(str(v) for v in value if v)
+    return str(value).strip()
+
+def _as_text_list(value: Any) -> List[str]:
+    # O LLM às vezes devolve uma frase onde era esperada uma lista (e vice-versa)
+    if value is None or value == "":
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    return [str(v).strip() for v in value if v is not None and str(v).strip()]
+
+
+class NicheOrigin(BaseModel):
+    """Paixões e habilidades (normalizadas) do usuário de onde o nicho veio."""
+    paixoes: List[str] = []
+    habilidades: List[str] = []
+
+
+class Niche(BaseModel):
+    """Um nicho pesquisado e pontuado."""
+    model_config = ConfigDict(extra="ignore")
+
+    nicho: str = Field(min_length=1)
+    tendencia: str = ""
+    publico: str = ""
+    problemas: List[str] = []
+    concorrentes: List[str] = []
+    score: int # Viabilidade de 0 a 100; sem score o nicho não foi validado
+    justificativa: str = ""
+    origem: Optional[NicheOrigin] = None
+    ideia_inicial: Optional[bool] = None # Só presente (True) no nicho da ideia inicial do usuário
+
+    @field_validator("nicho", "tendencia", "publico", "justificativa", mode="before")
+    @classmethod
+    def _text(cls, value: Any) -> str:
+        return _as_text(value)
+
+    @field_validator("problemas", "concorrentes", mode="before")
+    @classmethod
+    def _text_list(cls, value: Any) -> List[str]:
+        return _as_text_list(value)
+
+    @field_validator("score", mode="before")
+    @classmethod
+    def _score(cls, value: Any) -> int:
+        # "85", 85.5 ou "85/100" -> 85, sempre dentro de 0-100
+        if value is None:
+            return value # Só o rascunho da pesquisa aceita (ver NicheCandidate)
+        if isinstance(value, str):
+            value = value.split("/")[0].strip().rstrip("%")
+        try:
+            return max(0, min(100, int(float(value))))
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid viability score: {value!r}")
+
+    @field_validator("ideia_inicial", mode="before")
+    @classmethod
+    def _initial_idea(cls, value: Any) -> Optional[bool]:
+        return True if value is True else None
+
+
+class NicheList(BaseModel):
+    """Saída final da Crew (validação): a lista de nichos pontuados."""
+    nichos: List[Niche] = Field(min_length=1)
+
+
+class NicheCandidate(Niche):
+    """Nicho da etapa de pesquisa da Crew, ainda sem score (quem pontua é a validação)."""
+    score: Optional[int] = None
+
+
+class CandidateList(BaseModel):
+    """Saída intermediária da Crew (pesquisa), exibida antes da validação."""
+    nichos: List[NicheCandidate] = Field(min_length=1)
+
+
+class NicheAnalysisResult(BaseModel):
+    """Conteúdo de async_tasks.result de uma análise de nicho."""
+    v: int
+    niches: List[Niche]
+    inputs: Optional[Dict[str, Any]] = None # Entradas normalizadas (base da reanálise incremental)
+    model: Optional[str] = None
+    incremental: Optional[Dict[str, int]] = None
+
+
+def parse_llm_json(text: str, model: Type[ModelT]) -> ModelT:
+    """
+    Interpreta a resposta do LLM como `model`, reparando JSON malformado
+    (cercas ```json, vírgulas sobrando, aspas faltando). Uma lista solta é
+    aceita para modelos com um único campo de lista (ex.: NicheList).
+    Levanta ValueError (inclusive pydantic.ValidationError) se não servir.
+    """
+    data = json_repair.loads(text or "")
+    if isinstance(data, list) and len(model.model_fields) == 1:
+        data = {next(iter(model.model_fields)): data}
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object for {model.__name__}, got {type(data).__name__}.")
+    return model.model_validate(data)
+
+
+def compact_result(niches: List[Dict[str, Any]], **extra: Any) -> Dict[str, Any]:
+    """Valida e serializa o resultado no formato gravado (sem campos vazios/nulos)."""
+    result = NicheAnalysisResult(v=RESULT_VERSION, niches=niches, **extra)
+    return result.model_dump(exclude_none=True)
+
+
+def format_ranking(niches: List[Dict[str, Any]]) -> str:
+    """Texto final no mesmo formato da saída do validador da Crew."""
+    lines = []
+    for position, niche in enumerate(niches, start=1):
+        lines.append(f"{position}. {niche['nicho']} - Score de Viabilidade: {niche.get('score', 0)}")
+        if niche.get("justificativa"):
+            lines.append(f"   Justificativa: {niche['justificativa']}")
+    return "\n".join(lines)
+
+
+def present_result(result: Any) -> Any:
+    """Resultado como a API devolve: o gravado + o texto do ranking em `analysis`."""
+    if isinstance(result, dict) and "analysis" not in result and isinstance(result.get("niches"), list):
+        return {**result, "analysis": format_ranking(result["niches"])}
+    return result
@@ -0,0 +1,119 @@
+# backend/tests/test_crew_gateway.py
+# Crew de verdade (modo "crew") contra o LLM falso do benchmark: as chamadas
+# dos Agents precisam passar pelo llm_gateway.
+import os
+import uuid
+
+import pytest
+
+os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+
+crew_service = pytest.importorskip("backend.services.crew_service")
+
+from backend.bench.fake_llm import FakeLLM
+from backend.lib.settings import settings
+from backend.services import llm_gateway
+from backend.services import task_executor as task_executor_module
+
+INPUTS = {"passions": ["yoga", "culinária"], "skills": ["ensinar", "escrever"], "initial_idea": None}
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    monkeypatch.setattr(settings, "openai_api_key", "test-fake-key")
+    monkeypatch.setattr(settings, "niche_analysis_mode", "crew")
+    monkeypatch.setattr(settings, "niche_incremental", False)
+    llm = FakeLLM(first_token_latency=0.0, tokens_per_second=0.0, response_tokens=20)
+    llm_gateway.set_http_transports(*llm.transports())
+    yield llm
+    llm_gateway.set_http_transports()
+
+
+@pytest.fixture
+def events(monkeypatch):
+    received = []
+    monkeypatch.setattr(task_executor_module, "_event_listeners", [])
+    task_executor_module.add_event_listener(lambda task_id, event: received.append((task_id, event)))
+    return received
+
+
+def test_crew_run_goes_through_gateway(fake_llm, events):
+    task_id = str(uuid.uuid4())
+    result = crew_service.run_niche_analysis_task(task_id, INPUTS)
+
+    assert result["niches"]
+    usage = [event["usage"] for tid, event in events if tid == task_id and event["type"] == "usage"]
+    assert len(usage) == 1
+    assert usage[0]["calls"] == fake_llm.calls >= 2 # Pesquisa + validação, todas contabilizadas
+    assert usage[0]["prompt_tokens"] == fake_llm.prompt_tokens
+    assert usage[0]["completion_tokens"] == fake_llm.completion_tokens
+    llm_calls = [event for tid, event in events if tid == task_id and event["type"] == "llm_call"]
+    assert len(llm_calls) == fake_llm.calls
+
+
+def test_crew_run_streams_tokens(fake_llm, events, monkeypatch):
+    monkeypatch.setattr(settings, "crewai_llm_streaming", True)
+    llm_gateway.set_http_transports(*fake_llm.transports()) # Recria o LLM compartilhado com streaming
+    task_id = str(uuid.uuid4())
+    crew_service.run_niche_analysis_task(task_id, INPUTS)
+
+    tokens = [event for tid, event in events if tid == task_id and event["type"] == "token"]
+    assert {event["step"] for event in tokens} == {"research", "validation"}
+    assert all(event["text"] for event in tokens)
+
+
+def test_crew_run_records_llm_metrics_and_spans(fake_llm, events, monkeypatch):
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    from backend.lib import telemetry
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(telemetry, "tracer", provider.get_tracer("test"))
+    task_executor_module.add_event_listener(telemetry.task_event_metrics)
+
+    def observed_calls():
+        return sum(series[-1] for series in telemetry.LLM_CALL_SECONDS._series.values())
+
+    before = observed_calls()
+    crew_service.run_niche_analysis_task(str(uuid.uuid4()), INPUTS)
+
+    assert observed_calls() - before == fake_llm.calls
+    spans = exporter.get_finished_spans()
+    steps = {span.context.span_id: span.name for span in spans if span.name.startswith("crew.")}
+    llm_spans = [span for span in spans if span.name == "llm.call"]
+    assert len(llm_spans) == fake_llm.calls
+    assert {steps.get(span.parent.span_id) for span in llm_spans} == {"crew.research", "crew.validation"}
+
+
+def test_cancelled_crew_run_stops_before_calling_the_llm(fake_llm, events):
+    from backend.services.task_executor import TaskCancelledError
+
+    task_id = str(uuid.uuid4())
+    task_executor_module._cancelled_tasks.add(task_id) # Como task_executor.cancel com a tarefa rodando
+    try:
+        with pytest.raises(TaskCancelledError):
+            crew_service.run_niche_analysis_task(task_id, INPUTS)
+    finally:
+        task_executor_module._cancelled_tasks.discard(task_id)
+    assert fake_llm.calls == 0
+
+
+def test_unparseable_crew_output_fails_the_task(fake_llm, events, monkeypatch):
+    monkeypatch.setattr(fake_llm, "respond", lambda prompt: "Não consegui montar a lista desta vez.")
+
+    with pytest.raises(ValueError, match="formato esperado"):
+        crew_service.run_niche_analysis_task(str(uuid.uuid4()), INPUTS)
+
+
+@pytest.mark.parametrize("output", [
+    '{"nichos": []}',
+    '[{"nicho": "Yoga para iniciantes", "publico": "iniciantes"}]', # Sem score
+])
+def test_invalid_niche_list_fails_the_task(fake_llm, events, monkeypatch, output):
+    monkeypatch.setattr(fake_llm, "respond", lambda prompt: output)
+
+    with pytest.raises(ValueError, match="formato esperado"):
+        crew_service.run_niche_analysis_task(str(uuid.uuid4()), INPUTS)
@@ -0,0 +1,33 @@
+# backend/tests/test_project_service.py
+# Cache da lista de projetos contra o PostgREST em memória do benchmark.
+import asyncio
+
+from backend.bench.fake_supabase import InMemoryPostgrest, make_user_id
+from backend.lib.repository import ProjectRepository, SupabaseRepository
+from backend.services import project_service
+from backend.services.project_service import NicheAnalysisStore, project_list_cache
+
+
+def test_saved_niche_analysis_invalidates_the_project_list(monkeypatch):
+    db = InMemoryPostgrest()
+    user_id = make_user_id(0)
+    (project,) = db.seed_projects(user_id, 1)
+    result = {"inputs": {"passions": ["yoga"]}, "model": "fake", "niches": [{"nicho": "Yoga online"}]}
+
+    async def scenario():
+        db_client = SupabaseRepository(url="http://fake-supabase", service_key="test", transport=db.transport())
+        await db_client.start()
+        monkeypatch.setattr(project_service, "project_repository", ProjectRepository(db_client))
+        store = NicheAnalysisStore()
+        store.bind_loop(asyncio.get_running_loop())
+        try:
+            await project_service.list_projects(user_id, limit=10) # Lida antes da gravação: fica no cache
+            assert project_list_cache.get(user_id, (None, 10)) is not None
+            await store.save(project["id"], result)
+        finally:
+            await db_client.close()
+
+    asyncio.run(scenario())
+
+    assert project_list_cache.get(user_id, (None, 10)) is None
+    assert db.tables["projects"][project["id"]]["estado_progresso"]["analise_nicho"]["niches"] == result["niches"]
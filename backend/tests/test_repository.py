@@ -0,0 +1,60 @@
+# backend/tests/test_repository.py
+import asyncio
+
+import httpx
+import pytest
+
+from backend.bench.fake_supabase import InMemoryPostgrest
+from backend.lib.repository import ProjectRepository, RepositoryError, SupabaseRepository, TaskRepository
+
+
+class LostResponses:
+    """PostgREST em memória que aplica a escrita e perde as `count` primeiras respostas (502)."""
+
+    def __init__(self, count: int):
+        self.db = InMemoryPostgrest()
+        self.count = count
+        self.requests = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        response = await self.db.handle(request)
+        if self.count:
+            self.count -= 1
+            return httpx.Response(502, text="upstream connection reset")
+        return response
+
+
+def _call(server: LostResponses, operation):
+    async def run():
+        db = SupabaseRepository(url="http://fake-supabase", service_key="test", backoff_base=0.0,
+                                transport=httpx.MockTransport(server.handle))
+        await db.start()
+        try:
+            return await operation(db)
+        finally:
+            await db.close()
+    return asyncio.run(run())
+
+
+def test_reads_are_retried():
+    server = LostResponses(count=2)
+    rows = _call(server, lambda db: TaskRepository(db).get_tasks(["a"]))
+    assert rows == [] and server.requests == 3
+
+
+def test_non_idempotent_writes_are_not_retried():
+    server = LostResponses(count=1)
+    server.db.seed_tasks([{"id": "t1", "status": "PENDING", "lease_owner": None}])
+    with pytest.raises(RepositoryError):
+        _call(server, lambda db: TaskRepository(db).lease_tasks(["t1"], lease_owner="worker-a"))
+    assert server.requests == 1
+    assert server.db.tables["async_tasks"]["t1"]["lease_owner"] == "worker-a" # Aplicada; a resposta se perdeu
+
+
+def test_create_project_retry_does_not_duplicate():
+    server = LostResponses(count=1)
+    row = _call(server, lambda db: ProjectRepository(db).create_project("user-1", "Meu projeto"))
+    assert server.requests == 2
+    assert list(server.db.tables["projects"]) == [row["id"]]
+    assert row["nome_projeto"] == "Meu projeto"
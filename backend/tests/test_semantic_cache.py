@@ -0,0 +1,150 @@
+# backend/tests/test_semantic_cache.py
+# Índice do cache semântico sem o modelo de embeddings: os vetores entram direto em _on_encoded.
+import asyncio
+import glob
+import os
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from backend.services.semantic_cache import SemanticCache
+
+DIMENSION = 16
+
+
+def _vector(index: int) -> np.ndarray:
+    vector = np.zeros(DIMENSION, dtype=np.float32)
+    vector[index] = 1.0
+    return vector
+
+
+def _open(directory=None, **kwargs) -> SemanticCache:
+    cache = SemanticCache(directory=str(directory) if directory else None, model_name="test-model", **kwargs)
+    cache._started = True # Sem start(): nada de thread de encoder
+    if directory:
+        cache._load()
+    return cache
+
+
+def _add(cache: SemanticCache, index: int, result=None):
+    future = Future()
+    future.set_result(_vector(index))
+    cache._on_encoded(future, f"k{index}", f"text {index}", "scope", result or {"niches": [f"n{index}"]})
+
+
+def _nearest_key(cache: SemanticCache, index: int):
+    match = cache._nearest(_vector(index), "scope")
+    return match.key if match is not None and match.similarity > 0.99 else None
+
+
+def test_full_index_replaces_the_oldest_entry():
+    cache = _open(max_entries=3)
+    for index in range(4):
+        _add(cache, index)
+
+    assert _nearest_key(cache, 0) is None
+    assert [_nearest_key(cache, index) for index in (1, 2, 3)] == ["k1", "k2", "k3"]
+    assert cache._nearest(_vector(3), "scope").result() == {"niches": ["n3"]}
+    assert cache.stats()["entries"] == 3 and cache.stats()["evictions"] == 1
+
+
+def test_neighbour_below_the_threshold_counts_as_a_miss():
+    cache = _open()
+    _add(cache, 0)
+    near = _vector(0) + _vector(1) # Similaridade ~0.71 com a entrada
+    near /= np.linalg.norm(near)
+
+    assert cache._nearest(near, "scope", min_similarity=0.9) is None
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cache._nearest(near, "scope", min_similarity=0.5).key == "k0"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_match_of_a_reused_slot_reads_nothing():
+    cache = _open(max_entries=1)
+    _add(cache, 0)
+    match = cache._nearest(_vector(0), "scope")
+    _add(cache, 1) # Ocupa a mesma posição entre a busca e a leitura do resultado
+    assert match.result() is None
+
+
+def test_index_is_written_in_place_and_reloaded(tmp_path):
+    cache = _open(tmp_path, max_entries=3, growth_rows=2)
+    for index in range(5):
+        _add(cache, index)
+    cache.flush()
+
+    # Capacidade limitada a max_entries: as posições são reaproveitadas, o arquivo não cresce
+    assert os.path.getsize(tmp_path / "vectors.f32") == 3 * DIMENSION * 4
+    reloaded = _open(tmp_path, max_entries=3)
+    assert [_nearest_key(reloaded, index) for index in range(5)] == [None, None, "k2", "k3", "k4"]
+    assert reloaded._nearest(_vector(4), "scope").result() == {"niches": ["n4"]}
+    _add(reloaded, 5)
+    assert _nearest_key(reloaded, 2) is None and _nearest_key(reloaded, 5) == "k5"
+
+
+def test_results_are_compacted(tmp_path):
+    cache = _open(tmp_path, max_entries=2)
+    for index in range(12):
+        _add(cache, index, {"niches": [str(index) * 200_000]})
+
+    assert cache.compactions >= 1
+    assert [os.path.basename(path) for path in glob.glob(str(tmp_path / "results.*.jsonl"))] == \
+        [f"results.{cache._generation}.jsonl"]
+    written = sum(len(str(index)) * 200_000 for index in range(12))
+    assert os.path.getsize(cache._results_path()) <= 2 * cache._live_bytes + (1 << 20) < written
+    reloaded = _open(tmp_path, max_entries=2)
+    assert reloaded._nearest(_vector(11), "scope").result() == {"niches": ["11" * 200_000]}
+    assert reloaded._nearest(_vector(10), "scope").result() == {"niches": ["10" * 200_000]}
+
+
+def test_truncated_log_line_is_ignored(tmp_path):
+    cache = _open(tmp_path)
+    _add(cache, 0)
+    _add(cache, 1)
+    cache.flush()
+    with open(tmp_path / "entries.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"slot": 2, "key": "k2", "sco') # Queda no meio da gravação
+
+    reloaded = _open(tmp_path)
+    assert [_nearest_key(reloaded, index) for index in range(3)] == ["k0", "k1", None]
+    _add(reloaded, 2)
+    assert [_nearest_key(_open(tmp_path), index) for index in range(3)] == ["k0", "k1", "k2"]
+
+
+def test_index_of_another_model_is_discarded(tmp_path):
+    cache = _open(tmp_path)
+    _add(cache, 0)
+    other = SemanticCache(directory=str(tmp_path), model_name="other-model")
+    other._started = True
+    other._load()
+    assert other.stats()["entries"] == 0
+    assert not os.path.exists(tmp_path / "vectors.f32")
+
+
+def test_served_semantic_hit_carries_the_request_inputs(monkeypatch):
+    ai_tasks = pytest.importorskip("backend.routers.ai_tasks")
+    crew_service = pytest.importorskip("backend.services.crew_service")
+    neighbour = {"niches": [{"nicho": "Yoga online"}], "inputs": {"passions": ["yoga"], "skills": [], "initial_idea": None}}
+
+    class Match:
+        similarity, text = 0.99, "paixões: yoga"
+
+        def result(self):
+            return neighbour
+
+    class Index:
+        running = True
+
+        async def lookup_many(self, texts, scope, timeout, min_similarity=0.0):
+            return [Match() for _ in texts]
+
+    monkeypatch.setattr(ai_tasks, "semantic_cache", Index())
+    inputs = {"passions": ["Yoga ", "meditação"], "skills": ["ensinar"], "initial_idea": None}
+    ((served, seed),) = asyncio.run(ai_tasks._semantic_lookup(crew_service, [inputs]))
+
+    assert seed is None
+    assert served["inputs"] == crew_service.niche_result_inputs(inputs)
+    assert served["niches"] == neighbour["niches"]
+    assert neighbour["inputs"] == {"passions": ["yoga"], "skills": [], "initial_idea": None}
@@ -0,0 +1,18 @@
+# backend/tests/test_settings.py
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+
+
+def test_openai_key_from_dotenv_is_exported(tmp_path):
+    # Chave só no .env (nada no ambiente): o crewai/LiteLLM a procuram em os.environ
+    (tmp_path / ".env").write_text("OPENAI_API_KEY=sk-from-dotenv\n")
+    env = {key: value for key, value in os.environ.items() if key != "OPENAI_API_KEY"}
+    env["PYTHONPATH"] = str(ROOT)
+    code = "import os; import backend.lib.settings; print(os.environ.get('OPENAI_API_KEY'))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, capture_output=True, text=True,
+                            check=True).stdout
+    assert output.strip() == "sk-from-dotenv"
@@ -0,0 +1,103 @@
+# backend/tests/test_task_batches.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.services import task_batches as task_batches_module
+from backend.services import task_executor as task_executor_module
+from backend.services.task_batches import BatchRun, TaskBatchScheduler
+from backend.services.task_executor import TaskExecutor
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    # Executor e listeners próprios do teste, no lugar das instâncias compartilhadas
+    executor = TaskExecutor(max_workers=2, max_queue=4)
+    monkeypatch.setattr(task_batches_module, "task_executor", executor)
+    monkeypatch.setattr(task_executor_module, "_event_listeners", [])
+    executor.start()
+    yield executor
+    asyncio.run(executor.shutdown(drain_timeout=5))
+
+
+def _wait_for(condition, timeout: float = 30.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _fail_fast(**kwargs):
+    raise ValueError("boom")
+
+
+def test_fast_failing_runs_do_not_deadlock(executor):
+    # Um future que já terminou chama o listener dentro do submit: o pump não pode segurar o lock
+    scheduler = TaskBatchScheduler(max_inflight=2)
+    task_executor_module.add_event_listener(scheduler.on_executor_event)
+    done = []
+    lock = threading.Lock()
+
+    def on_done(result, error):
+        with lock:
+            done.append(error)
+
+    def create_batches():
+        for batch in range(300):
+            task_ids = [f"b{batch}-t{i}" for i in range(3)]
+            scheduler.create(task_ids, [BatchRun(task_id, _fail_fast, {}, on_done=on_done) for task_id in task_ids])
+
+    creator = threading.Thread(target=create_batches, daemon=True)
+    creator.start()
+    creator.join(timeout=30)
+    assert not creator.is_alive(), "TaskBatchScheduler.create deadlocked"
+    assert _wait_for(lambda: len(done) == 900)
+    assert all(isinstance(error, ValueError) for error in done)
+    assert scheduler.stats()["runs_waiting"] == 0
+    assert scheduler.stats()["runs_submitted"] == 900
+
+
+def test_pump_respects_max_inflight_per_batch(executor):
+    scheduler = TaskBatchScheduler(max_inflight=1)
+    task_executor_module.add_event_listener(scheduler.on_executor_event)
+    release = threading.Event()
+    running = []
+
+    def blocking(task_id):
+        running.append(task_id)
+        release.wait(10)
+        return task_id
+
+    batch_id = scheduler.create(["a", "b", "c"], [BatchRun(task_id, blocking, {"task_id": task_id})
+                                                  for task_id in ("a", "b", "c")])
+    assert scheduler.get(batch_id)["waiting"] == 2
+    release.set()
+    assert _wait_for(lambda: len(running) == 3 and executor._idle.is_set())
+    assert running == ["a", "b", "c"]
+    assert scheduler.get(batch_id)["waiting"] == 0
+
+
+def test_cancel_waiting_run(executor):
+    scheduler = TaskBatchScheduler(max_inflight=1)
+    task_executor_module.add_event_listener(scheduler.on_executor_event)
+    release = threading.Event()
+    events = []
+    task_executor_module.add_event_listener(lambda task_id, event: events.append((task_id, event["type"])))
+    errors = {}
+
+    def on_done(task_id):
+        return lambda result, error: errors.setdefault(task_id, error)
+
+    scheduler.create(["a", "b"], [BatchRun(task_id, lambda: release.wait(10), {}, on_done=on_done(task_id))
+                                  for task_id in ("a", "b")])
+    assert scheduler.cancel("b") is True
+    assert scheduler.cancel("b") is False
+    assert ("b", "cancelled") in events
+    assert isinstance(errors["b"], task_executor_module.TaskCancelledError)
+    release.set()
+    assert _wait_for(lambda: "a" in errors)
+    assert errors["a"] is None
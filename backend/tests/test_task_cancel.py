@@ -0,0 +1,103 @@
+# backend/tests/test_task_cancel.py
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+
+from backend.services import task_executor as task_executor_module
+from backend.services.task_executor import TaskCancelledError, TaskExecutor, raise_if_cancelled
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = TaskExecutor(max_workers=1, max_queue=4)
+    monkeypatch.setattr(task_executor_module, "_event_listeners", [])
+    executor.start()
+    yield executor
+    asyncio.run(executor.shutdown(drain_timeout=5))
+
+
+@pytest.fixture
+def events():
+    received = []
+    task_executor_module.add_event_listener(lambda task_id, event: received.append((task_id, event["type"])))
+    return received
+
+
+def _wait_for(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _recorder(errors, task_id):
+    return lambda result, error: errors.setdefault(task_id, error)
+
+
+def test_cancel_queued_task(executor, events):
+    release = threading.Event()
+    ran = []
+    errors = {}
+    executor.submit("running", lambda: release.wait(10), on_done=_recorder(errors, "running"))
+    executor.submit("queued", lambda: ran.append("queued"), on_done=_recorder(errors, "queued"))
+
+    assert executor.cancel("queued") == "queued"
+    assert isinstance(errors["queued"], TaskCancelledError)
+    assert ("queued", "cancelled") in events
+    release.set()
+    assert _wait_for(lambda: "running" in errors)
+    assert ran == [] # Saiu da fila sem rodar
+    assert executor.cancel("queued") is None
+
+
+def test_cancel_running_task_at_next_checkpoint(executor, events):
+    started = threading.Event()
+    errors = {}
+
+    def cooperative(task_id):
+        started.set()
+        while True:
+            raise_if_cancelled(task_id) # O llm_gateway faz o mesmo antes de cada chamada
+            time.sleep(0.01)
+
+    executor.submit("running", cooperative, task_id="running", on_done=_recorder(errors, "running"))
+    assert started.wait(5)
+    assert executor.cancel("running") == "running"
+    assert _wait_for(lambda: "running" in errors)
+    assert isinstance(errors["running"], TaskCancelledError)
+    assert [kind for task_id, kind in events if task_id == "running"].count("cancelled") == 1
+    assert "running" not in task_executor_module._cancelled_tasks
+
+
+def test_cancel_endpoint_checks_task_owner(monkeypatch):
+    ai_tasks = pytest.importorskip("backend.routers.ai_tasks")
+    from fastapi import HTTPException
+
+    cancelled = []
+    monkeypatch.setattr(ai_tasks.task_executor, "cancel", lambda task_id: cancelled.append(task_id) or "queued")
+    owner, task_id = str(uuid.uuid4()), str(uuid.uuid4())
+    ai_tasks.task_registry.register({"id": task_id, "user_id": owner, "status": "PENDING"})
+
+    with pytest.raises(HTTPException) as refused:
+        asyncio.run(ai_tasks.cancel_task_endpoint(task_id, user_id=str(uuid.uuid4())))
+    assert refused.value.status_code == 404
+    assert cancelled == []
+
+    asyncio.run(ai_tasks.cancel_task_endpoint(task_id, user_id=owner))
+    assert cancelled == [task_id]
+
+
+def test_batch_status_counts_cancelled_tasks_as_finished():
+    ai_tasks = pytest.importorskip("backend.routers.ai_tasks")
+    batch = {"id": "batch-1", "task_ids": ["a", "b", "c"]}
+    records = {"a": {"status": "COMPLETED"}, "b": {"status": "CANCELLED"}, "c": {"status": "FAILED"}}
+
+    status = ai_tasks._batch_status(batch, records)
+
+    assert status.message == "3 de 3 tarefas finalizadas."
+    assert status.progress == 1.0
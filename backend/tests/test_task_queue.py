@@ -0,0 +1,105 @@
+# backend/tests/test_task_queue.py
+import asyncio
+import uuid
+
+import pytest
+
+from backend.bench.fake_supabase import InMemoryPostgrest
+from backend.lib.repository import RepositoryError, SupabaseRepository, TaskRepository
+from backend.services.task_queue import SqliteTaskQueue
+
+
+def _pending(count: int):
+    return [{"id": str(uuid.uuid4()), "status": "PENDING", "lease_owner": None, "lease_expires_at": None,
+             "attempts": 0, "checkpoint": {"inputs": {}}} for _ in range(count)]
+
+
+def _with_queue(db: InMemoryPostgrest, scenario):
+    async def run():
+        db_client = SupabaseRepository(url="http://fake-supabase", service_key="test", transport=db.transport())
+        await db_client.start()
+        queue = SqliteTaskQueue(":memory:", TaskRepository(db_client))
+        await queue.start()
+        try:
+            return await scenario(queue)
+        finally:
+            await queue.close()
+            await db_client.close()
+    return asyncio.run(run())
+
+
+def test_sqlite_queue_claims_in_priority_order_with_lease():
+    db = InMemoryPostgrest()
+    batch, interactive = _pending(2), _pending(2)
+    db.seed_tasks(batch + interactive)
+
+    async def scenario(queue):
+        await queue.enqueue([row["id"] for row in batch], "batch")
+        await queue.enqueue([row["id"] for row in interactive], "interactive")
+        first = await queue.claim("worker-a", 3, lease_seconds=60)
+        second = await queue.claim("worker-b", 3, lease_seconds=60)
+        return first, second, await queue.claim("worker-b", 3, lease_seconds=60)
+
+    first, second, empty = _with_queue(db, scenario)
+
+    # Interativas antes das de lote; cada tarefa sai da fila uma única vez
+    assert sorted(row["queue_priority"] for row in first) == ["batch", "interactive", "interactive"]
+    assert {row["id"] for row in interactive} <= {row["id"] for row in first}
+    assert {row["id"] for row in first + second} == {row["id"] for row in batch + interactive}
+    assert len(second) == 1 and empty == []
+    rows = db.tables["async_tasks"]
+    assert all(rows[row["id"]]["lease_owner"] == "worker-a" and rows[row["id"]]["lease_expires_at"] for row in first)
+    assert rows[second[0]["id"]]["lease_owner"] == "worker-b"
+
+
+def test_sqlite_queue_skips_tasks_finished_or_leased_meanwhile():
+    db = InMemoryPostgrest()
+    cancelled, taken, ready = _pending(3)
+    db.seed_tasks([cancelled, taken, ready])
+
+    async def scenario(queue):
+        await queue.enqueue([cancelled["id"], taken["id"], ready["id"]], "interactive")
+        db.tables["async_tasks"][cancelled["id"]]["status"] = "CANCELLED" # DELETE enquanto estava na fila
+        db.tables["async_tasks"][taken["id"]]["lease_owner"] = "worker-b" # Já assumida por outro worker
+        return await queue.claim("worker-a", 10, lease_seconds=60)
+
+    claimed = _with_queue(db, scenario)
+
+    assert [row["id"] for row in claimed] == [ready["id"]]
+    assert db.tables["async_tasks"][taken["id"]]["lease_owner"] == "worker-b"
+
+
+def test_sqlite_queue_keeps_tasks_when_the_lease_fails(monkeypatch):
+    db = InMemoryPostgrest()
+    rows = _pending(2)
+    db.seed_tasks(rows)
+
+    async def scenario(queue):
+        await queue.enqueue([row["id"] for row in rows], "interactive")
+        lease_tasks = queue.repository.lease_tasks
+
+        async def unavailable(*args, **kwargs):
+            raise RepositoryError("PATCH async_tasks failed: HTTP 503")
+
+        monkeypatch.setattr(queue.repository, "lease_tasks", unavailable)
+        with pytest.raises(RepositoryError):
+            await queue.claim("worker-a", 10, lease_seconds=60)
+        monkeypatch.setattr(queue.repository, "lease_tasks", lease_tasks)
+        return await queue.claim("worker-b", 10, lease_seconds=60), await queue.claim("worker-b", 10, lease_seconds=60)
+
+    claimed, empty = _with_queue(db, scenario)
+
+    assert {row["id"] for row in claimed} == {row["id"] for row in rows}
+    assert empty == []
+    assert all(db.tables["async_tasks"][row["id"]]["lease_owner"] == "worker-b" for row in rows)
+
+
+def test_sqlite_enqueue_marks_tasks_as_queued():
+    db = InMemoryPostgrest()
+    rows = _pending(1)
+    db.seed_tasks(rows)
+
+    _with_queue(db, lambda queue: queue.enqueue([rows[0]["id"]], "batch"))
+
+    row = db.tables["async_tasks"][rows[0]["id"]]
+    assert row["queued_at"] and row["queue_priority"] == "batch" # Fora da varredura de órfãs (exclude_queued)
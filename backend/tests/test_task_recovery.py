@@ -0,0 +1,95 @@
+# backend/tests/test_task_recovery.py
+# Varredura de órfãs contra o PostgREST em memória do benchmark.
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from backend.bench.fake_supabase import InMemoryPostgrest
+from backend.lib.repository import SupabaseRepository, TaskRepository
+from backend.services.task_recovery import TaskLeases
+
+
+def _ago(seconds: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(seconds=seconds)).isoformat()
+
+
+def _orphan(**fields):
+    return {"id": str(uuid.uuid4()), "status": "PROCESSING", "lease_owner": "dead-worker",
+            "lease_expires_at": _ago(30), "attempts": 0, "checkpoint": {"inputs": {}}, **fields}
+
+
+def _run_sweeps(db: InMemoryPostgrest, *leases: TaskLeases, limit=None):
+    async def sweep():
+        db_client = SupabaseRepository(url="http://fake-supabase", service_key="test", transport=db.transport())
+        await db_client.start()
+        repository = TaskRepository(db_client)
+        for lease in leases:
+            lease.start(repository)
+        try:
+            return await asyncio.gather(*(lease.claim_orphans(limit) for lease in leases))
+        finally:
+            for lease in leases:
+                await lease.stop(release=False)
+            await db_client.close()
+    return asyncio.run(sweep())
+
+
+def test_concurrent_sweeps_claim_each_orphan_once():
+    db = InMemoryPostgrest(latency=0.001) # Intercala as requisições dos dois processos
+    orphans = [_orphan() for _ in range(20)]
+    db.seed_tasks(orphans)
+    first, second = TaskLeases(owner="worker-a"), TaskLeases(owner="worker-b")
+
+    claimed_a, claimed_b = _run_sweeps(db, first, second)
+
+    ids_a, ids_b = {row["id"] for row in claimed_a}, {row["id"] for row in claimed_b}
+    assert not ids_a & ids_b
+    assert ids_a | ids_b == {row["id"] for row in orphans}
+    rows = db.tables["async_tasks"]
+    assert all(rows[task_id]["lease_owner"] == "worker-a" for task_id in ids_a)
+    assert all(rows[task_id]["lease_owner"] == "worker-b" for task_id in ids_b)
+    assert all(row["attempts"] == 1 for row in rows.values())
+    assert first.recovered + second.recovered == 20
+
+
+def test_sweep_skips_live_leases_and_abandons_exhausted_tasks():
+    db = InMemoryPostgrest()
+    live = _orphan(lease_owner="alive", lease_expires_at=(datetime.now(timezone.utc) + timedelta(seconds=60)).isoformat())
+    exhausted = _orphan(attempts=3)
+    legacy = _orphan(lease_owner=None, lease_expires_at=None, updated_at=_ago(600)) # Anterior aos leases
+    db.seed_tasks([live, exhausted, legacy])
+    leases = TaskLeases(owner="worker-a", max_attempts=3)
+
+    (claimed,) = _run_sweeps(db, leases)
+
+    assert [row["id"] for row in claimed] == [legacy["id"]]
+    rows = db.tables["async_tasks"]
+    assert rows[live["id"]]["lease_owner"] == "alive"
+    assert rows[exhausted["id"]]["status"] == "FAILED"
+    assert leases.abandoned == 1
+
+
+def test_sweep_respects_limit():
+    db = InMemoryPostgrest()
+    db.seed_tasks([_orphan() for _ in range(5)])
+    leases = TaskLeases(owner="worker-a")
+
+    (claimed,) = _run_sweeps(db, leases, limit=2)
+
+    assert len(claimed) == 2
+    assert sum(row["lease_owner"] == "worker-a" for row in db.tables["async_tasks"].values()) == 2
+
+
+def test_sweep_leaves_postgres_queued_tasks_to_the_workers():
+    db = InMemoryPostgrest()
+    queued = _orphan(status="PENDING", lease_owner=None, lease_expires_at=None, queued_at=_ago(600),
+                     updated_at=_ago(600))
+    legacy = _orphan(lease_owner=None, lease_expires_at=None, updated_at=_ago(600))
+    db.seed_tasks([queued, legacy])
+    leases = TaskLeases(owner="worker-a", exclude_queued=True)
+
+    (claimed,) = _run_sweeps(db, leases)
+
+    assert [row["id"] for row in claimed] == [legacy["id"]]
+    assert db.tables["async_tasks"][queued["id"]]["lease_owner"] is None
+    assert db.rpc_claim_async_tasks("worker-b", 10, 60)[0]["id"] == queued["id"]
@@ -0,0 +1,107 @@
+# backend/worker.py
+# Worker das Crews no modo fila (TASK_QUEUE_BACKEND=postgres|sqlite):
+#
+#   python -m backend.worker
+#
+# Tira tarefas da fila compartilhada (ver services/task_queue.py) enquanto houver
+# worker livre no task_executor local, roda as análises e grava o status em
+# async_tasks, como o processo da API faz no modo local. Quantos workers rodar
+# (e TASK_WORKERS de cada um) escala separado do número de nós da API. Também
+# faz a varredura de recuperação periódica: tarefas de um worker que caiu voltam
+# a rodar a partir do checkpoint (ver services/task_recovery.py).
+import signal
+import asyncio
+import logging
+
+from backend.lib.settings import settings
+from backend.lib.repository import supabase_repository, task_repository
+from backend.lib import telemetry
+from backend.routers import ai_tasks
+from backend.services import project_service
+from backend.services.task_executor import task_executor, add_event_listener, ExecutorSaturatedError
+from backend.services.task_queue import create_task_queue
+from backend.services.task_recovery import task_leases
+from backend.services.task_registry import task_registry
+from backend.services.task_scheduler import BATCH
+
+logger = logging.getLogger(__name__)
+
+
+async def _schedule(records):
+    # Execuções das tarefas assumidas (fila ou recuperação) no executor local, na classe de cada uma
+    priorities = {record["id"]: record.get("queue_priority") or BATCH for record in records}
+    refused = []
+    for run in await ai_tasks.prepare_claimed_runs(records):
+        try:
+            task_executor.submit(run.task_id, run.fn, user=run.user, priority=priorities[run.task_id],
+                                 on_done=run.on_done, **run.kwargs)
+        except ExecutorSaturatedError:
+            refused.append(run.task_id) # Cota do usuário cheia neste worker: a recuperação a retoma depois
+    if refused:
+        logger.info(f"Releasing the lease of {len(refused)} task(s) over the user quota.")
+        await task_leases.release(refused)
+
+
+async def run_worker(stop: asyncio.Event):
+    queue_backend = create_task_queue(settings.task_queue_backend, task_repository)
+    if queue_backend is None:
+        raise SystemExit("TASK_QUEUE_BACKEND=local: a API roda as tarefas. Use postgres ou sqlite para rodar workers.")
+    loop = asyncio.get_running_loop()
+    await supabase_repository.start()
+    if not supabase_repository.available:
+        raise SystemExit("Worker needs the database (SUPABASE_URL / SUPABASE_SERVICE_KEY).")
+    task_registry.start(task_repository, loop)
+    add_event_listener(task_registry.on_executor_event) # PROCESSING/COMPLETED/FAILED em async_tasks
+    project_service.niche_analysis_store.bind_loop(loop)
+    add_event_listener(project_service.niche_analysis_store.on_executor_event) # Base da reanálise incremental
+    add_event_listener(task_leases.on_executor_event)
+    add_event_listener(telemetry.task_event_metrics)
+    task_executor.start()
+    task_leases.start(task_repository)
+    await queue_backend.start()
+    await ai_tasks.load_crew_service() # Importa o stack CrewAI antes de pegar a primeira tarefa
+    logger.info(f"Worker {task_leases.owner} polling the {queue_backend.name} task queue "
+                f"({task_executor.max_workers} slot(s)).")
+
+    next_sweep = 0.0
+    while not stop.is_set():
+        try:
+            free = task_executor.idle_workers()
+            if free and settings.task_recovery_enabled and loop.time() >= next_sweep:
+                next_sweep = loop.time() + task_leases.lease_seconds
+                recovered = await task_leases.claim_orphans(limit=free) # Só o que cabe agora
+                await _schedule(recovered)
+                free -= len(recovered)
+            claimed = await queue_backend.claim(task_leases.owner, free, task_leases.lease_seconds) if free else []
+            if claimed:
+                task_leases.adopt(claimed)
+                await _schedule(claimed)
+                continue # Pode haver mais na fila
+        except Exception as e:
+            logger.error(f"Worker poll failed: {e}", exc_info=True)
+        try:
+            await asyncio.wait_for(stop.wait(), settings.task_queue_poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    # Encerramento: para de pegar tarefas, termina as em andamento e devolve as demais à fila
+    logger.info("Worker stopping...")
+    await task_executor.shutdown(drain_timeout=settings.task_drain_timeout, fail_pending=False)
+    await task_leases.stop()
+    await task_registry.stop()
+    await queue_backend.close()
+    await supabase_repository.close()
+    telemetry.shutdown_tracing()
+
+
+async def main():
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+    await run_worker(stop)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=settings.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    telemetry.configure_tracing()
+    asyncio.run(main())
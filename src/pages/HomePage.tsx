@@ -28,6 +28,8 @@ const HomePage: React.FC = () => {
   const [nicheInitialIdea, setNicheInitialIdea] = useState('');
   const [isSubmittingNiche, setIsSubmittingNiche] = useState(false);
   const [runningNicheTaskId, setRunningNicheTaskId] = useState<string | null>(null);
+  const [nicheStep, setNicheStep] = useState<string | null>(null);
+  const [nicheStreamText, setNicheStreamText] = useState('');
 
   const { toast } = useToast();
   const backendUrl = import.meta.env.VITE_PYTHON_API_URL || 'http://localhost:8000';
@@ -56,7 +58,7 @@ const HomePage: React.FC = () => {
        const controller = new AbortController();
        const timeoutId = setTimeout(() => controller.abort(), 15000); // Timeout de 15 segundos
 
-       const response = await fetch(`${backendUrl}/api/v1/projects/`, { signal: controller.signal });
+       const response = await fetch(`${backendUrl}/api/v1/projects/`, { signal: controller.signal, headers: { 'X-User-Id': user.id } });
        clearTimeout(timeoutId); // Limpa o timeout se a resposta chegar
 
        console.log("Fetch response status:", response.status); // Log para debug
@@ -87,6 +89,40 @@ const HomePage: React.FC = () => {
   };
   useEffect(() => { if (user) { fetchProjects(); } }, [user]);
 
+  // Acompanhar Progresso da Análise (SSE)
+  useEffect(() => {
+    if (!runningNicheTaskId) return;
+    setNicheStep(null); setNicheStreamText('');
+    const source = new EventSource(`${backendUrl}/api/v1/tasks/${runningNicheTaskId}/events`);
+    source.addEventListener('step_started', (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      setNicheStep(data.step); setNicheStreamText('');
+    });
+    source.addEventListener('token', (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      setNicheStreamText(prev => (prev + data.text).slice(-600)); // Mostra só o final do texto
+    });
+    source.addEventListener('completed', () => {
+      source.close();
+      toast({ title: "Análise Concluída!", description: "A análise de nicho terminou." });
+      setRunningNicheTaskId(null);
+    });
+    source.addEventListener('failed', (e) => {
+      source.close();
+      const data = JSON.parse((e as MessageEvent).data);
+      toast({ variant: "destructive", title: "Análise falhou", description: data.error || "Erro desconhecido." });
+      setRunningNicheTaskId(null);
+    });
+    source.addEventListener('cancelled', () => {
+      source.close();
+      toast({ title: "Análise cancelada", description: "A análise de nicho foi interrompida." });
+      setNicheStep(null); setNicheStreamText('');
+      setRunningNicheTaskId(null);
+    });
+    source.onerror = () => console.warn("SSE connection error; the browser will retry automatically.");
+    return () => source.close();
+  }, [runningNicheTaskId]);
+
   // Criar Novo Projeto
   const handleCreateProject = async (e: FormEvent) => {
      e.preventDefault();
@@ -95,7 +131,7 @@ const HomePage: React.FC = () => {
      console.log(`Creating project '${newProjectName}' at: ${backendUrl}/api/v1/projects/`); // Log
      try {
        const response = await fetch(`${backendUrl}/api/v1/projects/`, {
-         method: 'POST', headers: {'Content-Type': 'application/json'},
+         method: 'POST', headers: {'Content-Type': 'application/json', 'X-User-Id': user.id},
          body: JSON.stringify({ nome_projeto: newProjectName }),
        });
        console.log("Create project response status:", response.status); // Log
@@ -104,7 +140,7 @@ const HomePage: React.FC = () => {
          try { errorDetail = (await response.json()).detail || errorDetail; } catch (jsonError) {}
          throw new Error(errorDetail);
        }
-       toast({ title: "Sucesso!", description: `Projeto "${newProjectName}" criado (placeholder).` });
+       toast({ title: "Sucesso!", description: `Projeto "${newProjectName}" criado.` });
        setNewProjectName('');
        fetchProjects();
      } catch (error: any) {
@@ -174,7 +210,7 @@ const HomePage: React.FC = () => {
       <Card className="bg-gradient-to-r from-blue-50 to-indigo-50 dark:from-blue-950 dark:to-indigo-950">
         <CardHeader> <CardTitle className="flex items-center gap-2"><BrainCircuit className="w-6 h-6 text-blue-600"/> Módulo 1: Nicho e Persona</CardTitle> <CardDescription>Comece a definir a base do seu negócio digital.</CardDescription> </CardHeader>
         <CardContent>
-          {runningNicheTaskId ? (<div className="flex items-center gap-2 text-amber-600"><Loader2 className="h-5 w-5 animate-spin" /><span>Análise de nicho em andamento (Tarefa: {runningNicheTaskId.substring(0, 8)}...). Aguarde.</span></div>) : (
+          {runningNicheTaskId ? (<div className="flex items-center gap-2 text-amber-600"><Loader2 className="h-5 w-5 animate-spin" /><div><span>Análise de nicho em andamento (Tarefa: {runningNicheTaskId.substring(0, 8)}...){nicheStep === 'research' ? ' — pesquisando nichos' : nicheStep === 'validation' ? ' — validando nichos' : ''}. Aguarde.</span>{nicheStreamText && <pre className="mt-2 max-h-32 overflow-hidden whitespace-pre-wrap text-xs text-muted-foreground">{nicheStreamText}</pre>}</div></div>) : (
              <Dialog open={isNicheModalOpen} onOpenChange={setIsNicheModalOpen}>
                <DialogTrigger asChild><Button disabled={projects.length === 0 || loadingProjects}> Iniciar Análise de Nicho {projects.length === 0 && !loadingProjects && <span className="text-xs ml-2">(Crie um projeto primeiro)</span>}</Button></DialogTrigger>
                <DialogContent className="sm:max-w-[525px]">